@@ -17,6 +17,7 @@ django.setup()
 
 # Import Django models after setting up Django
 from bus_route.models import Trip
+from django.core.management import call_command
 
 # BigQuery Constants
 GCP_PROJECT_ID = "enhanced-cable-447317-h8"
@@ -91,5 +92,20 @@ with DAG(
         op_args=[SQL_QUERY]
     )
 
+    # Project next week's revenue and EPKM for every route from the refreshed trips
+    forecast_routes = PythonOperator(
+        task_id="forecast_routes",
+        python_callable=call_command,
+        op_args=["forecast_routes"]
+    )
+
+    # Share yesterday's ticket revenue out over every trip's fare-stage segments
+    allocate_fare_stages = PythonOperator(
+        task_id="allocate_fare_stage_revenue",
+        python_callable=call_command,
+        op_args=["allocate_fare_stage_revenue"]
+    )
+
     # Define dependencies
-    run_query >> save_sqlite
+    run_query >> save_sqlite >> forecast_routes
+    save_sqlite >> allocate_fare_stages
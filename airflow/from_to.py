@@ -1,15 +1,18 @@
 from airflow import DAG
 from airflow.providers.google.cloud.operators.bigquery import BigQueryInsertJobOperator
 from airflow.operators.python import PythonOperator
+from airflow.operators.bash import BashOperator
 from google.cloud import bigquery
 import pandas as pd
 from datetime import datetime 
 # Define constants
+PROJECT_DIR = "/home/jeev/project/project_backend/ksrtc3"  # Django project that serves the OD matrix
 GCP_PROJECT_ID = "enhanced-cable-447317-h8"
 BQ_DATASET = "ksrtc_dataset"
 BQ_TABLE = "ksrtc_vis_view"
 CSV_FROM_PATH = "/home/jeev/project/project_backend/ksrtc3/passenger_distribution/data/caches/from_airflow.csv"
 CSV_TO_PATH = "/home/jeev/project/project_backend/ksrtc3/passenger_distribution/data/caches/to_airflow.csv"
+CSV_OD_PATH = "/home/jeev/project/project_backend/ksrtc3/passenger_distribution/data/caches/od_airflow.csv"
 
 # BigQuery SQL Queries
 SQL_FROM_QUERY = f"""SELECT 
@@ -30,6 +33,16 @@ GROUP BY DATE_HOUR, TO_STOP_NAME
 ORDER BY DATE_HOUR;
 """
 
+SQL_OD_QUERY = f"""SELECT 
+    CONCAT(TICKET_ISSUE_DATE, ' ', FORMAT_TIMESTAMP('%H', TIMESTAMP(CONCAT(TICKET_ISSUE_DATE, ' ', TICKET_ISSUE_TIME)))) AS DATE_HOUR,
+    FROM_STOP_NAME,
+    TO_STOP_NAME,
+    SUM(TOTAL_PASSENGER) AS TOTAL_PASSENGER
+FROM `enhanced-cable-447317-h8.ksrtc_dataset.ksrtc_tablef`
+GROUP BY DATE_HOUR, FROM_STOP_NAME, TO_STOP_NAME
+ORDER BY DATE_HOUR;
+"""
+
 def save_bigquery_data_to_csv(query, file_path):
     """Fetch data from BigQuery and save as CSV."""
     client = bigquery.Client()
@@ -81,6 +94,25 @@ with DAG(
         op_args=[SQL_TO_QUERY, CSV_TO_PATH]
     )
 
+    run_od_query = BigQueryInsertJobOperator(
+        task_id="run_od_query",
+        configuration={"query": {"query": SQL_OD_QUERY, "useLegacySql": False}},
+        gcp_conn_id="google_cloud_default"
+    )
+
+    save_od_csv = PythonOperator(
+        task_id="save_od_csv",
+        python_callable=save_bigquery_data_to_csv,
+        op_args=[SQL_OD_QUERY, CSV_OD_PATH]
+    )
+
+    # Step 3: Rebuild the OD matrix store the passenger distribution views read
+    build_od_matrix = BashOperator(
+        task_id="build_od_matrix",
+        bash_command=f"cd {PROJECT_DIR} && python manage.py build_od_matrix --csv {CSV_OD_PATH}",
+    )
+
     # Define dependencies
     run_from_query >> save_from_csv
     run_to_query >> save_to_csv
+    run_od_query >> save_od_csv >> build_od_matrix
@@ -1,6 +1,7 @@
 from airflow import DAG
 from airflow.providers.google.cloud.operators.bigquery import BigQueryInsertJobOperator
 from airflow.operators.python import PythonOperator
+from airflow.operators.bash import BashOperator
 from google.cloud import bigquery
 import pandas as pd
 from datetime import datetime
@@ -10,6 +11,7 @@ GCP_PROJECT_ID = "enhanced-cable-447317-h8"
 BQ_DATASET = "ksrtc_dataset"
 BQ_TABLE = "ksrtc_vis_view"
 CSV_FILE_PATH = "/home/jeev/project/project_backend/ksrtc4/pred/data/airflow.csv"  # Change to your preferred local path
+PROJECT_DIR = "/home/jeev/project/project_backend/ksrtc4"  # Django project that serves the forecasts
 
 # BigQuery SQL Query
 SQL_QUERY = f"""SELECT 
@@ -65,4 +67,16 @@ with DAG(
         python_callable=save_bigquery_data_to_csv
     )
 
-    run_query >> save_csv  # Task dependencies
+    # Step 3: Rebuild the per-stop series store read by the forecast view
+    build_series = BashOperator(
+        task_id="build_stop_series",
+        bash_command=f"cd {PROJECT_DIR} && python manage.py build_stop_series --csv {CSV_FILE_PATH}",
+    )
+
+    # Step 4: Forecast the next day for every stop from the fresh series
+    precompute_forecasts = BashOperator(
+        task_id="precompute_forecasts",
+        bash_command=f"cd {PROJECT_DIR} && python manage.py precompute_forecasts",
+    )
+
+    run_query >> save_csv >> build_series >> precompute_forecasts  # Task dependencies
@@ -3,6 +3,7 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q, Sum
 from bus_route.models import Route, Schedule, Trip
+from bus_route.route_index import get_route_stops
 from passenger_distribution.models import KsrtcFromData, KsrtcToData
 from .models import BusOverlapData, RouteAnalysis
 from datetime import datetime, time, date
@@ -12,33 +13,31 @@ import random
 def estimate_passenger_count(route_no, selected_date, start_time, end_time):
     """Estimate passenger count for a bus trip based on historical data"""
     try:
-        # Format date and time for passenger data lookup
-        date_str = selected_date.strftime('%Y-%m-%d')
         hour_start = start_time.hour
         hour_end = end_time.hour
         
-        # Get route stops for the given route
-        route_stops = Route.objects.filter(route_no=route_no).values_list('stop_name', flat=True)
+        # Canonical stop ids of the route (manage.py build_stop_registry), so every
+        # spelling of a stop in the extracts counts; names only for unresolved stops
+        stops = get_route_stops(route_no)
+        stop_ids = stops.resolved_stop_ids() if stops is not None else []
+        stop_names = stops.unresolved_stop_names() if stops is not None else []
         
-        total_passengers = 0
+        # Get passenger data from/to stops on this route within the time range;
+        # both lookups are served by the (stop, date, hour) indexes
+        from_passengers = KsrtcFromData.objects.filter(
+            Q(from_stop_id__in=stop_ids) | Q(from_stop_name__in=stop_names),
+            date=selected_date,
+            hour__range=(hour_start, hour_end),
+        ).aggregate(total=Sum('total_passenger'))['total'] or 0
         
-        # Look for passenger data within the time range
-        for hour in range(hour_start, hour_end + 1):
-            date_hour = f"{date_str} {hour:02d}:00:00"
-            
-            # Get passenger data from/to stops on this route
-            from_passengers = KsrtcFromData.objects.filter(
-                date_hour__startswith=date_str,
-                from_stop_name__in=route_stops
-            ).aggregate(total=Sum('total_passenger'))['total'] or 0
-            
-            to_passengers = KsrtcToData.objects.filter(
-                date_hour__startswith=date_str,
-                to_stop_name__in=route_stops
-            ).aggregate(total=Sum('total_passenger'))['total'] or 0
-            
-            # Average the from and to passengers to avoid double counting
-            total_passengers += (from_passengers + to_passengers) // 2
+        to_passengers = KsrtcToData.objects.filter(
+            Q(to_stop_id__in=stop_ids) | Q(to_stop_name__in=stop_names),
+            date=selected_date,
+            hour__range=(hour_start, hour_end),
+        ).aggregate(total=Sum('total_passenger'))['total'] or 0
+        
+        # Average the from and to passengers to avoid double counting
+        total_passengers = (from_passengers + to_passengers) // 2
         
         # If no historical data, estimate based on time of day and service type
         if total_passengers == 0:
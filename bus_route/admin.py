@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Route, Schedule, Trip
+from .models import Route, Schedule, Trip, RouteGeometry, Stop, StopAlias, FareStageRevenue
 
 # Custom admin for Route model
 class RouteAdmin(admin.ModelAdmin):
@@ -44,7 +44,32 @@ class TripAdmin(admin.ModelAdmin):
         return "N/A"
     epkm.admin_order_field = 'epkm'  # Enable sorting by the epkm field
 
+# Stored road geometry (manage.py build_route_geometry); deleting a row makes the route rebuild on the next run
+class RouteGeometryAdmin(admin.ModelAdmin):
+    list_display = ('route_no', 'stops_fingerprint', 'updated_at')
+    search_fields = ('route_no',)
+    readonly_fields = ('updated_at',)
+
+# Canonical stops (manage.py build_stop_registry) with every spelling that resolves to them
+class StopAliasInline(admin.TabularInline):
+    model = StopAlias
+    extra = 0
+
+class StopAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'key', 'latitude', 'longitude', 'updated_at')
+    search_fields = ('name', 'key', 'aliases__alias')
+    inlines = [StopAliasInline]
+
+# Per-trip fare-stage allocation (manage.py allocate_fare_stage_revenue), rebuilt per day
+class FareStageRevenueAdmin(admin.ModelAdmin):
+    list_display = ('date', 'schedule_no', 'trip_no', 'route_no', 'stage', 'from_stop_name', 'to_stop_name', 'passengers', 'revenue')
+    search_fields = ('schedule_no', 'route_no')
+    list_filter = ('date',)
+
 # Register the models with their respective admin classes
 admin.site.register(Route, RouteAdmin)
 admin.site.register(Schedule, ScheduleAdmin)
 admin.site.register(Trip, TripAdmin)
+admin.site.register(RouteGeometry, RouteGeometryAdmin)
+admin.site.register(Stop, StopAdmin)
+admin.site.register(FareStageRevenue, FareStageRevenueAdmin)
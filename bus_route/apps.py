@@ -4,3 +4,24 @@ from django.apps import AppConfig
 class BusRouteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bus_route'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .geometry import invalidate_route_geometry
+        from .route_index import invalidate_route_index
+        from .departures import invalidate_departures
+        from .models import Route, RouteGeometry, Schedule
+
+        # Stored road geometry is per route_no; drop it when the route's stops change
+        post_save.connect(invalidate_route_geometry, sender=Route, dispatch_uid='route_geometry_save')
+        post_delete.connect(invalidate_route_geometry, sender=Route, dispatch_uid='route_geometry_delete')
+
+        # The in-process route index holds stops and road lengths of every route
+        post_save.connect(invalidate_route_index, sender=Route, dispatch_uid='route_index_save')
+        post_delete.connect(invalidate_route_index, sender=Route, dispatch_uid='route_index_delete')
+        post_save.connect(invalidate_route_index, sender=RouteGeometry, dispatch_uid='route_index_geometry_save')
+        post_delete.connect(invalidate_route_index, sender=RouteGeometry, dispatch_uid='route_index_geometry_delete')
+
+        # The departure board is rebuilt when the timetable changes (imports save row by row)
+        post_save.connect(invalidate_departures, sender=Schedule, dispatch_uid='departures_save')
+        post_delete.connect(invalidate_departures, sender=Schedule, dispatch_uid='departures_delete')
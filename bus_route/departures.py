@@ -0,0 +1,212 @@
+"""
+Departure board: which trips leave a stop in a given time window.
+
+An inverted index from stop to every (trip, order_sequence, cumulative km)
+serving it, with an estimated departure time per entry. Times are
+Schedule.start_time plus an offset interpolated along the route's
+cumulative km (route_index.py):
+
+    offset = duration * km_at_stop / route_km
+
+The duration is end_time - start_time when the timetable has an end time,
+otherwise trip_km (or the route length) at AVERAGE_SPEED_KMPH.
+
+Entries are flat NumPy arrays sorted by (stop, minute of day) with
+per-stop offsets, so a lookup is a dict hit plus two binary searches.
+Stops are keyed by canonical stop id (stop_registry.py) and by name for
+stops the registry has not resolved. The board is rebuilt lazily after
+the route index is rebuilt or any Schedule row changes (timetable
+import), using the same cache-version scheme as the route index.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import Schedule
+from .route_index import CHECK_INTERVAL, get_route_index
+
+VERSION_KEY = 'departures:version'
+AVERAGE_SPEED_KMPH = float(os.getenv('DEPARTURE_AVERAGE_SPEED_KMPH', '25'))
+TIMETABLE_TIME_ZONE = ZoneInfo('Asia/Kolkata')  # Schedule times are local
+MINUTES_PER_DAY = 24 * 60
+
+
+def stop_slot_key(stop_id, name):
+    return f"id:{stop_id}" if stop_id >= 0 else f"name:{name.strip().upper()}"
+
+
+def minutes_of(value):
+    return value.hour * 60 + value.minute + value.second / 60
+
+
+class ScheduledTrips:
+    """
+    Schedule rows whose route is in the route index, with the estimated time
+    at each of their stops.
+
+    Per trip: schedule_nos, trip_nos, service_types, destinations, routes
+    (position in the route index). Per (trip, stop) entry, in trip and stop
+    order: trips, stops (position in the route index arrays), minutes after
+    midnight (not wrapped, so trips running past midnight keep increasing)
+    and slots (stop key, see stop_slot_key, as an index into slot_names).
+    """
+
+    def __init__(self, route_index):
+        rows = [
+            row for row in Schedule.objects.filter(start_time__isnull=False).values_list(
+                'schedule_no', 'trip_no', 'route_no', 'service_type', 'destination', 'start_time', 'end_time', 'trip_km'
+            )
+            if route_index.route_position.get(row[2].upper()) is not None
+        ]
+        self.schedule_nos = np.array([row[0] for row in rows], dtype=str)
+        self.trip_nos = np.array([row[1] for row in rows], dtype=np.int32)
+        self.service_types = np.array([row[3] for row in rows], dtype=str)
+        self.destinations = np.array([row[4] for row in rows], dtype=str)
+        self.routes = np.array([route_index.route_position[row[2].upper()] for row in rows], dtype=np.int64)
+
+        # Flat (trip, stop) entries without a per-trip loop
+        starts = route_index.offsets[self.routes]
+        counts = route_index.offsets[self.routes + 1] - starts
+        self.trips = np.repeat(np.arange(len(rows)), counts)
+        self.stops = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        self.last_stop = np.zeros(len(self.stops), dtype=bool)
+        self.last_stop[np.cumsum(counts)[counts > 0] - 1] = True
+
+        route_km = route_index.cumulative_km[route_index.offsets[self.routes + 1] - 1] if len(rows) else np.zeros(0)
+        start_minutes = np.array([minutes_of(row[5]) for row in rows], dtype=np.float64)
+        end_minutes = np.array([minutes_of(row[6]) if row[6] else np.nan for row in rows], dtype=np.float64)
+        trip_km = np.array([row[7] if row[7] else np.nan for row in rows], dtype=np.float64)
+        duration = (end_minutes - start_minutes) % MINUTES_PER_DAY
+        fallback = np.where(np.isnan(trip_km), route_km, trip_km) / AVERAGE_SPEED_KMPH * 60
+        duration = np.where(np.isnan(duration) | (duration == 0), fallback, duration)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(route_km[self.trips] > 0, route_index.cumulative_km[self.stops] / route_km[self.trips], 0.0)
+        self.minutes = start_minutes[self.trips] + duration[self.trips] * fraction
+
+        slot_keys = np.array(
+            [stop_slot_key(stop_id, name) for stop_id, name in zip(
+                route_index.stop_ids[self.stops].tolist(), route_index.names[self.stops].tolist()
+            )],
+            dtype=str,
+        )
+        self.slot_names, slots = np.unique(slot_keys, return_inverse=True)
+        self.slots = slots.ravel()
+        self.slot_position = {key: i for i, key in enumerate(self.slot_names.tolist())}
+
+    def find_slots(self, stop_id, stop_name):
+        """Slots of a stop given its canonical id (or None) and the name asked for"""
+        return {self.slot_position.get(f"id:{stop_id}") if stop_id is not None else None,
+                self.slot_position.get(stop_slot_key(-1, stop_name or ''))} - {None}
+
+
+class DepartureBoard:
+    def __init__(self, route_index, scheduled=None):
+        self.route_index = route_index
+        self.scheduled = scheduled or ScheduledTrips(route_index)
+        self.slot_position = self.scheduled.slot_position
+
+        # Every stop of a trip but its last is a departure
+        departing = ~self.scheduled.last_stop
+        minutes = np.rint(self.scheduled.minutes[departing]).astype(np.int64) % MINUTES_PER_DAY
+        slots = self.scheduled.slots[departing]
+        order = np.lexsort((minutes, slots))
+        self.minutes = minutes[order]
+        self.trips = self.scheduled.trips[departing][order]
+        self.stops = self.scheduled.stops[departing][order]
+        self.slot_offsets = np.searchsorted(slots[order], np.arange(len(self.scheduled.slot_names) + 1))
+
+    def _window(self, slot, after, window):
+        """Entry positions of one stop slot departing in [after, after + window), across midnight"""
+        start, end = self.slot_offsets[slot], self.slot_offsets[slot + 1]
+        minutes = self.minutes[start:end]
+        ranges = [(after, min(after + window, MINUTES_PER_DAY))]
+        if after + window > MINUTES_PER_DAY:
+            ranges.append((0, after + window - MINUTES_PER_DAY))
+        positions = [
+            np.arange(np.searchsorted(minutes, low, 'left'), np.searchsorted(minutes, high, 'left')) + start
+            for low, high in ranges
+        ]
+        return np.concatenate(positions)
+
+    def departures(self, stop_id, stop_name, after, window=60, limit=50):
+        """
+        Trips leaving the stop within `window` minutes from `after` (minute of
+        day), soonest first. The stop is matched by canonical id and by name;
+        returns None when no trip serves it at all.
+        """
+        slots = self.scheduled.find_slots(stop_id, stop_name)
+        if not slots:
+            return None
+        positions = np.concatenate([self._window(slot, after, window) for slot in slots])
+        waits = (self.minutes[positions] - after) % MINUTES_PER_DAY
+        positions = positions[np.argsort(waits, kind='stable')][:limit]
+
+        index = self.route_index
+        scheduled = self.scheduled
+        result = []
+        for position in positions.tolist():
+            trip, stop = self.trips[position], self.stops[position]
+            minute = int(self.minutes[position])
+            result.append({
+                'departure': f"{minute // 60:02d}:{minute % 60:02d}",
+                'minutes_from_now': int((minute - after) % MINUTES_PER_DAY),
+                'schedule_no': str(scheduled.schedule_nos[trip]),
+                'trip_no': int(scheduled.trip_nos[trip]),
+                'route_no': str(index.route_numbers[scheduled.routes[trip]]),
+                'service_type': str(scheduled.service_types[trip]),
+                'destination': str(scheduled.destinations[trip]),
+                'stop_name': str(index.names[stop]),
+                'order_sequence': int(index.sequences[stop]),
+                'distance_km': round(float(index.cumulative_km[stop]), 3),
+            })
+        return result
+
+
+_board = None
+_board_version = None
+_checked_at = 0.0
+_board_lock = threading.Lock()
+
+
+def get_departure_board():
+    """Process-wide board, rebuilt after the route index or the timetable changed"""
+    global _board, _board_version, _checked_at
+    index = get_route_index()
+    now = time.monotonic()
+    board = _board
+    if board is not None and board.route_index is index and now - _checked_at < CHECK_INTERVAL:
+        return board
+    try:
+        version = cache.get(VERSION_KEY, 0)
+    except Exception as e:
+        print(f"DEBUG: Could not read the departure board version from the cache: {e}")
+        version = _board_version
+    with _board_lock:
+        if _board is None or _board.route_index is not index or version != _board_version:
+            _board = DepartureBoard(index)
+            _board_version = version
+        _checked_at = now
+        return _board
+
+
+def invalidate_departures(sender=None, **kwargs):
+    """post_save/post_delete receiver for Schedule"""
+    global _board
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    except Exception as e:
+        print(f"DEBUG: Could not bump the departure board version in the cache: {e}")
+    with _board_lock:
+        _board = None
+
+
+def current_minute():
+    now = datetime.now(TIMETABLE_TIME_ZONE)
+    return now.hour * 60 + now.minute
@@ -0,0 +1,176 @@
+"""
+Fare-stage revenue allocation for every trip of a day in one pass.
+
+A route's fare-stage segments run between consecutive fare stages (its
+first and last stop always bound a segment). A ticket from stop a to stop
+b on a trip's route counts as on board in every segment it overlaps. Its
+revenue is shared out by the km it travels in each one, and it is a
+boarding in the segment containing a.
+
+Ticket rows (one per schedule, trip, from stop, to stop, as the BigQuery
+ticket table groups them) are placed on the route with a searchsorted
+over (route, stop, position) codes. A stop matches by canonical stop id
+or by name, whichever comes first on the route, since the registry may
+put a spelling in another cluster than the route's row. The
+destination is the first occurrence after the boarding stop, which
+handles loop routes. Every (ticket, segment) pair is then expanded with
+np.repeat and summed per (trip, segment) with np.bincount.
+"""
+import numpy as np
+import pandas as pd
+
+from .models import Schedule
+from .stop_registry import resolve_stop_ids
+
+TICKET_COLUMNS = ['SCHEDULE_NUMBER', 'TRIP_NUMBER', 'FROM_STOP_NAME', 'TO_STOP_NAME', 'PASSENGERS', 'REVENUE']
+
+
+class FareStageSegments:
+    """Fare-stage segments of every route in the route index, as global position arrays"""
+
+    def __init__(self, route_index):
+        self.route_index = route_index
+        offsets = route_index.offsets
+        counts = np.diff(offsets)
+        self.route_of = np.repeat(np.arange(len(counts)), counts)
+
+        boundary = route_index.fare_stages.astype(bool).copy()
+        boundary[offsets[:-1][counts > 0]] = True
+        last_stops = offsets[1:][counts > 0] - 1
+        boundary[last_stops] = True
+        boundaries = np.flatnonzero(boundary)
+
+        # Every boundary but the last stop of its route starts a segment ending at the next boundary
+        starts_segment = ~np.isin(boundaries, last_stops)
+        self.starts = boundaries[starts_segment]
+        self.ends = boundaries[np.flatnonzero(starts_segment) + 1]
+        routes = self.route_of[self.starts]
+        self.route_segment_offsets = np.searchsorted(routes, np.arange(len(counts) + 1))
+
+        # (route, stop, position) codes for placing ticket stops on routes, by canonical id and by name
+        stop_ids = route_index.stop_ids
+        names = np.char.upper(np.char.strip(route_index.names.astype(str)))
+        self.id_slots = {stop_id: i for i, stop_id in enumerate(np.unique(stop_ids[stop_ids >= 0]).tolist())}
+        self.name_slots = {name: i for i, name in enumerate(np.unique(names).tolist())}
+        self.size = len(names)
+        self.slot_count = max(len(self.id_slots), len(self.name_slots))
+        resolved = np.flatnonzero(stop_ids >= 0)
+        self.id_codes = np.sort(self.code(
+            self.route_of[resolved], np.array([self.id_slots[i] for i in stop_ids[resolved].tolist()], dtype=np.int64), resolved
+        ))
+        self.name_codes = np.sort(self.code(
+            self.route_of, np.array([self.name_slots[name] for name in names.tolist()], dtype=np.int64), np.arange(self.size)
+        ))
+
+    def code(self, routes, slots, positions):
+        return (routes.astype(np.int64) * self.slot_count + slots) * self.size + positions
+
+    def segment_of(self, positions):
+        return np.searchsorted(self.starts, positions, 'right') - 1
+
+    def stage_of(self, segments):
+        """Segment order within its route"""
+        return segments - self.route_segment_offsets[self.route_of[self.starts[segments]]]
+
+    def place(self, routes, slots, after, codes):
+        """
+        Global position of the first occurrence of each stop slot on each
+        route at or after global position `after`, -1 where the route has no
+        such stop. `codes` is id_codes or name_codes, matching the slots.
+        """
+        found = np.full(len(routes), -1, dtype=np.int64)
+        known = np.flatnonzero(slots >= 0)
+        if not len(known) or not len(codes):
+            return found
+        query = self.code(routes[known], slots[known], after[known])
+        i = np.minimum(np.searchsorted(codes, query, 'left'), len(codes) - 1)
+        hit = codes[i] // self.size == query // self.size
+        found[known[hit]] = codes[i][hit] % self.size
+        return found
+
+    def locate(self, routes, names, after):
+        """First position of each named stop on its route at or after `after`, matched by canonical id or by name"""
+        names = [str(name) for name in names]
+        distinct = sorted(set(names))
+        ids = dict(zip(distinct, resolve_stop_ids(distinct)))
+        by_id = {name: self.id_slots.get(ids[name], -1) for name in distinct}
+        by_name = {name: self.name_slots.get(name.strip().upper(), -1) for name in distinct}
+        id_slots = np.array([by_id[name] for name in names], dtype=np.int64)
+        name_slots = np.array([by_name[name] for name in names], dtype=np.int64)
+
+        by_id = self.place(routes, np.where(routes >= 0, id_slots, -1), after, self.id_codes)
+        by_name = self.place(routes, np.where(routes >= 0, name_slots, -1), after, self.name_codes)
+        # Earliest of the two: repeated names on a route may carry different ids
+        return np.where((by_id >= 0) & (by_name >= 0), np.minimum(by_id, by_name), np.maximum(by_id, by_name))
+
+
+def allocate_fare_stages(tickets, segments):
+    """
+    Passengers and revenue per (trip, fare-stage segment) from ticket rows
+    (TICKET_COLUMNS). Returns (allocation DataFrame, number of ticket
+    rows that could not be placed on their trip's route).
+    """
+    index = segments.route_index
+    tickets = tickets.assign(
+        SCHEDULE_NUMBER=tickets['SCHEDULE_NUMBER'].astype(str).str.strip().str.upper(),
+        TRIP_NUMBER=pd.to_numeric(tickets['TRIP_NUMBER'], errors='coerce'),
+        PASSENGERS=pd.to_numeric(tickets['PASSENGERS'], errors='coerce').fillna(0),
+        REVENUE=pd.to_numeric(tickets['REVENUE'], errors='coerce').fillna(0.0),
+    ).dropna(subset=['TRIP_NUMBER'])
+
+    # Trips of the day, each with its route's position in the index
+    trip_codes, trips = pd.factorize(pd.MultiIndex.from_arrays([tickets['SCHEDULE_NUMBER'], tickets['TRIP_NUMBER'].astype(int)]))
+    route_nos = dict(
+        ((schedule_no, trip_no), route_no)
+        for schedule_no, trip_no, route_no in Schedule.objects.values_list('schedule_no', 'trip_no', 'route_no')
+    )
+    trip_routes = np.array(
+        [index.route_position.get(route_nos.get(trip, '').upper(), -1) for trip in trips.tolist()], dtype=np.int64
+    )
+    routes = trip_routes[trip_codes]
+
+    # Boarding stop: first occurrence on the route; alighting stop: first occurrence after it
+    route_start = index.offsets[np.maximum(routes, 0)]
+    from_positions = segments.locate(routes, tickets['FROM_STOP_NAME'], route_start)
+    to_positions = segments.locate(np.where(from_positions >= 0, routes, -1), tickets['TO_STOP_NAME'], from_positions + 1)
+
+    placed = np.flatnonzero((from_positions >= 0) & (to_positions > from_positions))
+    unplaced = len(tickets) - len(placed)
+    from_positions, to_positions = from_positions[placed], to_positions[placed]
+    passengers = tickets['PASSENGERS'].to_numpy(dtype=np.float64)[placed]
+    revenue = tickets['REVENUE'].to_numpy(dtype=np.float64)[placed]
+    ticket_trips = trip_codes[placed]
+
+    # One row per (ticket, segment it overlaps)
+    first = segments.segment_of(from_positions)
+    last = segments.segment_of(to_positions - 1)
+    counts = last - first + 1
+    rows = np.repeat(np.arange(len(placed)), counts)
+    segment = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    km = index.cumulative_km
+    from_km, to_km = km[from_positions][rows], km[to_positions][rows]
+    overlap = np.minimum(km[segments.ends[segment]], to_km) - np.maximum(km[segments.starts[segment]], from_km)
+    ticket_km = to_km - from_km
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(ticket_km > 0, overlap / ticket_km, 1.0 / counts[rows])
+
+    # Sum per (trip, segment)
+    keys, group = np.unique(ticket_trips[rows] * len(segments.starts) + segment, return_inverse=True)
+    group = group.ravel()
+    trip_of, segment_of = np.divmod(keys, len(segments.starts))
+    boarding = segment == np.repeat(first, counts)
+    starts, ends = segments.starts[segment_of], segments.ends[segment_of]
+    allocation = pd.DataFrame({
+        'schedule_no': trips.get_level_values(0)[trip_of],
+        'trip_no': trips.get_level_values(1)[trip_of],
+        'route_no': index.route_numbers[segments.route_of[starts]],
+        'stage': segments.stage_of(segment_of),
+        'from_stop_name': index.names[starts],
+        'to_stop_name': index.names[ends],
+        'distance_km': np.round(km[ends] - km[starts], 3),
+        'passengers': np.rint(np.bincount(group, weights=passengers[rows], minlength=len(keys))).astype(int),
+        'boardings': np.rint(np.bincount(group, weights=np.where(boarding, passengers[rows], 0), minlength=len(keys))).astype(int),
+        'revenue': np.round(np.bincount(group, weights=revenue[rows] * share, minlength=len(keys)), 2),
+    })
+    return allocation, unplaced
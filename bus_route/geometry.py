@@ -0,0 +1,291 @@
+"""
+Persistent road geometry for routes.
+
+Maps used to ask Google Directions for the road path on every page view:
+`create_map` once per 20-stop chunk, and the enhanced map once per stop
+pair in the browser. Road geometry is now fetched once by
+manage.py build_route_geometry and stored:
+
+    RoadSegment    path and length between two stop coordinates, shared
+                   by every route that uses the pair
+    RouteGeometry  the whole route as one encoded polyline, with the index
+                   of each stop in it and per-segment lengths
+
+Views only read these tables; pairs without stored geometry are drawn as
+straight lines. A route's geometry is dropped when its Route rows change,
+and it is also ignored when the stop sequence no longer matches its
+fingerprint (bulk updates do not send signals).
+
+Directions come from a provider: 'google' (the Directions API) or 'stub'
+(straight lines with great-circle lengths, no network; for tests and
+offline builds). Set ROUTE_DIRECTIONS_PROVIDER to pick the default.
+"""
+import hashlib
+import math
+import os
+
+import polyline
+
+from .models import RoadSegment, RouteGeometry
+
+DEFAULT_PROVIDER = os.getenv('ROUTE_DIRECTIONS_PROVIDER', 'google')
+MAX_WAYPOINTS = 23  # Google allows 25 waypoints per request; keep a margin
+
+
+def point_key(latitude, longitude):
+    return f"{latitude:.5f},{longitude:.5f}"
+
+
+def haversine_m(a, b):
+    """Great-circle distance in metres between two (lat, lon) points"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+def stops_fingerprint(bus_stops):
+    sequence = '|'.join(f"{stop['name']}@{point_key(stop['latitude'], stop['longitude'])}" for stop in bus_stops)
+    return hashlib.sha1(sequence.encode()).hexdigest()
+
+
+def route_stops(route_no, route_index=None):
+    """Ordered stops of a route in the dict shape the map builders take"""
+    from .route_index import get_route_index
+
+    stops = (route_index or get_route_index()).get(route_no)
+    return stops.stop_dicts() if stops is not None else []
+
+
+class StubDirectionsProvider:
+    """Straight lines with great-circle lengths; no network access"""
+    name = 'stub'
+
+    def legs(self, points):
+        return [([a, b], haversine_m(a, b)) for a, b in zip(points, points[1:])]
+
+
+class GoogleDirectionsProvider:
+    """Driving directions from the Google Directions API, one leg per consecutive stop pair"""
+    name = 'google'
+
+    def __init__(self, api_key=None):
+        import googlemaps
+
+        self.client = googlemaps.Client(key=api_key or os.getenv('GMAP_API_KEY'))
+
+    def legs(self, points):
+        result = []
+        # Origin + up to MAX_WAYPOINTS + destination per request, chained on the shared endpoint
+        for start in range(0, len(points) - 1, MAX_WAYPOINTS + 1):
+            chunk = points[start:start + MAX_WAYPOINTS + 2]
+            routes = self.client.directions(
+                origin=chunk[0],
+                destination=chunk[-1],
+                waypoints=chunk[1:-1],
+                mode="driving",
+            )
+            if not routes or len(routes[0]['legs']) != len(chunk) - 1:
+                raise ValueError(f"No driving route through {len(chunk)} stops starting at {chunk[0]}")
+            for leg in routes[0]['legs']:
+                path = []
+                for step in leg['steps']:
+                    step_points = polyline.decode(step['polyline']['points'])
+                    path.extend(step_points[1:] if path else step_points)
+                result.append((path, float(leg['distance']['value'])))
+        return result
+
+
+PROVIDERS = {
+    'google': GoogleDirectionsProvider,
+    'stub': StubDirectionsProvider,
+}
+
+
+def get_provider(name=None):
+    name = name or DEFAULT_PROVIDER
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown directions provider {name!r}; choose from {', '.join(PROVIDERS)}")
+
+
+def assemble_geometry(bus_stops, segments):
+    """
+    Join per-pair segments into one route geometry.
+
+    `segments` maps (from_point, to_point) -> (path points, length in metres);
+    pairs missing from it become straight lines. Returns a dict with the
+    encoded polyline, stop_points, segment_lengths and straight_segments.
+    """
+    points = [(bus_stops[0]['latitude'], bus_stops[0]['longitude'])] if bus_stops else []
+    stop_points = [0] if bus_stops else []
+    lengths = []
+    straight = []
+    for index, (a, b) in enumerate(zip(bus_stops, bus_stops[1:])):
+        start = (a['latitude'], a['longitude'])
+        end = (b['latitude'], b['longitude'])
+        segment = segments.get((point_key(*start), point_key(*end)))
+        if segment is None:
+            path, length = [start, end], haversine_m(start, end)
+            straight.append(index)
+        else:
+            path, length = segment
+        points.extend(path[1:])
+        stop_points.append(len(points) - 1)
+        lengths.append(round(length, 1))
+    return {
+        'polyline': polyline.encode(points, 5),
+        'stop_points': stop_points,
+        'segment_lengths': lengths,
+        'straight_segments': straight,
+    }
+
+
+def stored_segments(bus_stops):
+    """Stored RoadSegments for the consecutive pairs of `bus_stops`, in one query"""
+    pairs = {
+        (point_key(a['latitude'], a['longitude']), point_key(b['latitude'], b['longitude']))
+        for a, b in zip(bus_stops, bus_stops[1:])
+    }
+    if not pairs:
+        return {}
+    rows = RoadSegment.objects.filter(
+        from_point__in={pair[0] for pair in pairs},
+        to_point__in={pair[1] for pair in pairs},
+    ).values_list('from_point', 'to_point', 'polyline', 'length_m')
+    return {
+        (from_point, to_point): (polyline.decode(encoded), length_m)
+        for from_point, to_point, encoded, length_m in rows
+        if (from_point, to_point) in pairs
+    }
+
+
+def get_geometry(bus_stops, route_no=None):
+    """
+    Road geometry for an ordered stop list without calling any directions API.
+
+    Uses the stored RouteGeometry when `route_no` is given and its
+    fingerprint still matches the stops, otherwise assembles the route from
+    stored RoadSegments with straight-line fallback.
+    """
+    if route_no:
+        stored = RouteGeometry.objects.filter(
+            route_no=route_no.upper(),
+            stops_fingerprint=stops_fingerprint(bus_stops),
+        ).first()
+        if stored is not None:
+            return {
+                'polyline': stored.polyline,
+                'stop_points': stored.stop_points,
+                'segment_lengths': stored.segment_lengths,
+                'straight_segments': stored.straight_segments,
+            }
+    return assemble_geometry(bus_stops, stored_segments(bus_stops))
+
+
+def build_route_geometry(route_no, provider, refresh=False, route_index=None):
+    """
+    Fetch missing road segments of a route from `provider` and store its geometry.
+
+    Consecutive pairs without a stored segment are requested together, so a
+    route costs one Directions request per run of up to MAX_WAYPOINTS + 1
+    new pairs; pairs shared with routes built earlier cost nothing. Runs the
+    provider fails on are stored as straight lines in the route geometry
+    only, so they are retried on the next build. Returns (geometry,
+    requested pair count, failed pair count); geometry is None for a route
+    with fewer than two stops.
+
+    The geometry row is written with a queryset update (or bulk_create), so
+    no RouteGeometry signal invalidates the route index once per route; the
+    caller invalidates it once when done. Pass `route_index` to read every
+    route from the same snapshot.
+    """
+    bus_stops = route_stops(route_no, route_index)
+    if len(bus_stops) < 2:
+        return None, 0, 0
+
+    segments = {} if refresh else stored_segments(bus_stops)
+    keys = [
+        (point_key(a['latitude'], a['longitude']), point_key(b['latitude'], b['longitude']))
+        for a, b in zip(bus_stops, bus_stops[1:])
+    ]
+
+    # Runs of consecutive pairs that still need directions
+    runs = []
+    for index, key in enumerate(keys):
+        if key in segments or key[0] == key[1]:
+            continue
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+
+    requested = failed = 0
+    for run in runs:
+        points = [(bus_stops[i]['latitude'], bus_stops[i]['longitude']) for i in run] + [
+            (bus_stops[run[-1] + 1]['latitude'], bus_stops[run[-1] + 1]['longitude'])
+        ]
+        requested += len(run)
+        try:
+            legs = provider.legs(points)
+        except Exception as e:
+            print(f"DEBUG: Directions failed for route {route_no} segments {run[0]}-{run[-1]}: {e}")
+            failed += len(run)
+            continue
+        for index, (path, length) in zip(run, legs):
+            segments[keys[index]] = (path, length)
+            RoadSegment.objects.update_or_create(
+                from_point=keys[index][0],
+                to_point=keys[index][1],
+                defaults={
+                    'polyline': polyline.encode(path, 5),
+                    'length_m': length,
+                    'provider': provider.name,
+                },
+            )
+
+    geometry = assemble_geometry(bus_stops, segments)
+    fields = dict(geometry, stops_fingerprint=stops_fingerprint(bus_stops))
+    if not RouteGeometry.objects.filter(route_no=route_no.upper()).update(**fields):
+        RouteGeometry.objects.bulk_create([RouteGeometry(route_no=route_no.upper(), **fields)])
+    return geometry, requested, failed
+
+
+def invalidate_route_geometry(sender, instance, **kwargs):
+    """post_save/post_delete receiver for Route: the stored geometry of that route is stale"""
+    RouteGeometry.objects.filter(route_no=instance.route_no.upper()).delete()
+
+
+def route_geojson(bus_stops, route_no=None):
+    """
+    Compact GeoJSON of a route for the client map (bus_route/geojson_map.html).
+
+    One LineString with the road path; its properties carry the index of
+    each stop in the path, segment lengths and which segments are straight
+    fallbacks. Stops follow as Points. Coordinates are [lon, lat] rounded to
+    5 decimals (about 1 m).
+    """
+    geometry = get_geometry(bus_stops, route_no)
+    path = [[round(lon, 5), round(lat, 5)] for lat, lon in polyline.decode(geometry['polyline'])]
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': path},
+        'properties': {
+            'route_no': route_no,
+            'stop_points': geometry['stop_points'],
+            'segment_lengths': geometry['segment_lengths'],
+            'straight_segments': geometry['straight_segments'],
+        },
+    }]
+    for index, stop in enumerate(bus_stops, start=1):
+        properties = {'name': stop['name'], 'sequence': index}
+        if stop.get('is_fare_stage'):
+            properties['fare_stage'] = True
+        if 'distance_km' in stop:
+            properties['distance_km'] = stop['distance_km']
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(stop['longitude'], 5), round(stop['latitude'], 5)]},
+            'properties': properties,
+        })
+    return {'type': 'FeatureCollection', 'features': features}
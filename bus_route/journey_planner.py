@@ -0,0 +1,160 @@
+"""
+Earliest-arrival journey planning with the Connection Scan Algorithm.
+
+Every scheduled trip (departures.ScheduledTrips) is cut into connections,
+one per pair of consecutive stops, with the interpolated departure and
+arrival times. The connections are sorted by departure time once. A query
+scans them from the requested time, marking trips as boarded and keeping
+the earliest arrival per stop, and stops as soon as departures are later
+than the best arrival at the destination.
+
+Transfers happen where two trips share a stop: the canonical stop id when
+the registry resolved it, otherwise the same name. A change of trip needs
+TRANSFER_MINUTES; staying on the same trip does not. Between journeys
+arriving at the same time the one with fewer transfers wins.
+
+The planner is derived from the departure board and rebuilt with it, that
+is after the route index is rebuilt or the timetable changes.
+"""
+import os
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+from .departures import get_departure_board
+
+TRANSFER_MINUTES = float(os.getenv('JOURNEY_TRANSFER_MINUTES', '3'))
+
+
+def format_minutes(minutes):
+    minutes = int(round(minutes))
+    day, minute = divmod(minutes, 24 * 60)
+    label = f"{minute // 60:02d}:{minute % 60:02d}"
+    return label + (f" (+{day}d)" if day else '')
+
+
+class JourneyPlanner:
+    def __init__(self, scheduled, route_index):
+        self.scheduled = scheduled
+        self.route_index = route_index
+
+        # Connection i runs from entry i to entry i + 1 of the same trip
+        entries = np.flatnonzero(~scheduled.last_stop)
+        departures = scheduled.minutes[entries]
+        arrivals = scheduled.minutes[entries + 1]
+        order = np.lexsort((arrivals, departures))
+        entries = entries[order]
+
+        # Plain lists: the scan is a Python loop and list indexing beats NumPy scalars there
+        self.entries = entries.tolist()
+        self.departures = departures[order].tolist()
+        self.arrivals = arrivals[order].tolist()
+        self.from_slots = scheduled.slots[entries].tolist()
+        self.to_slots = scheduled.slots[entries + 1].tolist()
+        self.trips = scheduled.trips[entries].tolist()
+
+    def earliest_arrival(self, origins, destinations, after):
+        """
+        Connection scan from the `origins` slots at minute `after` to any of
+        the `destinations` slots. Returns (arrival minute, legs) where legs
+        are (boarding connection, alighting connection) pairs in order, or
+        None when no journey arrives.
+        """
+        destinations = set(destinations)
+        # Earliest (time, trips taken) at which another trip can be boarded at each stop
+        ready = [(float('inf'), 0)] * len(self.scheduled.slot_names)
+        for slot in origins:
+            ready[slot] = (after, 0)
+        reached_by = {}  # slot -> (boarding connection, alighting connection) of its best arrival
+        boarded = {}  # trip -> (connection where it was boarded, trips taken including this one)
+        best, best_leg = (float('inf'), 0), None
+
+        departures, arrivals = self.departures, self.arrivals
+        from_slots, to_slots, trips = self.from_slots, self.to_slots, self.trips
+        for c in range(bisect_left(departures, after), len(departures)):
+            departure = departures[c]
+            if departure >= best[0]:
+                break
+            trip = trips[c]
+            if trip not in boarded:
+                ready_at, taken = ready[from_slots[c]]
+                if ready_at > departure:
+                    continue
+                boarded[trip] = (c, taken + 1)
+            board, taken = boarded[trip]
+            arrival, slot = arrivals[c], to_slots[c]
+            if slot in destinations and (arrival, taken) < best:
+                best, best_leg = (arrival, taken), (board, c)
+            if (arrival + TRANSFER_MINUTES, taken) < ready[slot]:
+                ready[slot] = (arrival + TRANSFER_MINUTES, taken)
+                reached_by[slot] = (board, c)
+
+        if best_leg is None:
+            return None
+        legs = [best_leg]
+        origins = set(origins)
+        while from_slots[legs[-1][0]] not in origins:
+            legs.append(reached_by[from_slots[legs[-1][0]]])
+        return best[0], legs[::-1]
+
+    def describe_leg(self, board, alight):
+        scheduled, index = self.scheduled, self.route_index
+        trip = self.trips[board]
+        first_stop = scheduled.stops[self.entries[board]]
+        last_stop = scheduled.stops[self.entries[alight] + 1]
+        return {
+            'schedule_no': str(scheduled.schedule_nos[trip]),
+            'trip_no': int(scheduled.trip_nos[trip]),
+            'route_no': str(index.route_numbers[scheduled.routes[trip]]),
+            'service_type': str(scheduled.service_types[trip]),
+            'destination': str(scheduled.destinations[trip]),
+            'from_stop': str(index.names[first_stop]),
+            'departure': format_minutes(self.departures[board]),
+            'to_stop': str(index.names[last_stop]),
+            'arrival': format_minutes(self.arrivals[alight]),
+            'stops': int(last_stop - first_stop),
+            'distance_km': round(float(index.cumulative_km[last_stop] - index.cumulative_km[first_stop]), 3),
+        }
+
+    def plan(self, origin_id, origin_name, destination_id, destination_name, after):
+        """
+        Earliest-arrival itinerary between two stops (canonical id and/or
+        name each) leaving at or after minute `after`. Returns None for an
+        unknown stop, {'legs': []} when no journey arrives the same
+        service day.
+        """
+        origins = self.scheduled.find_slots(origin_id, origin_name)
+        destinations = self.scheduled.find_slots(destination_id, destination_name)
+        if not origins or not destinations:
+            return None
+        if origins & destinations:
+            return {'legs': [], 'arrival': format_minutes(after), 'transfers': 0, 'duration_minutes': 0}
+
+        found = self.earliest_arrival(origins, destinations, after)
+        if found is None:
+            return {'legs': []}
+        arrival, legs = found
+        return {
+            'legs': [self.describe_leg(board, alight) for board, alight in legs],
+            'arrival': format_minutes(arrival),
+            'transfers': len(legs) - 1,
+            'duration_minutes': int(round(arrival - after)),
+        }
+
+
+_planner = None
+_planner_lock = threading.Lock()
+
+
+def get_journey_planner():
+    """Process-wide planner over the current departure board's trips"""
+    global _planner
+    board = get_departure_board()
+    planner = _planner
+    if planner is not None and planner.scheduled is board.scheduled:
+        return planner
+    with _planner_lock:
+        if _planner is None or _planner.scheduled is not board.scheduled:
+            _planner = JourneyPlanner(board.scheduled, board.route_index)
+        return _planner
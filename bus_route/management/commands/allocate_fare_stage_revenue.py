@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from datetime import date as date_type, datetime, timedelta
+import time
+
+import pandas as pd
+
+from bus_route.fare_stages import TICKET_COLUMNS, FareStageSegments, allocate_fare_stages
+from bus_route.models import FareStageRevenue
+from bus_route.route_index import get_route_index
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Allocate one day's ticket passengers and revenue to the fare-stage segments of every trip"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Ticket issue date, YYYY-MM-DD (default: yesterday)')
+        parser.add_argument(
+            '--csv',
+            type=str,
+            help=f"Read ticket rows from a CSV with {', '.join(TICKET_COLUMNS)} instead of BigQuery",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else date_type.today() - timedelta(days=1)
+        except ValueError:
+            raise CommandError('Invalid date format. Please use YYYY-MM-DD.')
+
+        started = time.perf_counter()
+        if options['csv']:
+            tickets = pd.read_csv(options['csv'], usecols=TICKET_COLUMNS)
+        else:
+            from bus_route.utils.bigquery_utils import fetch_day_ticket_data
+            tickets = fetch_day_ticket_data(day)
+        self.stdout.write(f"{len(tickets)} ticket rows for {day}")
+        if tickets.empty:
+            self.stdout.write(self.style.WARNING('No tickets; existing allocations kept'))
+            return
+
+        allocation, unplaced = allocate_fare_stages(tickets, FareStageSegments(get_route_index()))
+        if unplaced:
+            self.stdout.write(f"  {unplaced} ticket rows not on their trip's route (unknown trip, route or stop) were skipped")
+
+        records = [
+            FareStageRevenue(date=day, **row)
+            for row in allocation.to_dict('records')
+        ]
+        with transaction.atomic():
+            FareStageRevenue.objects.filter(date=day).delete()
+            FareStageRevenue.objects.bulk_create(records, batch_size=BATCH_SIZE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(records)} fare-stage rows for {allocation[['schedule_no', 'trip_no']].drop_duplicates().shape[0]} trips "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
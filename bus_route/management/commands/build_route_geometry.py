@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from bus_route.geometry import PROVIDERS, DEFAULT_PROVIDER, build_route_geometry, get_provider, route_stops, stops_fingerprint
+from bus_route.models import Route, RouteGeometry
+from bus_route.route_index import get_route_index, invalidate_route_index
+
+
+class Command(BaseCommand):
+    help = 'Fetch and store road geometry for every route so maps need no directions requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=str, help='Comma-separated route numbers (default: every route)')
+        parser.add_argument(
+            '--provider',
+            type=str,
+            default=DEFAULT_PROVIDER,
+            choices=sorted(PROVIDERS),
+            help=f'Directions provider (default: {DEFAULT_PROVIDER}; stub draws straight lines offline)',
+        )
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild routes whose stored geometry is still current')
+        parser.add_argument('--refresh-segments', action='store_true', help='Request directions again for already stored stop pairs')
+
+    def handle(self, *args, **options):
+        try:
+            provider = get_provider(options['provider'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['routes']:
+            route_numbers = [route_no.strip().upper() for route_no in options['routes'].split(',') if route_no.strip()]
+        else:
+            route_numbers = list(Route.objects.values_list('route_no', flat=True).distinct().order_by('route_no'))
+
+        current = dict(RouteGeometry.objects.values_list('route_no', 'stops_fingerprint'))
+        # One snapshot of the route index for the whole run
+        route_index = get_route_index()
+        started = time.perf_counter()
+        built = skipped = requested = failed = 0
+        too_short = []
+        for route_no in route_numbers:
+            if not (options['rebuild'] or options['refresh_segments']) and route_no in current:
+                if current[route_no] == stops_fingerprint(route_stops(route_no, route_index)):
+                    skipped += 1
+                    continue
+
+            geometry, route_requested, route_failed = build_route_geometry(
+                route_no, provider, refresh=options['refresh_segments'], route_index=route_index
+            )
+            if geometry is None:
+                too_short.append(route_no)
+                self.stdout.write(self.style.WARNING(f'Route {route_no} has fewer than two stops; skipped'))
+                continue
+            built += 1
+            requested += route_requested
+            failed += route_failed
+            if route_failed:
+                self.stdout.write(self.style.WARNING(
+                    f'Route {route_no}: {route_failed} segments drawn as straight lines (directions failed)'
+                ))
+
+        if too_short:
+            RouteGeometry.objects.filter(route_no__in=too_short).delete()
+        # Geometry rows were written without signals; the index picks up the new road lengths once
+        invalidate_route_index()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Built geometry for {built} routes ({skipped} already current) in {time.perf_counter() - started:.1f}s; '
+                f'{requested} new stop pairs requested from {provider.name}, {failed} failed'
+            )
+        )
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import time
+
+import numpy as np
+
+from bus_route.departures import ScheduledTrips, invalidate_departures
+from bus_route.models import Schedule
+from bus_route.route_index import get_route_index
+from bus_route.stop_matrix import STOP_MATRIX_DIR, StopMatrix, estimate_trip_km
+from bus_route.stop_registry import resolve_stop_ids
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Compute all-pairs stop distances and scheduled travel times, and fill missing Schedule.trip_km'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=STOP_MATRIX_DIR, help=f'Matrix directory (default: {STOP_MATRIX_DIR})')
+        parser.add_argument(
+            '--refill',
+            action='store_true',
+            help='Also recompute trip_km values an earlier run estimated (after route or stop changes)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        route_index = get_route_index()
+        matrix = StopMatrix.build(route_index, ScheduledTrips(route_index))
+        matrix.save(options['output'])
+        connected = np.isfinite(matrix.distance_km)
+        self.stdout.write(
+            f"{len(matrix.stops)} stops, {int(connected.sum())} connected pairs, "
+            f"{int(np.isfinite(matrix.minutes).sum())} with scheduled times -> {options['output']}"
+        )
+
+        schedules = Schedule.objects.filter(trip_km__isnull=True)
+        if options['refill']:
+            schedules = schedules | Schedule.objects.filter(trip_km_estimated=True)
+        schedules = list(schedules)
+        # Each distinct source/destination name is resolved once, not once per schedule
+        names = list({name for schedule in schedules for name in (schedule.source, schedule.destination)})
+        stop_ids = dict(zip(names, resolve_stop_ids(names)))
+
+        filled, no_route, no_estimate = [], 0, 0
+        for schedule in schedules:
+            route_stops = route_index.get(schedule.route_no)
+            if not route_stops:
+                no_route += 1
+                continue
+            trip_km = estimate_trip_km(route_stops, schedule.source, schedule.destination, matrix, stop_ids)
+            if not trip_km:
+                no_estimate += 1
+                continue
+            schedule.trip_km = round(trip_km, 2)
+            schedule.trip_km_estimated = True
+            filled.append(schedule)
+
+        with transaction.atomic():
+            Schedule.objects.bulk_update(filled, ['trip_km', 'trip_km_estimated'], batch_size=BATCH_SIZE)
+        # bulk_update sends no signals; departure times interpolate over trip_km
+        invalidate_departures()
+        if no_route:
+            self.stdout.write(f"  {no_route} schedules have no route in the index; trip_km left empty")
+        if no_estimate:
+            self.stdout.write(f"  {no_estimate} schedules got no distance estimate (stops or route of zero length); trip_km left empty")
+        self.stdout.write(self.style.SUCCESS(
+            f"Filled trip_km for {len(filled)} schedules in {time.perf_counter() - started:.1f}s"
+        ))
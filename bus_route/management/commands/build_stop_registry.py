@@ -0,0 +1,154 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from collections import Counter, defaultdict
+import time
+
+from bus_route.models import Route, Stop, StopAlias
+from bus_route.route_index import invalidate_route_index
+from bus_route.stop_registry import CLUSTER_RADIUS_M, cluster_names, invalidate_stop_registry, load_geocode_caches
+from passenger_distribution.models import KsrtcFromData, KsrtcToData
+
+# (model, stop name field, stop id field) of the passenger extracts
+EXTRACTS = [
+    (KsrtcFromData, 'from_stop_name', 'from_stop'),
+    (KsrtcToData, 'to_stop_name', 'to_stop'),
+]
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Merge stop name spellings from routes, passenger extracts and geocode caches into canonical stops'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=CLUSTER_RADIUS_M,
+            help=f'Spellings with the same key further apart than this many metres stay separate stops (default: {CLUSTER_RADIUS_M})',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report the merges without writing anything')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        # One observation per distinct (spelling, position); weights pick the canonical spelling
+        route_rows = defaultdict(list)
+        for route_id, name, latitude, longitude in Route.objects.values_list('id', 'stop_name', 'stop_latitude', 'stop_longitude'):
+            route_rows[(name.strip(), round(latitude, 5), round(longitude, 5))].append(route_id)
+        observations = [(name, latitude, longitude, len(ids)) for (name, latitude, longitude), ids in route_rows.items()]
+        observations += [(name, latitude, longitude, 1) for name, latitude, longitude in load_geocode_caches()]
+
+        extract_names = {}
+        for model, name_field, _ in EXTRACTS:
+            counts = model.objects.values(name_field).annotate(rows=Count('id')).values_list(name_field, 'rows')
+            extract_names[model] = [name for name, _ in counts]
+            observations += [(name.strip(), None, None, rows) for name, rows in counts if name.strip()]
+
+        clusters, labels = cluster_names(observations, radius_m=options['radius'])
+
+        # A spelling seen in several clusters (same name at different places) aliases its heaviest one
+        alias_weights = defaultdict(Counter)
+        for (name, _, _, weight), label in zip(observations, labels.tolist()):
+            alias_weights[name][label] += weight
+        alias_cluster = {name: weights.most_common(1)[0][0] for name, weights in alias_weights.items()}
+
+        merged = [cluster for cluster in clusters if len(cluster['aliases']) > 1]
+        self.stdout.write(
+            f"{len(alias_cluster)} spellings from {len(observations)} observations -> {len(clusters)} stops "
+            f"({len(merged)} with several spellings)"
+        )
+        for cluster in sorted(merged, key=lambda c: -len(c['aliases']))[:10]:
+            self.stdout.write(f"  {cluster['name']}: {', '.join(sorted(cluster['aliases']))}")
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            stop_ids = self.save_stops(clusters)
+            StopAlias.objects.all().delete()
+            StopAlias.objects.bulk_create(
+                [StopAlias(alias=name, stop_id=stop_ids[label]) for name, label in alias_cluster.items()],
+                batch_size=BATCH_SIZE,
+            )
+
+            # Route rows take the cluster of their own position, not just of their spelling
+            route_updates = []
+            for (name, latitude, longitude, _), label in zip(observations, labels.tolist()):
+                for route_id in route_rows.get((name, latitude, longitude), ()):
+                    route_updates.append((stop_ids[label], route_id))
+            self.execute_updates(Route, 'stop', 'id', route_updates)
+
+            for model, name_field, id_field in EXTRACTS:
+                updates = [
+                    (stop_ids[alias_cluster[name.strip()]], name)
+                    for name in extract_names[model] if name.strip() in alias_cluster
+                ]
+                self.execute_updates(model, id_field, name_field, updates)
+
+        # Bulk updates send no signals
+        invalidate_stop_registry()
+        invalidate_route_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(clusters)} stops and {len(alias_cluster)} aliases in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def save_stops(self, clusters):
+        """Create or update Stop rows, keeping the ids of stops whose aliases already pointed to them"""
+        previous = dict(StopAlias.objects.values_list('alias', 'stop_id'))
+        existing = Stop.objects.in_bulk()
+        claimed = {}
+        for label, cluster in sorted(enumerate(clusters), key=lambda item: -sum(item[1]['aliases'].values())):
+            votes = Counter()
+            for alias, weight in cluster['aliases'].items():
+                if previous.get(alias) in existing:
+                    votes[previous[alias]] += weight
+            for stop_id, _ in votes.most_common():
+                if stop_id not in claimed.values():
+                    claimed[label] = stop_id
+                    break
+
+        # Clusters whose spellings all alias a heavier cluster (same name at another place):
+        # reuse the nearest unclaimed stop with the same key
+        unclaimed = defaultdict(list)
+        taken = set(claimed.values())
+        for stop in existing.values():
+            if stop.id not in taken:
+                unclaimed[stop.key].append(stop)
+        for label, cluster in enumerate(clusters):
+            candidates = unclaimed.get(cluster['key'])
+            if label in claimed or not candidates:
+                continue
+            stop = min(candidates, key=lambda candidate: (
+                (candidate.latitude or 0) - (cluster['latitude'] or 0)) ** 2 + ((candidate.longitude or 0) - (cluster['longitude'] or 0)) ** 2
+            )
+            candidates.remove(stop)
+            claimed[label] = stop.id
+
+        updated, created, stop_ids = [], [], {}
+        for label, cluster in enumerate(clusters):
+            fields = {key: cluster[key] for key in ('name', 'key', 'latitude', 'longitude')}
+            if label in claimed:
+                stop = existing[claimed[label]]
+                for key, value in fields.items():
+                    setattr(stop, key, value)
+                updated.append(stop)
+            else:
+                stop = Stop(**fields)
+                created.append(stop)
+            stop_ids[label] = stop
+        Stop.objects.bulk_update(updated, ['name', 'key', 'latitude', 'longitude'], batch_size=BATCH_SIZE)
+        Stop.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        Stop.objects.exclude(id__in=set(claimed.values())).exclude(id__in=[stop.id for stop in created]).delete()
+        return {label: stop.id for label, stop in stop_ids.items()}
+
+    def execute_updates(self, model, id_field, match_field, updates):
+        """UPDATE model SET id_field = %s WHERE match_field = %s for every (id, value) pair"""
+        quote = connection.ops.quote_name
+        sql = (
+            f"UPDATE {quote(model._meta.db_table)} SET {quote(model._meta.get_field(id_field).column)} = %s "
+            f"WHERE {quote(model._meta.get_field(match_field).column)} = %s"
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(updates), BATCH_SIZE):
+                cursor.executemany(sql, updates[start:start + BATCH_SIZE])
+        self.stdout.write(f"  {model.__name__}: {len(updates)} stop id updates")
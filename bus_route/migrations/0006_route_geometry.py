@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_route', '0005_alter_schedule_end_time_alter_schedule_start_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_no', models.CharField(max_length=20, unique=True)),
+                ('stops_fingerprint', models.CharField(max_length=40)),
+                ('polyline', models.TextField()),
+                ('stop_points', models.JSONField()),
+                ('segment_lengths', models.JSONField()),
+                ('straight_segments', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RoadSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_point', models.CharField(max_length=32)),
+                ('to_point', models.CharField(max_length=32)),
+                ('polyline', models.TextField()),
+                ('length_m', models.FloatField()),
+                ('provider', models.CharField(max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('from_point', 'to_point')},
+            },
+        ),
+    ]
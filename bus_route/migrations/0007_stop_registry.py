@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_route', '0006_route_geometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('key', models.CharField(db_index=True, max_length=100)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='stop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='route_stops', to='bus_route.stop'),
+        ),
+        migrations.CreateModel(
+            name='StopAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='bus_route.stop')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_route', '0007_stop_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='trip_km_estimated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
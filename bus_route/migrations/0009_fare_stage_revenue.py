@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_route', '0008_schedule_trip_km_estimated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareStageRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('schedule_no', models.CharField(max_length=20)),
+                ('trip_no', models.IntegerField()),
+                ('route_no', models.CharField(max_length=20)),
+                ('stage', models.PositiveSmallIntegerField()),
+                ('from_stop_name', models.CharField(max_length=100)),
+                ('to_stop_name', models.CharField(max_length=100)),
+                ('distance_km', models.FloatField()),
+                ('passengers', models.IntegerField()),
+                ('boardings', models.IntegerField()),
+                ('revenue', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['schedule_no', 'trip_no', 'date'], name='bus_route_f_schedul_f6507d_idx')],
+                'unique_together': {('date', 'schedule_no', 'trip_no', 'stage')},
+            },
+        ),
+    ]
@@ -8,8 +8,12 @@ class Route(models.Model):
       stop_latitude = models.FloatField()
       stop_longitude = models.FloatField()
       fare_stage = models.BooleanField(default=False)
+      stop = models.ForeignKey('Stop', null=True, blank=True, on_delete=models.SET_NULL, related_name='route_stops')
       def save(self, *args, **kwargs):
             self.route_no = self.route_no.upper()
+            if self.stop_id is None:
+                  from .stop_registry import resolve_stop_id
+                  self.stop_id = resolve_stop_id(self.stop_name)
             super(Route, self).save(*args, **kwargs)
             
       def __str__(self):
@@ -29,6 +33,7 @@ class Schedule(models.Model):
       start_time = models.TimeField(null=True, blank=True)
       end_time = models.TimeField(null=True, blank=True)
       trip_km = models.FloatField(null=True, blank=True)
+      trip_km_estimated = models.BooleanField(default=False)  # Filled in by manage.py build_stop_matrix
       class Meta:
             unique_together = (('schedule_no', 'trip_no'),)
       def save(self, *args, **kwargs):
@@ -65,3 +70,76 @@ class Trip(models.Model):
 
       def __str__(self):
             return f"Trip on {self.date} - Schedule {self.schedule_no} - Trip {self.trip_no}"
+
+
+class RoadSegment(models.Model):
+      """Road geometry between two stop coordinates, shared by every route that uses the pair"""
+      from_point = models.CharField(max_length=32)  # "lat,lon" rounded to 5 decimals (about 1 m)
+      to_point = models.CharField(max_length=32)
+      polyline = models.TextField()  # Google encoded polyline
+      length_m = models.FloatField()
+      provider = models.CharField(max_length=20)
+      updated_at = models.DateTimeField(auto_now=True)
+
+      class Meta:
+            unique_together = (('from_point', 'to_point'),)
+
+      def __str__(self):
+            return f"Segment {self.from_point} -> {self.to_point} ({self.length_m:.0f} m)"
+
+
+class RouteGeometry(models.Model):
+      """Road geometry of a whole route, built by manage.py build_route_geometry"""
+      route_no = models.CharField(max_length=20, unique=True)
+      stops_fingerprint = models.CharField(max_length=40)  # Hash of the stop sequence it was built from
+      polyline = models.TextField()  # Google encoded polyline through every stop
+      stop_points = models.JSONField()  # Index into the decoded polyline of each stop
+      segment_lengths = models.JSONField()  # Metres between consecutive stops
+      straight_segments = models.JSONField(default=list)  # Segments drawn as straight lines (no road geometry)
+      updated_at = models.DateTimeField(auto_now=True)
+
+      def __str__(self):
+            return f"Geometry of route {self.route_no} ({len(self.segment_lengths)} segments)"
+
+
+class Stop(models.Model):
+      """Canonical stop, built by manage.py build_stop_registry from every spelling seen in the data"""
+      name = models.CharField(max_length=100)  # Most common spelling
+      key = models.CharField(max_length=100, db_index=True)  # Normalized name (stop_registry.stop_key)
+      latitude = models.FloatField(null=True, blank=True)
+      longitude = models.FloatField(null=True, blank=True)
+      updated_at = models.DateTimeField(auto_now=True)
+
+      def __str__(self):
+            return f"Stop {self.id}: {self.name}"
+
+
+class StopAlias(models.Model):
+      """One spelling of a stop name as it appears in Route, passenger extracts, BigQuery or the geocode caches"""
+      alias = models.CharField(max_length=100, unique=True)
+      stop = models.ForeignKey(Stop, on_delete=models.CASCADE, related_name='aliases')
+
+      def __str__(self):
+            return f"{self.alias} -> {self.stop_id}"
+
+
+class FareStageRevenue(models.Model):
+      """Passengers and revenue of one trip between two fare stages on one day, built by manage.py allocate_fare_stage_revenue"""
+      date = models.DateField()
+      schedule_no = models.CharField(max_length=20)
+      trip_no = models.IntegerField()
+      route_no = models.CharField(max_length=20)
+      stage = models.PositiveSmallIntegerField()  # Segment order along the route, from 0
+      from_stop_name = models.CharField(max_length=100)
+      to_stop_name = models.CharField(max_length=100)
+      distance_km = models.FloatField()
+      passengers = models.IntegerField()  # On board through the segment
+      boardings = models.IntegerField()  # Boarded within the segment
+      revenue = models.FloatField()  # Ticket revenue shared out by distance travelled in each segment
+
+      class Meta:
+            unique_together = (('date', 'schedule_no', 'trip_no', 'stage'),)
+            indexes = [models.Index(fields=['schedule_no', 'trip_no', 'date'])]
+
+      def __str__(self):
+            return f"{self.date} {self.schedule_no}/{self.trip_no} stage {self.stage}: {self.from_stop_name} -> {self.to_stop_name}"
@@ -0,0 +1,75 @@
+"""
+Daily revenue series for the schedule and trip revenue charts.
+
+One grouped (key, date) query is pivoted into a dense keys x dates float
+matrix with NaN for days without a trip, and served column-wise: the
+dates once, the keys once and one value array per key, with null in the
+gaps so the chart leaves them open.
+
+For long ranges the same rows can instead be read ordered by key and
+turned into one series at a time (iter_revenue_series), so a streamed
+response never holds more than one key's days.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+import numpy as np
+from django.db.models import Sum
+
+from .models import Trip
+
+
+def date_range(start_date, end_date):
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def revenue_matrix(rows, start_date, end_date):
+    """(keys, dates, matrix) from (key, date, revenue) rows; keys are sorted, revenue None counts as a gap"""
+    dates = date_range(start_date, end_date)
+    rows = [row for row in rows if row[2] is not None]
+    if not rows:
+        return [], dates, np.empty((0, len(dates)))
+    keys, key_index = np.unique(np.array([row[0] for row in rows]), return_inverse=True)
+    days = np.array([(row[1] - start_date).days for row in rows], dtype=np.int64)
+    matrix = np.full((len(keys), len(dates)), np.nan)
+    matrix[key_index.ravel(), days] = np.array([row[2] for row in rows], dtype=np.float64)
+    return keys.tolist(), dates, matrix
+
+
+def columnar(key_name, keys, dates, matrix):
+    """{'dates': [...], key_name: [...], 'revenues': [[...] per key]} with null for NaN"""
+    values = np.round(matrix, 2).astype(object)
+    values[np.isnan(matrix)] = None
+    return {
+        'dates': [day.strftime('%Y-%m-%d') for day in dates],
+        key_name: keys,
+        'revenues': values.tolist(),
+    }
+
+
+def iter_revenue_series(rows, start_date, end_date):
+    """(key, [revenue or None per date]) per key from (key, date, revenue) rows ordered by key"""
+    days = (end_date - start_date).days + 1
+    for key, group in groupby(rows, key=lambda row: row[0]):
+        values = [None] * days
+        for _, day, revenue in group:
+            if revenue is not None:
+                values[(day - start_date).days] = round(float(revenue), 2)
+        if any(value is not None for value in values):
+            yield key, values
+
+
+def schedule_revenue_rows(start_date, end_date, schedule_no=None):
+    """Total revenue per (schedule, date), for one schedule or all of them"""
+    trips = Trip.objects.filter(date__gte=start_date, date__lte=end_date)
+    if schedule_no is not None:
+        trips = trips.filter(schedule_no=schedule_no)
+    return trips.values_list('schedule_no', 'date').annotate(total_revenue=Sum('revenue')).order_by()
+
+
+def trip_revenue_rows(schedule_no, start_date, end_date, trip_no=None):
+    """Revenue per (trip, date) of one schedule, for one trip or all of them"""
+    trips = Trip.objects.filter(schedule_no=schedule_no, date__gte=start_date, date__lte=end_date)
+    if trip_no is not None:
+        trips = trips.filter(trip_no=trip_no)
+    return trips.values_list('trip_no', 'date', 'revenue')
@@ -0,0 +1,230 @@
+"""
+In-process index of every route's stop sequence.
+
+Views used to run Route.objects.filter(route_no=...).order_by('order_sequence')
+and build dicts row by row on every request. The index loads all Route
+rows once into flat NumPy arrays (stop names, lat, lon, fare-stage flags,
+order sequence, cumulative km, canonical stop ids) with per-route offsets, so reading a route
+is a dict lookup plus array slices.
+
+The arrays hold no per-stop Python objects. When the index is built before
+the workers fork (ROUTE_INDEX_PRELOAD=1 with gunicorn --preload, see
+ksrtc1/wsgi.py), their pages stay shared copy-on-write between workers.
+
+Route post_save/post_delete drops the index in the saving process and bumps
+a version in the Django cache. Other processes compare against that
+version at most every ROUTE_INDEX_CHECK_SECONDS and rebuild lazily.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import Route
+
+VERSION_KEY = 'route_index:version'
+CHECK_INTERVAL = float(os.getenv('ROUTE_INDEX_CHECK_SECONDS', '5'))
+EARTH_RADIUS_KM = 6371.0
+
+
+class RouteStops:
+    """One route's stops as array views into the index"""
+    __slots__ = ('route_no', 'names', 'latitudes', 'longitudes', 'fare_stages', 'sequences', 'cumulative_km', 'stop_ids')
+
+    def __init__(self, route_no, names, latitudes, longitudes, fare_stages, sequences, cumulative_km, stop_ids):
+        self.route_no = route_no
+        self.names = names
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.fare_stages = fare_stages
+        self.sequences = sequences
+        self.cumulative_km = cumulative_km
+        self.stop_ids = stop_ids  # Canonical Stop ids (manage.py build_stop_registry), -1 where unresolved
+
+    def __len__(self):
+        return len(self.names)
+
+    def stop_names(self):
+        return self.names.tolist()
+
+    def fare_stage_names(self):
+        return self.names[self.fare_stages].tolist()
+
+    def resolved_stop_ids(self):
+        return sorted(set(self.stop_ids[self.stop_ids >= 0].tolist()))
+
+    def unresolved_stop_names(self):
+        return sorted(set(self.names[self.stop_ids < 0].tolist()))
+
+    def fare_stage_segments(self):
+        """(from stage, to stage, km) between consecutive fare stages along the route"""
+        stages = np.flatnonzero(self.fare_stages)
+        return [
+            (self.names[a], self.names[b], round(float(self.cumulative_km[b] - self.cumulative_km[a]), 3))
+            for a, b in zip(stages[:-1].tolist(), stages[1:].tolist())
+        ]
+
+    def stop_dicts(self):
+        """Stops in the dict shape the map builders take, in order"""
+        return [
+            {
+                'name': name,
+                'latitude': latitude,
+                'longitude': longitude,
+                'is_fare_stage': fare_stage,
+                'sequence': sequence,
+                'distance_km': round(distance_km, 3),
+            }
+            for name, latitude, longitude, fare_stage, sequence, distance_km in zip(
+                self.names.tolist(), self.latitudes.tolist(), self.longitudes.tolist(),
+                self.fare_stages.tolist(), self.sequences.tolist(), self.cumulative_km.tolist(),
+            )
+        ]
+
+
+class RouteIndex:
+    def __init__(self, route_numbers, offsets, names, latitudes, longitudes, fare_stages, sequences, cumulative_km, stop_ids):
+        self.route_numbers = route_numbers
+        self.offsets = offsets
+        self.names = names
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.fare_stages = fare_stages
+        self.sequences = sequences
+        self.cumulative_km = cumulative_km
+        self.stop_ids = stop_ids
+        self.route_position = {route_no: i for i, route_no in enumerate(route_numbers.tolist())}
+
+    @classmethod
+    def build(cls):
+        rows = list(
+            Route.objects.order_by('route_no', 'order_sequence', 'id').values_list(
+                'route_no', 'order_sequence', 'stop_name', 'stop_latitude', 'stop_longitude', 'fare_stage', 'stop_id'
+            )
+        )
+        if rows:
+            route_column, sequence_column, name_column, lat_column, lon_column, fare_column, stop_column = zip(*rows)
+        else:
+            route_column = sequence_column = name_column = lat_column = lon_column = fare_column = stop_column = ()
+
+        # Route.save upper-cases route_no, bulk inserts may not; sort stably on the upper-cased key
+        route_keys = np.array([route_no.upper() for route_no in route_column], dtype=str)
+        order = np.argsort(route_keys, kind='stable')
+        route_keys = route_keys[order]
+        names = np.array(name_column, dtype=str)[order] if rows else np.array([], dtype=str)
+        latitudes = np.array(lat_column, dtype=np.float64)[order]
+        longitudes = np.array(lon_column, dtype=np.float64)[order]
+        fare_stages = np.array(fare_column, dtype=bool)[order]
+        sequences = np.array(sequence_column, dtype=np.int32)[order]
+        stop_ids = np.array([-1 if stop_id is None else stop_id for stop_id in stop_column], dtype=np.int64)[order]
+
+        route_numbers, starts = np.unique(route_keys, return_index=True)
+        offsets = np.append(starts, len(route_keys)).astype(np.int64)
+        cumulative_km = cls._cumulative_km(offsets, latitudes, longitudes)
+        index = cls(route_numbers, offsets, names, latitudes, longitudes, fare_stages, sequences, cumulative_km, stop_ids)
+        index._apply_road_lengths()
+        return index
+
+    @staticmethod
+    def _cumulative_km(offsets, latitudes, longitudes):
+        """Great-circle distance from each route's first stop, for all routes at once"""
+        if len(latitudes) == 0:
+            return np.zeros(0)
+        lat, lon = np.radians(latitudes), np.radians(longitudes)
+        h = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        steps = np.concatenate([[0.0], 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))])
+        steps[offsets[:-1]] = 0.0  # No distance across route boundaries
+        total = np.cumsum(steps)
+        return total - np.repeat(total[offsets[:-1]], np.diff(offsets))
+
+    def _apply_road_lengths(self):
+        """Use stored road segment lengths (manage.py build_route_geometry) where they are current"""
+        from .geometry import stops_fingerprint
+        from .models import RouteGeometry
+
+        for route_no, fingerprint, lengths in RouteGeometry.objects.values_list(
+            'route_no', 'stops_fingerprint', 'segment_lengths'
+        ):
+            stops = self.get(route_no)
+            if stops is None or len(lengths) != len(stops) - 1:
+                continue
+            if stops_fingerprint(stops.stop_dicts()) != fingerprint:
+                continue
+            stops.cumulative_km[1:] = np.cumsum(np.asarray(lengths, dtype=np.float64)) / 1000
+            stops.cumulative_km[0] = 0.0
+
+    def get(self, route_no):
+        """RouteStops for `route_no` (case-insensitive), or None"""
+        i = self.route_position.get((route_no or '').upper())
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return RouteStops(
+            self.route_numbers[i],
+            self.names[start:end],
+            self.latitudes[start:end],
+            self.longitudes[start:end],
+            self.fare_stages[start:end],
+            self.sequences[start:end],
+            self.cumulative_km[start:end],
+            self.stop_ids[start:end],
+        )
+
+
+_index = None
+_index_version = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _shared_version():
+    try:
+        return cache.get(VERSION_KEY, 0)
+    except Exception as e:
+        print(f"DEBUG: Could not read the route index version from the cache: {e}")
+        return _index_version
+
+
+def get_route_index():
+    """Process-wide index, rebuilt lazily after any process changed Route rows"""
+    global _index, _index_version, _checked_at
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _checked_at < CHECK_INTERVAL:
+        return index
+    version = _shared_version()
+    with _index_lock:
+        if _index is None or version != _index_version:
+            _index = RouteIndex.build()
+            _index_version = version
+        _checked_at = now
+        return _index
+
+
+def get_route_stops(route_no):
+    """Shortcut: one route's stops, or None when the route has no stops"""
+    return get_route_index().get(route_no)
+
+
+def invalidate_route_index(sender=None, **kwargs):
+    """post_save/post_delete receiver for Route"""
+    global _index
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    except Exception as e:
+        print(f"DEBUG: Could not bump the route index version in the cache: {e}")
+    with _index_lock:
+        _index = None
+
+
+def preload_route_index():
+    """Build the index now, e.g. in the gunicorn master before workers fork"""
+    from django.db import connections
+
+    get_route_index()
+    # Forked workers must not share the master's database connections
+    connections.close_all()
@@ -0,0 +1,123 @@
+"""
+Nearest-stop lookup over every Route stop.
+
+Stops are deduplicated by name and coordinate across routes and put in a
+KD-tree (scipy cKDTree) on unit-sphere xyz coordinates. Straight-line
+(chord) distance on the sphere is monotonic in great-circle distance, so
+nearest neighbours and radius cuts are exact without a map projection.
+Each stop keeps the list of routes serving it.
+
+The locator is derived from the route index (route_index.py) and follows
+it: when the index is rebuilt after Route changes, the locator is rebuilt
+on next use. If the set of stop locations did not change (fare stages,
+orders or routes edited, no stop moved) the previous tree is reused and
+only the stop -> routes lists are refreshed.
+"""
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .route_index import EARTH_RADIUS_KM, get_route_index
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+MAX_RESULTS = 100
+
+
+def to_unit_xyz(latitudes, longitudes):
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_metres(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+def metres_to_chord(metres):
+    return 2 * np.sin(min(metres / EARTH_RADIUS_M, np.pi) / 2)
+
+
+class StopLocator:
+    def __init__(self, route_index, previous=None):
+        self.route_index = route_index
+        counts = np.diff(route_index.offsets)
+        stop_routes = np.repeat(np.arange(len(route_index.route_numbers)), counts)
+
+        # One entry per distinct (name, ~1 m position), however many routes stop there
+        keys = np.char.add(
+            np.char.add(route_index.names.astype(str), '@'),
+            np.char.add(
+                np.char.mod('%.5f,', route_index.latitudes),
+                np.char.mod('%.5f', route_index.longitudes),
+            ),
+        )
+        self.keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        self.names = route_index.names[first]
+        self.latitudes = route_index.latitudes[first]
+        self.longitudes = route_index.longitudes[first]
+
+        # Routes per stop as CSR arrays (route positions in route_index.route_numbers)
+        pairs = np.unique(np.column_stack([inverse.ravel(), stop_routes]), axis=0)
+        self.route_offsets = np.searchsorted(pairs[:, 0], np.arange(len(self.keys) + 1))
+        self.route_ids = pairs[:, 1]
+
+        if previous is not None and np.array_equal(previous.keys, self.keys):
+            self.tree = previous.tree
+        else:
+            self.tree = cKDTree(to_unit_xyz(self.latitudes, self.longitudes)) if len(self.keys) else None
+
+    def routes_of(self, i):
+        ids = self.route_ids[self.route_offsets[i]:self.route_offsets[i + 1]]
+        return self.route_index.route_numbers[ids].tolist()
+
+    def nearest(self, latitude, longitude, k=5, radius=None):
+        """
+        Up to `k` stops closest to (latitude, longitude), optionally within
+        `radius` metres, nearest first. Each is a dict with name, latitude,
+        longitude, distance_m and the routes serving the stop.
+        """
+        if self.tree is None or k < 1:
+            return []
+        k = min(k, len(self.keys))
+        bound = metres_to_chord(radius) if radius is not None else np.inf
+        chords, positions = self.tree.query(
+            to_unit_xyz(np.array([latitude]), np.array([longitude]))[0],
+            k=k,
+            distance_upper_bound=bound,
+        )
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        found = np.isfinite(chords)
+        distances = chord_to_metres(chords[found])
+        return [
+            {
+                'name': str(self.names[i]),
+                'latitude': float(self.latitudes[i]),
+                'longitude': float(self.longitudes[i]),
+                'distance_m': round(float(distance), 1),
+                'routes': self.routes_of(i),
+            }
+            for i, distance in zip(positions[found].tolist(), distances)
+        ]
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_stop_locator():
+    """Locator for the current route index, rebuilt after the index changes"""
+    global _locator
+    index = get_route_index()
+    locator = _locator
+    if locator is not None and locator.route_index is index:
+        return locator
+    with _locator_lock:
+        if _locator is None or _locator.route_index is not index:
+            _locator = StopLocator(index, previous=_locator)
+        return _locator
+
+
+def nearest_stops(lat, lon, k=5, radius=None):
+    """Shortcut: `k` nearest stops to a coordinate, optionally within `radius` metres"""
+    return get_stop_locator().nearest(lat, lon, k=k, radius=radius)
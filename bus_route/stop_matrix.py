@@ -0,0 +1,218 @@
+"""
+All-pairs stop-to-stop distance and scheduled travel time.
+
+manage.py build_stop_matrix turns the route index into a directed stop
+graph: one edge per pair of consecutive stops on any route, weighted by
+the along-route km (stored road lengths where current, great-circle
+otherwise) and by the shortest scheduled time between them
+(departures.ScheduledTrips). Parallel edges keep the smallest weight.
+scipy.sparse.csgraph.shortest_path then gives every pair at once.
+Stops are keyed like the departure board: canonical stop id, or the name
+for stops the registry has not resolved.
+
+The result is a directory of .npy arrays. Like the forecast series store,
+each build writes a new version subdirectory and then points `CURRENT` at it:
+
+    CURRENT            name of the live version subdirectory
+    <version>/
+      stops.npy        stop keys (departures.stop_slot_key), sorted
+      distance_km.npy  (stops, stops) float32, inf where unreachable
+      minutes.npy      (stops, stops) float32, inf where unreachable
+      meta.json
+
+The matrices are memory-mapped, so workers share the pages and a lookup
+is two dict hits and one element read.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+
+from .departures import stop_slot_key
+
+STOP_MATRIX_DIR = 'bus_route/data/stop_matrix'
+POINTER_FILE = 'CURRENT'
+MIN_EDGE_WEIGHT = 1e-6  # csgraph drops zero-weight edges; stops at the same point still connect
+
+
+def current_version(directory=STOP_MATRIX_DIR):
+    """Live version subdirectory of the matrix ('' for a matrix written before versioning)"""
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            return ''
+        raise
+
+
+def route_slot_keys(route_index):
+    """Stop key of every position in the route index arrays"""
+    return np.array(
+        [stop_slot_key(stop_id, name) for stop_id, name in zip(route_index.stop_ids.tolist(), route_index.names.tolist())],
+        dtype=str,
+    )
+
+
+def shortest_edges(sources, targets, weights, size):
+    """Sparse (size, size) graph with the smallest weight of each (source, target) edge"""
+    keep = (sources != targets) & np.isfinite(weights)
+    sources, targets, weights = sources[keep], targets[keep], np.maximum(weights[keep], MIN_EDGE_WEIGHT)
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    return coo_matrix((weights[first], (sources[first], targets[first])), shape=(size, size)).tocsr()
+
+
+class StopMatrix:
+    def __init__(self, stops, distance_km, minutes):
+        self.stops = np.asarray(stops).astype(str)
+        self.distance_km = distance_km
+        self.minutes = minutes
+        self.stop_index = {key: i for i, key in enumerate(self.stops.tolist())}
+
+    @classmethod
+    def build(cls, route_index, scheduled):
+        """From the route index (distances) and departures.ScheduledTrips (times)"""
+        keys = route_slot_keys(route_index)
+        stops, slots = np.unique(keys, return_inverse=True)
+        slots = slots.ravel()
+
+        # Consecutive stops of the same route
+        positions = np.arange(len(slots) - 1)
+        same_route = np.ones(len(positions), dtype=bool)
+        same_route[route_index.offsets[1:-1] - 1] = False
+        positions = positions[same_route] if len(positions) else positions
+        distance_graph = shortest_edges(
+            slots[positions], slots[positions + 1],
+            route_index.cumulative_km[positions + 1] - route_index.cumulative_km[positions],
+            len(stops),
+        )
+
+        # Consecutive stops of the same scheduled trip
+        entries = np.flatnonzero(~scheduled.last_stop)
+        time_graph = shortest_edges(
+            slots[scheduled.stops[entries]], slots[scheduled.stops[entries + 1]],
+            scheduled.minutes[entries + 1] - scheduled.minutes[entries],
+            len(stops),
+        )
+
+        distance_km = shortest_path(distance_graph, method='D', directed=True).astype(np.float32)
+        minutes = shortest_path(time_graph, method='D', directed=True).astype(np.float32)
+        return cls(stops, distance_km, minutes)
+
+    def save(self, directory=STOP_MATRIX_DIR):
+        """
+        Write a new version subdirectory, then swap the CURRENT pointer to it.
+
+        Readers open either the previous version or this one, never a missing
+        or partial matrix. The previous version stays for readers that raced
+        the swap; older ones are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        try:
+            previous = current_version(directory)
+        except FileNotFoundError:
+            previous = None
+        version = f'v{time.time_ns()}'
+        target = os.path.join(directory, version)
+        os.makedirs(target)
+        np.save(os.path.join(target, 'stops.npy'), self.stops)
+        np.save(os.path.join(target, 'distance_km.npy'), np.asarray(self.distance_km))
+        np.save(os.path.join(target, 'minutes.npy'), np.asarray(self.minutes))
+        with open(os.path.join(target, 'meta.json'), 'w') as f:
+            json.dump({
+                'stops': len(self.stops),
+                'connected_pairs': int(np.isfinite(self.distance_km).sum()),
+            }, f)
+
+        staging = os.path.join(directory, f'{POINTER_FILE}.tmp')
+        with open(staging, 'w') as f:
+            f.write(version)
+        os.replace(staging, os.path.join(directory, POINTER_FILE))
+
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in (version, previous) and name.startswith('v') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory=STOP_MATRIX_DIR, version=None):
+        if version is None:
+            version = current_version(directory)
+        directory = os.path.join(directory, version)
+        return cls(
+            np.load(os.path.join(directory, 'stops.npy')),
+            np.load(os.path.join(directory, 'distance_km.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'minutes.npy'), mmap_mode='r'),
+        )
+
+    def find(self, stop_id, stop_name):
+        """Matrix row of a stop by canonical id, else by name; None if unknown"""
+        i = self.stop_index.get(f"id:{stop_id}") if stop_id is not None else None
+        if i is None:
+            i = self.stop_index.get(stop_slot_key(-1, stop_name or ''))
+        return i
+
+    def between(self, origin, destination):
+        """(km, minutes) between two matrix rows; None for unreachable parts"""
+        km = float(self.distance_km[origin, destination])
+        minutes = float(self.minutes[origin, destination])
+        return (km if np.isfinite(km) else None), (minutes if np.isfinite(minutes) else None)
+
+
+_matrix = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+def get_stop_matrix(directory=STOP_MATRIX_DIR):
+    """Process-wide matrix, reopened when the build command swaps in a new version"""
+    global _matrix, _matrix_version
+    version = current_version(directory)
+    matrix = _matrix
+    if matrix is None or version != _matrix_version:
+        with _matrix_lock:
+            if _matrix is None or version != _matrix_version:
+                _matrix = StopMatrix.load(directory, version)
+                _matrix_version = version
+            matrix = _matrix
+    return matrix
+
+
+def estimate_trip_km(route_stops, source, destination, matrix=None, stop_ids=None):
+    """
+    Length of a trip on a route from `source` to `destination` (names as in
+    Schedule): along the route when both are on it, otherwise the shortest
+    network distance from the matrix, otherwise the whole route.
+
+    `stop_ids` maps names to stop ids already resolved in bulk
+    (stop_registry.resolve_stop_ids); without it both names are resolved here.
+    """
+    if stop_ids is None:
+        from .stop_registry import resolve_stop_id
+        source_id, destination_id = resolve_stop_id(source), resolve_stop_id(destination)
+    else:
+        source_id, destination_id = stop_ids.get(source), stop_ids.get(destination)
+    names = np.char.upper(np.char.strip(route_stops.names.astype(str)))
+
+    def on_route(stop_id, name):
+        same_name = names == (name or '').strip().upper()
+        return np.flatnonzero(same_name | (route_stops.stop_ids == stop_id) if stop_id is not None else same_name)
+
+    starts, ends = on_route(source_id, source), on_route(destination_id, destination)
+    if len(starts) and len(ends) and ends.max() > starts.min():
+        return float(route_stops.cumulative_km[ends.max()] - route_stops.cumulative_km[starts.min()])
+    if matrix is not None:
+        origin, target = matrix.find(source_id, source), matrix.find(destination_id, destination)
+        if origin is not None and target is not None:
+            km, _ = matrix.between(origin, target)
+            if km:
+                return km
+    return float(route_stops.cumulative_km[-1]) if len(route_stops) else None
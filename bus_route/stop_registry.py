@@ -0,0 +1,215 @@
+"""
+Canonical stop registry.
+
+One physical stop shows up under many spellings: MOTTAMOODU/Mottamoodu,
+NADUKKADU JN/NADUKKADU., KUMBALATHUNADA/KUMBALATHU NADA. These come from
+Route, the passenger extracts, BigQuery and the geocode caches, so joins
+on the raw name silently miss rows. manage.py build_stop_registry merges
+the spellings into Stop rows with integer ids:
+
+    1. every name is reduced to a key (stop_key): upper case, letters and
+       digits only, JUNCTION/JCT/JN suffixes dropped, doubled letters
+       collapsed ("KUMBALATHU NADA" and "KUMBALATHUNADA" -> "KUMBALATHUNADA",
+       "MOTTAMMOODU" and "MOTTAMOODU" -> "MOTAMODU")
+    2. located spellings sharing a key are clustered by position, so
+       similar names CLUSTER_RADIUS_M or more apart stay separate stops
+    3. spellings without coordinates join the busiest cluster of their key
+
+Every spelling seen becomes a StopAlias. Ingest paths resolve names with
+resolve_stop_id / resolve_stop_ids: one dict lookup on the exact alias,
+then one on the key for spellings the job has not seen yet.
+Route.stop and KsrtcFromData/KsrtcToData.from_stop/to_stop hold the ids,
+so stop joins are integer joins.
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.core.cache import cache
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .models import Stop, StopAlias
+from .route_index import CHECK_INTERVAL
+
+VERSION_KEY = 'stop_registry:version'
+CLUSTER_RADIUS_M = 500  # Spellings of one stop are recorded within a few hundred metres
+GEOCODE_CACHES = [
+    'geocoded_stops.json',
+    'bus_route/geocoded_stops.json',
+    'passenger_distribution/geocoded_stops.json',
+]
+SUFFIX_TOKENS = {'JUNCTION': 'JN', 'JNC': 'JN', 'JCT': 'JN', 'JN': 'JN'}
+
+
+def stop_key(name):
+    """Normalized form of a stop name; spellings of one stop usually share it"""
+    tokens = [SUFFIX_TOKENS.get(token, token) for token in re.findall(r'[A-Z0-9]+', (name or '').upper())]
+    while len(tokens) > 1 and tokens[-1] == 'JN':
+        tokens.pop()
+    return re.sub(r'(.)\1+', r'\1', ''.join(tokens))
+
+
+def cluster_names(observations, radius_m=CLUSTER_RADIUS_M):
+    """
+    Group name observations into stops.
+
+    `observations` is a list of (name, latitude, longitude, weight) with
+    None coordinates for names seen without a position. Returns (clusters,
+    labels): clusters are dicts with key, name, latitude, longitude and an
+    alias -> weight Counter; labels give each observation's cluster.
+    """
+    keys = [stop_key(name) for name, _, _, _ in observations]
+    located = np.array([lat is not None and lon is not None for _, lat, lon, _ in observations], dtype=bool)
+    located_index = np.flatnonzero(located)
+    labels = np.full(len(observations), -1, dtype=np.int64)
+
+    if len(located_index):
+        lat = np.radians([observations[i][1] for i in located_index])
+        lon = np.radians([observations[i][2] for i in located_index])
+        xyz = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+        chord = 2 * np.sin(radius_m / 6371000.0 / 2)
+        pairs = cKDTree(xyz).query_pairs(chord, output_type='ndarray')
+        # Only spellings with the same key may merge
+        same_key = np.array([keys[located_index[a]] == keys[located_index[b]] for a, b in pairs], dtype=bool)
+        pairs = pairs[same_key] if len(pairs) else pairs.reshape(0, 2)
+        graph = coo_matrix(
+            (np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+            shape=(len(located_index), len(located_index)),
+        )
+        _, components = connected_components(graph, directed=False)
+        labels[located_index] = components
+
+    # Unlocated names join the heaviest located cluster of their key, or a cluster of their own
+    weight_by_label = Counter()
+    for i in located_index:
+        weight_by_label[labels[i]] += observations[i][3]
+    heaviest = {}
+    for i in located_index:
+        label = labels[i]
+        best = heaviest.get(keys[i])
+        if best is None or weight_by_label[label] > weight_by_label[best]:
+            heaviest[keys[i]] = label
+    next_label = int(labels.max()) + 1 if len(located_index) else 0
+    for i in np.flatnonzero(~located):
+        if keys[i] not in heaviest:
+            heaviest[keys[i]] = next_label
+            next_label += 1
+        labels[i] = heaviest[keys[i]]
+
+    clusters = defaultdict(lambda: {'aliases': Counter(), 'points': []})
+    for (name, lat, lon, weight), key, label in zip(observations, keys, labels.tolist()):
+        cluster = clusters[label]
+        cluster['key'] = key
+        cluster['aliases'][name] += weight
+        if lat is not None and lon is not None:
+            cluster['points'].append((lat, lon, weight))
+
+    result, remap = [], {}
+    for label, cluster in clusters.items():
+        points = np.array(cluster.pop('points')).reshape(-1, 3)
+        weights = points[:, 2] if len(points) else None
+        remap[label] = len(result)
+        result.append(dict(
+            cluster,
+            name=cluster['aliases'].most_common(1)[0][0],
+            latitude=float(np.average(points[:, 0], weights=weights)) if len(points) else None,
+            longitude=float(np.average(points[:, 1], weights=weights)) if len(points) else None,
+        ))
+    return result, np.array([remap[label] for label in labels.tolist()], dtype=np.int64)
+
+
+def load_geocode_caches(paths=GEOCODE_CACHES):
+    """(name, latitude, longitude) from the JSON geocode caches that exist"""
+    rows = []
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        for name, coordinates in data.items():
+            rows.append((name.strip(), coordinates.get('latitude'), coordinates.get('longitude')))
+    return rows
+
+
+class StopRegistry:
+    """Alias -> stop id and key -> stop id dicts"""
+
+    def __init__(self, alias_ids, key_ids):
+        self.alias_ids = alias_ids
+        self.key_ids = key_ids
+
+    @classmethod
+    def load(cls):
+        alias_ids = dict(StopAlias.objects.values_list('alias', 'stop_id'))
+        key_ids = {}
+        ambiguous = set()
+        for key, stop_id in Stop.objects.values_list('key', 'id'):
+            if key in key_ids:
+                ambiguous.add(key)  # Same key at several places: only exact aliases resolve
+            key_ids[key] = stop_id
+        for key in ambiguous:
+            del key_ids[key]
+        return cls(alias_ids, key_ids)
+
+    def resolve(self, name):
+        """Stop id of a spelling, or None"""
+        name = (name or '').strip()
+        stop_id = self.alias_ids.get(name)
+        if stop_id is None:
+            stop_id = self.key_ids.get(stop_key(name))
+        return stop_id
+
+
+_registry = None
+_registry_version = None
+_checked_at = 0.0
+_registry_lock = threading.Lock()
+
+
+def get_stop_registry():
+    """Process-wide registry, reloaded after build_stop_registry ran in any process"""
+    global _registry, _registry_version, _checked_at
+    now = time.monotonic()
+    registry = _registry
+    if registry is not None and now - _checked_at < CHECK_INTERVAL:
+        return registry
+    try:
+        version = cache.get(VERSION_KEY, 0)
+    except Exception as e:
+        print(f"DEBUG: Could not read the stop registry version from the cache: {e}")
+        version = _registry_version
+    with _registry_lock:
+        if _registry is None or version != _registry_version:
+            _registry = StopRegistry.load()
+            _registry_version = version
+        _checked_at = now
+        return _registry
+
+
+def resolve_stop_id(name):
+    return get_stop_registry().resolve(name)
+
+
+def resolve_stop_ids(names):
+    """Stop ids for many names (None where unknown), resolving each distinct name once"""
+    registry = get_stop_registry()
+    resolved = {name: registry.resolve(name) for name in set(names)}
+    return [resolved[name] for name in names]
+
+
+def invalidate_stop_registry():
+    global _registry
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    except Exception as e:
+        print(f"DEBUG: Could not bump the stop registry version in the cache: {e}")
+    with _registry_lock:
+        _registry = None
@@ -0,0 +1,156 @@
+"""
+Fuzzy stop-name search for autocomplete.
+
+An in-memory trigram index over labels (canonical stop names and every
+alias spelling). Each word of a label is padded ("  NEMOM " -> "  N",
+" NE", "NEM", "EMO", "MOM", "OM "), and every trigram maps to the sorted
+array of labels containing it. A query is normalised the same way, except
+that its last word gets no trailing pad because the user is still typing.
+The query's trigram postings are concatenated and counted with one
+np.bincount. Ranking is by:
+
+    1. labels starting with the query, then labels with a word starting
+       with its last word
+    2. trigram similarity, shared / (query + label - shared), which gives
+       typo tolerance ("KUMBALATHU NADA", "KUMBALATHUNADA", "KUMBALTHUNADA")
+    3. shorter labels
+
+Labels of the same stop collapse into one result, the best-ranked
+spelling. The registry and the route index give a few thousand labels, so a
+query takes well under a millisecond.
+"""
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from .models import Stop, StopAlias
+from .route_index import get_route_index
+from .stop_registry import get_stop_registry
+
+MAX_RESULTS = 50
+MIN_SIMILARITY = 0.2
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'[A-Z0-9]+', (text or '').upper()))
+
+
+def trigrams(text, partial=False):
+    """Trigrams of every word of a normalised text; `partial` leaves the last word open-ended"""
+    words = text.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f"  {word}" if partial and i == len(words) - 1 else f"  {word} "
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+
+class StopSearchIndex:
+    """
+    Trigram index over `labels`. `groups` says which labels are spellings of
+    the same stop (one result per group) and `records` holds the result
+    dict of each group.
+    """
+
+    def __init__(self, labels, groups=None, records=None):
+        self.labels = list(labels)
+        self.norms = np.array([normalize(label) for label in self.labels], dtype=str)
+        self.groups = np.asarray(groups if groups is not None else np.arange(len(self.labels)), dtype=np.int64)
+        self.records = records if records is not None else [{'name': label} for label in self.labels]
+        self.lengths = np.zeros(len(self.labels), dtype=np.float64)
+
+        postings = defaultdict(list)
+        for i, norm in enumerate(self.norms.tolist()):
+            grams = trigrams(norm)
+            self.lengths[i] = len(grams)
+            for gram in grams:
+                postings[gram].append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def search(self, query, limit=10):
+        """Best matches for `query`, one per stop: the record plus the matched spelling and score"""
+        query = normalize(query)
+        if not query:
+            return []
+        grams = trigrams(query, partial=True)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.labels)).astype(np.float64)
+        candidates = np.flatnonzero(shared)
+        similarity = shared[candidates] / (len(grams) + self.lengths[candidates] - shared[candidates])
+        # A label starting with a word has all of its trigrams, so only those are compared as strings
+        last_word = query.split()[-1]
+        complete = np.flatnonzero(shared[candidates] >= len(trigrams(last_word, partial=True)))
+        norms = self.norms[candidates[complete]]
+        starts = np.zeros(len(candidates), dtype=bool)
+        word_starts = np.zeros(len(candidates), dtype=bool)
+        starts[complete] = np.char.startswith(norms, query)
+        word_starts[complete] = np.char.startswith(norms, last_word) | (np.char.find(norms, ' ' + last_word) >= 0)
+        keep = starts | word_starts | (similarity >= MIN_SIMILARITY)
+        candidates, similarity, starts, word_starts = candidates[keep], similarity[keep], starts[keep], word_starts[keep]
+
+        order = np.lexsort((self.lengths[candidates], -similarity, ~word_starts, ~starts))
+        results, seen = [], set()
+        for position in order.tolist():
+            i = int(candidates[position])
+            group = int(self.groups[i])
+            if group in seen:
+                continue
+            seen.add(group)
+            results.append(dict(self.records[group], matched=self.labels[i], score=round(float(similarity[position]), 3)))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def build_stop_search_index(route_index):
+    """Canonical stops with their aliases, plus route stops the registry has not resolved"""
+    records, labels, groups = [], [], []
+    position = {}
+    for stop_id, name, latitude, longitude in Stop.objects.values_list('id', 'name', 'latitude', 'longitude'):
+        position[stop_id] = len(records)
+        records.append({'stop_id': stop_id, 'name': name, 'latitude': latitude, 'longitude': longitude})
+        labels.append(name)
+        groups.append(position[stop_id])
+    for alias, stop_id in StopAlias.objects.values_list('alias', 'stop_id'):
+        if stop_id in position and alias != records[position[stop_id]]['name']:
+            labels.append(alias)
+            groups.append(position[stop_id])
+
+    unresolved = {}
+    for name, latitude, longitude, stop_id in zip(
+        route_index.names.tolist(), route_index.latitudes.tolist(), route_index.longitudes.tolist(), route_index.stop_ids.tolist()
+    ):
+        name = name.strip()
+        if stop_id < 0 and name not in unresolved:
+            unresolved[name] = len(records)
+            records.append({'stop_id': None, 'name': name, 'latitude': latitude, 'longitude': longitude})
+            labels.append(name)
+            groups.append(unresolved[name])
+    return StopSearchIndex(labels, groups, records)
+
+
+_search = None
+_search_sources = (None, None)
+_search_lock = threading.Lock()
+
+
+def get_stop_search_index():
+    """Process-wide index, rebuilt after the stop registry or the route index changed"""
+    global _search, _search_sources
+    sources = (get_stop_registry(), get_route_index())
+    search = _search
+    if search is not None and all(a is b for a, b in zip(sources, _search_sources)):
+        return search
+    with _search_lock:
+        if _search is None or not all(a is b for a, b in zip(sources, _search_sources)):
+            _search = build_stop_search_index(sources[1])
+            _search_sources = sources
+        return _search
+
+
+def search_stops(query, limit=10):
+    return get_stop_search_index().search(query, limit=limit)
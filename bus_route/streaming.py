@@ -0,0 +1,89 @@
+"""
+Streamed JSON responses for large result sets.
+
+A view opts in with ?stream=ndjson or ?stream=json and passes a head dict,
+an iterator of rows and optionally a tail callable evaluated once the rows
+are exhausted (for totals computed along the way). Rows are encoded as
+they come from the cursor and flushed in ~64 KB chunks, so memory stays
+flat and the first bytes go out before the query has been read through.
+
+    ndjson:  {head}\n{row}\n{row}\n...{tail}\n
+    json:    {"head keys": ..., "<rows_key>": [{row}, {row}, ...], "tail keys": ...}
+
+An `envelope` (outer dict, key) nests that document under `key` of the
+outer dict, e.g. ({'success': True}, 'data') for {"success": true,
+"data": {...}}, so a streamed response parses like the buffered one; in
+ndjson the head line is nested the same way.
+
+Wrap the view in gzip_page for compression when the client accepts it;
+GZipMiddleware compresses streaming responses chunk by chunk.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+STREAM_FORMATS = ('ndjson', 'json')
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_format(request):
+    """'ndjson' or 'json' when the request asks for a streamed response, else None"""
+    value = request.GET.get('stream', '').lower()
+    return value if value in STREAM_FORMATS else None
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def _chunked(pieces):
+    """The head right away, then rows batched into CHUNK_SIZE writes"""
+    pieces = iter(pieces)
+    yield next(pieces).encode()
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _ndjson(head, rows, tail, envelope):
+    if envelope is not None:
+        outer, key = envelope
+        head = dict(outer, **{key: head})
+    yield _dumps(head) + '\n'
+    for row in rows:
+        yield _dumps(row) + '\n'
+    if tail is not None:
+        yield _dumps(tail()) + '\n'
+
+
+def _json(head, rows_key, rows, tail, envelope):
+    prefix = suffix = ''
+    if envelope is not None:
+        outer, key = envelope
+        prefix = _dumps(outer)[:-1] + (', ' if outer else '') + _dumps(key) + ': '
+        suffix = '}'
+    opening = _dumps(head)[:-1]
+    yield prefix + opening + (', ' if head else '') + _dumps(rows_key) + ': ['
+    for i, row in enumerate(rows):
+        yield (', ' if i else '') + _dumps(row)
+    closing = _dumps(tail()) if tail is not None else '{}'
+    yield ']' + (', ' + closing[1:] if closing != '{}' else '}') + suffix
+
+
+def streaming_json_response(fmt, head, rows_key, rows, tail=None, envelope=None):
+    """StreamingHttpResponse for `fmt` ('ndjson' or 'json') over head, rows and tail()"""
+    if fmt == 'ndjson':
+        pieces, content_type = _ndjson(head, rows, tail, envelope), 'application/x-ndjson'
+    else:
+        pieces, content_type = _json(head, rows_key, rows, tail, envelope), 'application/json'
+    response = StreamingHttpResponse(_chunked(pieces), content_type=content_type)
+    # Keep proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,158 @@
+from datetime import time
+
+import pandas as pd
 from django.test import TestCase
 
-# Create your tests here.
+from .departures import ScheduledTrips
+from .fare_stages import TICKET_COLUMNS, FareStageSegments, allocate_fare_stages
+from .journey_planner import JourneyPlanner
+from .models import Route, Schedule
+from .route_index import RouteIndex
+from .stop_matrix import StopMatrix
+
+# About 1.11 km between consecutive stops along the equator
+STEP = 0.01
+
+
+def add_route(route_no, stops):
+    """stops: (name, longitude step, fare stage) in order"""
+    Route.objects.bulk_create([
+        Route(route_no=route_no, order_sequence=i, stop_name=name, stop_latitude=0.0,
+              stop_longitude=position * STEP, fare_stage=fare_stage)
+        for i, (name, position, fare_stage) in enumerate(stops, start=1)
+    ])
+
+
+def add_trip(schedule_no, trip_no, route_no, start, end):
+    Schedule.objects.create(
+        route_no=route_no, schedule_no=schedule_no, trip_no=trip_no, source='', destination='',
+        service_type='ORDINARY', start_time=start, end_time=end,
+    )
+
+
+class JourneyPlannerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # R1 runs A-B-C, R2 runs C-D-E: the only way from A to E changes at C
+        add_route('R1', [('A', 0, True), ('B', 1, True), ('C', 2, False)])
+        add_route('R2', [('C', 2, True), ('D', 3, False), ('E', 4, False)])
+        add_trip('S1', 1, 'R1', time(8, 0), time(8, 20))
+        add_trip('S2', 1, 'R2', time(8, 21), time(8, 41))  # Leaves C before the transfer time has passed
+        add_trip('S3', 1, 'R2', time(8, 30), time(8, 50))
+
+    def setUp(self):
+        index = RouteIndex.build()
+        self.planner = JourneyPlanner(ScheduledTrips(index), index)
+
+    def plan(self, origin, destination, after):
+        return self.planner.plan(None, origin, None, destination, after)
+
+    def test_transfer_journey(self):
+        journey = self.plan('A', 'E', 7 * 60 + 50)
+        self.assertEqual(journey['transfers'], 1)
+        self.assertEqual([leg['schedule_no'] for leg in journey['legs']], ['S1', 'S3'])
+        self.assertEqual([(leg['from_stop'], leg['to_stop']) for leg in journey['legs']], [('A', 'C'), ('C', 'E')])
+        self.assertEqual(journey['arrival'], '08:50')
+        self.assertEqual(journey['duration_minutes'], 60)
+
+    def test_direct_journey_stays_on_the_trip(self):
+        journey = self.plan('A', 'C', 7 * 60 + 50)
+        self.assertEqual(journey['transfers'], 0)
+        self.assertEqual(journey['legs'][0]['stops'], 2)
+        self.assertEqual(journey['arrival'], '08:20')
+
+    def test_no_journey_found(self):
+        self.assertEqual(self.plan('A', 'E', 9 * 60), {'legs': []})
+        # Routes only run one way
+        self.assertEqual(self.plan('E', 'A', 7 * 60), {'legs': []})
+
+    def test_origin_equals_destination(self):
+        journey = self.plan('C', 'C', 8 * 60)
+        self.assertEqual(journey['legs'], [])
+        self.assertEqual(journey['transfers'], 0)
+        self.assertEqual(journey['duration_minutes'], 0)
+
+    def test_unknown_stop(self):
+        self.assertIsNone(self.plan('A', 'NOWHERE', 8 * 60))
+
+
+class FareStageAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Fare stages at A and B: segments A-B and B-C of equal length
+        add_route('R1', [('A', 0, True), ('B', 1, True), ('C', 2, False)])
+        # Loop X-Y-Z-X with a fare stage at Z: segments X-Z (2 steps) and Z-X (2 steps)
+        add_route('L1', [('X', 0, True), ('Y', 1, False), ('Z', 2, True), ('X', 0, False)])
+        add_trip('S1', 1, 'R1', time(8, 0), time(8, 20))
+        add_trip('SL', 1, 'L1', time(9, 0), time(9, 30))
+
+    def allocate(self, rows):
+        segments = FareStageSegments(RouteIndex.build())
+        allocation, unplaced = allocate_fare_stages(pd.DataFrame(rows, columns=TICKET_COLUMNS), segments)
+        stages = {
+            (row['schedule_no'], row['stage']): row
+            for row in allocation.to_dict('records')
+        }
+        return stages, unplaced
+
+    def test_revenue_split_by_km_and_conserved(self):
+        stages, unplaced = self.allocate([
+            ('S1', 1, 'A', 'C', 2, 20.0),
+            ('S1', 1, 'B', 'C', 1, 5.0),
+        ])
+        self.assertEqual(unplaced, 0)
+        self.assertAlmostEqual(stages[('S1', 0)]['revenue'], 10.0, places=2)
+        self.assertAlmostEqual(stages[('S1', 1)]['revenue'], 15.0, places=2)
+        self.assertEqual((stages[('S1', 0)]['passengers'], stages[('S1', 1)]['passengers']), (2, 3))
+        self.assertEqual((stages[('S1', 0)]['boardings'], stages[('S1', 1)]['boardings']), (2, 1))
+        self.assertAlmostEqual(sum(row['revenue'] for row in stages.values()), 25.0, places=2)
+
+    def test_ticket_on_loop_route(self):
+        # X is both the first and the last stop: a ticket from Y alights at the last one
+        stages, unplaced = self.allocate([('SL', 1, 'Y', 'X', 1, 30.0)])
+        self.assertEqual(unplaced, 0)
+        self.assertEqual((stages[('SL', 0)]['from_stop_name'], stages[('SL', 1)]['to_stop_name']), ('X', 'X'))
+        self.assertAlmostEqual(stages[('SL', 0)]['revenue'], 10.0, places=2)
+        self.assertAlmostEqual(stages[('SL', 1)]['revenue'], 20.0, places=2)
+        self.assertEqual((stages[('SL', 0)]['boardings'], stages[('SL', 1)]['boardings']), (1, 0))
+
+    def test_unplaced_tickets_are_counted_and_skipped(self):
+        stages, unplaced = self.allocate([
+            ('S1', 1, 'A', 'B', 1, 8.0),
+            ('S1', 1, 'A', 'NOWHERE', 1, 50.0),  # Stop not on the route
+            ('S1', 1, 'C', 'A', 1, 50.0),  # Against the direction of travel
+            ('S9', 1, 'A', 'B', 1, 50.0),  # Unknown trip
+        ])
+        self.assertEqual(unplaced, 3)
+        self.assertEqual(list(stages), [('S1', 0)])
+        self.assertAlmostEqual(stages[('S1', 0)]['revenue'], 8.0, places=2)
+
+
+class StopMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Same network as the journey planner: A-B-C on R1, C-D-E on R2
+        add_route('R1', [('A', 0, True), ('B', 1, True), ('C', 2, False)])
+        add_route('R2', [('C', 2, True), ('D', 3, False), ('E', 4, False)])
+        add_trip('S1', 1, 'R1', time(8, 0), time(8, 20))
+        add_trip('S3', 1, 'R2', time(8, 30), time(8, 50))
+
+    def setUp(self):
+        index = RouteIndex.build()
+        self.matrix = StopMatrix.build(index, ScheduledTrips(index))
+        self.step_km = index.get('R1').cumulative_km[1]
+
+    def between(self, origin, destination):
+        return self.matrix.between(self.matrix.find(None, origin), self.matrix.find(None, destination))
+
+    def test_distance_and_time_across_routes(self):
+        km, minutes = self.between('A', 'E')
+        self.assertAlmostEqual(km, 4 * self.step_km, places=3)
+        # Riding time only: 20 minutes on each trip, the wait at C is not an edge
+        self.assertAlmostEqual(minutes, 40, places=3)
+
+    def test_unreachable_against_direction(self):
+        self.assertEqual(self.between('E', 'A'), (None, None))
+
+    def test_unknown_stop(self):
+        self.assertIsNone(self.matrix.find(None, 'NOWHERE'))
@@ -12,6 +12,12 @@ urlpatterns = [
     path('analyzer/', views.enhanced_schedule_analyzer_view, name='enhanced_schedule_analyzer'),
     path('submit/', views.schedule_submit_view, name='schedule_submit'),
     path('api/route-details/', views.get_route_details, name='get_route_details'),
+    path('api/geojson/<str:route_no>/', views.route_geojson_api, name='route_geojson_api'),
+    path('api/stops/nearby/', views.nearby_stops_api, name='nearby_stops_api'),
+    path('api/stops/search/', views.stop_search_api, name='stop_search_api'),
+    path('api/stops/distance/', views.stop_distance_api, name='stop_distance_api'),
+    path('api/departures/', views.departures_api, name='departures_api'),
+    path('api/journey/', views.journey_api, name='journey_api'),
     path('revenue-analysis/', views.revenue_analysis, name='revenue_analysis'),
     path('trip-revenue-analysis/', views.trip_revenue_analysis, name='trip_revenue_analysis'),
 
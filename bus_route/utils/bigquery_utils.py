@@ -2,7 +2,6 @@ from google.cloud import bigquery
 from django.conf import settings
 import pandas as pd
 import logging
-from bus_route.models import Route, Schedule  # Add Schedule import here
 
 logger = logging.getLogger(__name__)
 
@@ -47,33 +46,25 @@ def fetch_trip_revenue_data(schedule_no, trip_no, date=None):
         # Return empty DataFrame instead of raising exception
         return pd.DataFrame()
 
-def calculate_fare_stage_revenue(schedule_no, trip_no, date=None):
-    """Calculate revenue for each fare stage"""
-    try:
-        # Get revenue data
-        df = fetch_trip_revenue_data(schedule_no, trip_no, date)
-        if df.empty:
-            return pd.DataFrame()
-            
-        # Try to get route data from the database to identify fare stages
-        routes = Route.objects.filter(
-            route_no=(
-                Schedule.objects.filter(schedule_no=schedule_no.upper(), trip_no=trip_no)
-                .first().route_no if Schedule.objects.filter(schedule_no=schedule_no.upper(), trip_no=trip_no).exists() else ""
-            )
-        ).order_by('order_sequence')
-        
-        # If routes exist, mark fare stages in the revenue data
-        fare_stages = []
-        if routes:
-            for route in routes:
-                if route.fare_stage:
-                    fare_stages.append(route.stop_name)
-            
-            # Add fare_stage column to DataFrame
-            df['IS_FARE_STAGE'] = df['TO_STOP_NAME'].apply(lambda x: x in fare_stages)
-            
-        return df
-    except Exception as e:
-        logger.error(f"Error calculating fare stage revenue: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+def fetch_day_ticket_data(date):
+    """Ticket passengers and revenue of every trip on `date`, one row per (schedule, trip, from stop, to stop)"""
+    client = get_bigquery_client()
+
+    query = f"""
+    SELECT
+        SCHEDULE_NUMBER,
+        TRIP_NUMBER,
+        FROM_STOP_NAME,
+        TO_STOP_NAME,
+        SUM(TOTAL_PASSENGER) AS PASSENGERS,
+        SUM(amount) AS REVENUE
+    FROM `{settings.GCP_PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TICKET_TABLE}`
+    WHERE CAST(TICKET_ISSUE_DATE AS DATE) = @date
+      AND SCHEDULE_NUMBER IS NOT NULL
+      AND TRIP_NUMBER IS NOT NULL
+    GROUP BY SCHEDULE_NUMBER, TRIP_NUMBER, FROM_STOP_NAME, TO_STOP_NAME
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter('date', 'DATE', date)])
+
+    logger.info(f"Executing BigQuery ticket query for {date}")
+    return client.query(query, job_config=job_config).to_dataframe()
@@ -1,19 +1,29 @@
 import os
 import json
-import googlemaps
 from geopy.geocoders import Nominatim
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.conf import settings
 from django.contrib import messages
-from folium.plugins import MarkerCluster
-import folium
 import dotenv
 from dotenv import load_dotenv
-import polyline  # Required for decoding Google Maps encoded polylines
 import pandas as pd
 from datetime import datetime
-from .models import Schedule, Route, Trip
+from .models import Schedule, Route, Trip, FareStageRevenue
+from .geometry import get_geometry, route_geojson, stops_fingerprint
+from .models import RouteGeometry
+import hashlib
+from .route_index import get_route_stops
+from .stop_locator import nearest_stops, MAX_RESULTS
+from .departures import current_minute, get_departure_board
+from .journey_planner import get_journey_planner
+from .stop_matrix import get_stop_matrix
+from .stop_registry import resolve_stop_id
+from .stop_search import search_stops, MAX_RESULTS as MAX_SEARCH_RESULTS
+from .revenue_series import columnar, date_range, iter_revenue_series, revenue_matrix, schedule_revenue_rows, trip_revenue_rows
+from .streaming import stream_format, streaming_json_response
 from datetime import datetime
 from django.shortcuts import render, get_object_or_404
 # Load environment variables
@@ -25,8 +35,7 @@ if not GMAP_API_KEY:
 else:
     print("DEBUG: GMAP_API_KEY loaded:", GMAP_API_KEY)
 
-# Google Maps API setup
-gmaps = googlemaps.Client(key=GMAP_API_KEY)
+# Geocoder setup (road geometry for maps comes from bus_route/geometry.py)
 geolocator = Nominatim(user_agent="bus_stop_locator")
 
 # Coordinates bounds for South India (customize as needed)
@@ -37,6 +46,7 @@ SOUTH_INDIA_LON_MAX = 82.0
 
 # Path to your geocoded stops JSON file
 GEO_CACHE_FILE = 'bus_route/geocoded_stops.json'
+GEOCODE_MATCH_SIMILARITY = 0.5  # Registry matches weaker than this are different stops
 
 
 # Function to check if coordinates are within South India region
@@ -66,93 +76,19 @@ def geocode_stop_name(stop_name, cached_data):
         print(f"DEBUG: Using cached data for {stop_name}")
         return cached_data[stop_name]['latitude'], cached_data[stop_name]['longitude']
     
+    # Misspelt or unseen spellings: closest located stop in the registry
+    for match in search_stops(stop_name, limit=3):
+        if match['score'] >= GEOCODE_MATCH_SIMILARITY and match['latitude'] is not None:
+            print(f"DEBUG: Using registry stop {match['name']} for {stop_name}")
+            return match['latitude'], match['longitude']
+
     print(f"DEBUG: No cached data found for {stop_name}\n\n")
     return None, None
 
-def create_map(bus_stops):
-    if not bus_stops or len(bus_stops) < 2:
-        print("DEBUG: Not enough bus stops provided to create map.")
-        return None
-
-    # Create a Folium map centered on a default location (adjust as needed)
-    map_center = [8.4869, 76.9529]
-    map = folium.Map(location=map_center, zoom_start=13)
-    print(f"DEBUG: Creating map centered at {map_center}")
-
-    # Add numbered markers for each bus stop in order
-    marker_cluster = MarkerCluster().add_to(map)
-    for index, stop in enumerate(bus_stops, start=1):
-        lat = stop['latitude']
-        lon = stop['longitude']
-        popup_text = f"{index}. {stop['name']}"
-        print(f"DEBUG: Adding marker for stop '{stop['name']}' as #{index} at ({lat}, {lon})")
-        folium.Marker(
-            [lat, lon],
-            popup=popup_text,
-            icon=folium.DivIcon(html=f"""<div style="font-size: 42pt; color:red"><b>{index}</b></div>""")
-        ).add_to(marker_cluster)
-
-    # Divide bus stops into segments of up to 20 stops (with one-stop overlap between segments)
-    segment_size = 20
-    segments = []
-    i = 0
-    while i < len(bus_stops):
-        # For each segment, include up to segment_size stops
-        segment = bus_stops[i:i + segment_size]
-        # If not the first segment, ensure continuity by overlapping the first stop with the previous segment's last stop
-        if i != 0 and segment:
-            segment = [bus_stops[i - 1]] + segment
-        segments.append(segment)
-        # Move index forward by segment_size - 1 to have an overlap
-        i += segment_size - 1
-
-    # Define a cyclic list of colors for the route segments
-    colors = ['blue', 'red', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'darkgreen', 'darkpurple', 'pink']
-
-    # For each segment, request directions from Google Maps and add the polyline with a distinct color
-    for seg_index, segment in enumerate(segments):
-        # Extract latitude/longitude tuples for this segment
-        waypoints = [(stop['latitude'], stop['longitude']) for stop in segment]
-        if len(waypoints) < 2:
-            print(f"DEBUG: Segment {seg_index + 1} has insufficient waypoints.")
-            continue
-
-        origin = waypoints[0]
-        destination = waypoints[-1]
-        intermediate_waypoints = waypoints[1:-1]
-
-        try:
-            print(f"DEBUG: Requesting directions for segment {seg_index + 1}: origin {origin}, destination {destination}, waypoints {intermediate_waypoints}")
-            route = gmaps.directions(
-                origin=origin,
-                destination=destination,
-                waypoints=intermediate_waypoints,
-                mode="driving",
-            )
-            if route:
-                overview_poly = route[0].get('overview_polyline', {}).get('points')
-                if overview_poly:
-                    print(f"DEBUG: Decoding polyline for segment {seg_index + 1}.")
-                    decoded_points = polyline.decode(overview_poly)
-                    color = colors[seg_index % len(colors)]
-                    print(f"DEBUG: Drawing segment {seg_index + 1} with color {color}.")
-                    folium.PolyLine(decoded_points, color=color, weight=2.5, opacity=1).add_to(map)
-                else:
-                    print(f"DEBUG: No overview polyline found for segment {seg_index + 1}.")
-            else:
-                print(f"DEBUG: No route found for segment {seg_index + 1}.")
-        except Exception as e:
-            print(f"DEBUG: Exception while retrieving route for segment {seg_index + 1}: {e}")
-
-    return map
-
-
-
-
-def create_enhanced_map(bus_stops):
+def create_enhanced_map(bus_stops, route_no=None):
     """
-    Create a Google Maps visualization for the bus stops and route using Directions API
-    with proper handling of routes with many stops
+    Create a Google Maps visualization for the bus stops and route.
+    The road path is the stored route geometry (no Directions requests from the browser).
     """
     if not bus_stops or len(bus_stops) < 2:
         return None
@@ -170,6 +106,7 @@ def create_enhanced_map(bus_stops):
         'is_fare_stage': stop.get('is_fare_stage', False),
         'revenue': float(stop.get('revenue', 0))
     } for stop in bus_stops])
+    geometry_json = json.dumps(get_geometry(bus_stops, route_no))
     
     # Generate HTML for Google Maps
     map_html = f"""
@@ -177,8 +114,9 @@ def create_enhanced_map(bus_stops):
     <script>
         // Initialize the map once the Google Maps API is loaded
         function initMap() {{
-            // Parse the bus stops data
+            // Parse the bus stops data and the stored road geometry
             const busStops = {stops_json};
+            const geometry = {geometry_json};
             
             // Check if we have stops to display
             if (busStops.length < 1) {{
@@ -270,92 +208,24 @@ def create_enhanced_map(bus_stops):
             // Add legend to the map
             map.controls[google.maps.ControlPosition.RIGHT_BOTTOM].push(legend);
             
-            // Connect stops with road segments by breaking into pairs
-            async function connectStopsAlongRoads() {{
-                if (busStops.length < 2) return;
-                
-                const directionsService = new google.maps.DirectionsService();
-                
-                // Process pairs of stops (from A to B, B to C, C to D, etc.)
-                for (let i = 0; i < busStops.length - 1; i++) {{
-                    const startStop = busStops[i];
-                    const endStop = busStops[i + 1];
-                    
-                    try {{
-                        // Request directions between this pair of stops
-                        const result = await new Promise((resolve, reject) => {{
-                            directionsService.route(
-                                {{
-                                    origin: {{ lat: startStop.lat, lng: startStop.lng }},
-                                    destination: {{ lat: endStop.lat, lng: endStop.lng }},
-                                    travelMode: google.maps.TravelMode.DRIVING,
-                                }},
-                                (response, status) => {{
-                                    if (status === 'OK') {{
-                                        resolve(response);
-                                    }} else {{
-                                        reject(new Error(`Directions request failed: ${{status}}`));
-                                    }}
-                                }}
-                            );
-                        }});
-                        
-                        // Extract the route
-                        const route = result.routes[0];
-                        
-                        // Draw this segment with a custom polyline
-                        const path = route.overview_path;
-                        const routeSegment = new google.maps.Polyline({{
-                            path: path,
-                            geodesic: true,
-                            strokeColor: '#4285F4',
-                            strokeOpacity: 0.8,
-                            strokeWeight: 5,
-                            map: map
-                        }});
-                        
-                        console.log(`Successfully drew segment from stop ${{i}} to ${{i+1}}`);
-                        
-                        // Add a small delay between requests to avoid rate limiting
-                        await new Promise(resolve => setTimeout(resolve, 300));
-                        
-                    }} catch (error) {{
-                        console.error(`Error connecting stops ${{i}} and ${{i+1}}: ${{error.message}}`);
-                        
-                        // If the directions service fails, draw a straight line as fallback
-                        const straightLine = new google.maps.Polyline({{
-                            path: [
-                                {{ lat: startStop.lat, lng: startStop.lng }},
-                                {{ lat: endStop.lat, lng: endStop.lng }}
-                            ],
-                            geodesic: true,
-                            strokeColor: '#FF0000', // Red for fallback lines
-                            strokeOpacity: 0.6,
-                            strokeWeight: 4,
-                            map: map
-                        }});
-                    }}
-                }}
-            }}
-            
-            // Connect all stops along roads
-            connectStopsAlongRoads().catch(error => {{
-                console.error('Failed to connect stops along roads:', error);
-                
-                // Fallback to a single polyline for the entire route
-                const routePath = busStops.map(stop => ({{ lat: stop.lat, lng: stop.lng }}));
-                const routeLine = new google.maps.Polyline({{
-                    path: routePath,
+            // Draw the stored road geometry, one polyline per stop-to-stop segment
+            const path = google.maps.geometry.encoding.decodePath(geometry.polyline);
+            const straightSegments = new Set(geometry.straight_segments);
+            for (let i = 0; i < geometry.stop_points.length - 1; i++) {{
+                const straight = straightSegments.has(i);
+                new google.maps.Polyline({{
+                    path: path.slice(geometry.stop_points[i], geometry.stop_points[i + 1] + 1),
                     geodesic: true,
-                    strokeColor: '#3388ff',
-                    strokeOpacity: 0.8,
-                    strokeWeight: 4,
+                    // Red for segments without road geometry (straight-line fallback)
+                    strokeColor: straight ? '#FF0000' : '#4285F4',
+                    strokeOpacity: straight ? 0.6 : 0.8,
+                    strokeWeight: straight ? 4 : 5,
                     map: map
                 }});
-            }});
+            }}
         }}
     </script>
-    <script src="https://maps.googleapis.com/maps/api/js?key={gmap_api_key}&callback=initMap"></script>
+    <script src="https://maps.googleapis.com/maps/api/js?key={gmap_api_key}&libraries=geometry&callback=initMap"></script>
     """
     
     return map_html
@@ -390,21 +260,41 @@ def bus_route_view(request):
                 'error_message': 'No valid bus stops were found. Please try again with different names.'
             })
 
-        # Create the map with bus stops and route
-        map_object = create_map(bus_stops)
-        if not map_object:
+        if len(bus_stops) < 2:
             print("DEBUG: Map creation failed due to insufficient bus stops.")
             return render(request, 'bus_route/bus_route_form.html', {
                 'error_message': 'Not enough bus stops to create a route. At least two stops are required.'
             })
 
-        map_html = map_object._repr_html_()  # Convert the folium map to HTML for embedding
-        print("DEBUG: Map created successfully. Rendering map HTML.")
-        return render(request, 'bus_route/bus_route_map.html', {'map_html': map_html})
+        # The browser draws the stops and stored road geometry (no server-side map rendering)
+        print("DEBUG: Rendering client-side map from GeoJSON.")
+        return render(request, 'bus_route/bus_route_map.html', {'geojson': route_geojson(bus_stops)})
 
     print("DEBUG: Rendering bus route form.")
     return render(request, 'bus_route/bus_route_form.html')
 
+def route_geojson_etag(request, route_no):
+    """Changes whenever the route's stops or its stored road geometry change"""
+    route_stops = get_route_stops(route_no)
+    if route_stops is None:
+        return None
+    updated_at = RouteGeometry.objects.filter(route_no=route_no.upper()).values_list('updated_at', flat=True).first()
+    return hashlib.sha1(f"{stops_fingerprint(route_stops.stop_dicts())}:{updated_at}".encode()).hexdigest()
+
+
+@gzip_page
+@condition(etag_func=route_geojson_etag)
+def route_geojson_api(request, route_no):
+    """Stops and stored road geometry of a route as compact GeoJSON"""
+    route_stops = get_route_stops(route_no)
+    if route_stops is None:
+        return JsonResponse({"error": f"Route {route_no} not found."}, status=404)
+    body = json.dumps(route_geojson(route_stops.stop_dicts(), route_stops.route_no), separators=(',', ':'))
+    response = HttpResponse(body, content_type='application/geo+json')
+    response['Cache-Control'] = 'no-cache'  # Always revalidate; unchanged routes answer 304 from the ETag
+    return response
+
+
 def get_route_details(request):
     if request.method != 'GET':
         return HttpResponseBadRequest("Only GET method is allowed.")
@@ -426,21 +316,157 @@ def get_route_details(request):
     except Schedule.DoesNotExist:
         return JsonResponse({"error": "Schedule not found."}, status=404)
     
-    # Retrieve all Route objects that match the schedule's route_no, ordered by the sequence number.
-    routes = Route.objects.filter(route_no=schedule.route_no.upper()).order_by('order_sequence')
+    # The route's stops in sequence order, from the in-process route index
+    route_stops = get_route_stops(schedule.route_no)
     
     # Prepare the response data with each key as the sequence number.
     data = {}
-    for route in routes:
-        data[route.order_sequence] = {
-            "stop_name": route.stop_name,
-            "latitude": route.stop_latitude,
-            "longitude": route.stop_longitude,
+    for stop in (route_stops.stop_dicts() if route_stops is not None else []):
+        data[stop['sequence']] = {
+            "stop_name": stop['name'],
+            "latitude": stop['latitude'],
+            "longitude": stop['longitude'],
+            "distance_km": stop['distance_km'],
         }
     
     return JsonResponse(data)
 
 
+def nearby_stops_api(request):
+    """
+    Stops nearest to a coordinate, with the routes serving each.
+
+    Query parameters: lat, lon, k (default 5, at most MAX_RESULTS) and an
+    optional radius in metres.
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Only GET method is allowed.")
+
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+        k = int(request.GET.get('k', 5))
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except KeyError:
+        return HttpResponseBadRequest("Missing required parameters: lat and lon.")
+    except ValueError:
+        return HttpResponseBadRequest("Invalid parameters. lat, lon and radius are numbers, k is an integer.")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or k < 1 or (radius is not None and radius <= 0):
+        return HttpResponseBadRequest("Coordinates out of range, or k/radius not positive.")
+
+    stops = nearest_stops(lat, lon, k=min(k, MAX_RESULTS), radius=radius)
+
+    # Routes near the point, each with the distance to its closest stop
+    routes = {}
+    for stop in stops:
+        for route_no in stop['routes']:
+            routes.setdefault(route_no, stop['distance_m'])
+    return JsonResponse({
+        'lat': lat,
+        'lon': lon,
+        'radius': radius,
+        'stops': stops,
+        'routes': [{'route_no': route_no, 'distance_m': distance} for route_no, distance in routes.items()],
+    })
+
+
+def stop_search_api(request):
+    """
+    Stop-name autocomplete.
+
+    Query parameters: q (part of a stop name, typos allowed) and limit
+    (default 10, at most MAX_SEARCH_RESULTS). Each result is a canonical
+    stop with the spelling that matched.
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Only GET method is allowed.")
+
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid parameters. limit is an integer.")
+    if limit < 1:
+        return HttpResponseBadRequest("limit must be positive.")
+
+    return JsonResponse({'q': query, 'stops': search_stops(query, limit=min(limit, MAX_SEARCH_RESULTS))})
+
+
+def departures_api(request):
+    """
+    Departure board for a stop.
+
+    Query parameters: stop (any spelling the stop registry knows), after
+    (HH:MM, default now in timetable time), window in minutes (default 60)
+    and limit (default 50).
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Only GET method is allowed.")
+
+    stop = request.GET.get('stop', '').strip()
+    if not stop:
+        return HttpResponseBadRequest("Missing required parameter: stop.")
+    try:
+        if request.GET.get('after'):
+            after_time = datetime.strptime(request.GET['after'], '%H:%M')
+            after = after_time.hour * 60 + after_time.minute
+        else:
+            after = current_minute()
+        window = min(int(request.GET.get('window', 60)), 24 * 60)
+        limit = min(int(request.GET.get('limit', 50)), 500)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid parameters. after uses HH:MM, window and limit are integers.")
+    if window < 1 or limit < 1:
+        return HttpResponseBadRequest("window and limit must be positive.")
+
+    stop_id = resolve_stop_id(stop)
+    departures = get_departure_board().departures(stop_id, stop, after, window=window, limit=limit)
+    if departures is None:
+        return JsonResponse({"error": f"No scheduled trips serve stop {stop}."}, status=404)
+    return JsonResponse({
+        'stop': stop,
+        'stop_id': stop_id,
+        'after': f"{after // 60:02d}:{after % 60:02d}",
+        'window': window,
+        'departures': departures,
+    })
+
+
+def journey_api(request):
+    """
+    Earliest-arrival journey between two stops, with transfers where routes share a stop.
+
+    Query parameters: from and to (any spelling the stop registry knows)
+    and after (HH:MM, default now in timetable time).
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Only GET method is allowed.")
+
+    origin = request.GET.get('from', '').strip()
+    destination = request.GET.get('to', '').strip()
+    if not origin or not destination:
+        return HttpResponseBadRequest("Missing required parameters: from and to.")
+    try:
+        if request.GET.get('after'):
+            after_time = datetime.strptime(request.GET['after'], '%H:%M')
+            after = after_time.hour * 60 + after_time.minute
+        else:
+            after = current_minute()
+    except ValueError:
+        return HttpResponseBadRequest("Invalid parameter. after uses HH:MM.")
+
+    journey = get_journey_planner().plan(
+        resolve_stop_id(origin), origin, resolve_stop_id(destination), destination, after
+    )
+    if journey is None:
+        return JsonResponse({"error": "No scheduled trips serve one of the stops."}, status=404)
+    return JsonResponse(dict(journey, **{
+        'from': origin,
+        'to': destination,
+        'after': f"{after // 60:02d}:{after % 60:02d}",
+    }))
+
+
 def bus_route_by_schedule_view(request):
     if request.method == 'POST':
         # Get schedule and trip numbers from the form
@@ -465,26 +491,18 @@ def bus_route_by_schedule_view(request):
                 'error_message': 'Schedule not found.'
             })
         
-        # Get all Route objects for the schedule's route, ordered by sequence number
-        routes = Route.objects.filter(route_no=schedule.route_no.upper()).order_by('order_sequence')
-        if not routes:
+        # Get the schedule's route stops, ordered by sequence number, from the route index
+        route_stops = get_route_stops(schedule.route_no)
+        if route_stops is None:
             return render(request, 'bus_route/bus_route_schedule_form.html', {
                 'error_message': 'No route stops found for this schedule.'
             })
         
         # Build bus_stops list (each with name, latitude, longitude)
-        bus_stops = []
-        for route in routes:
-            bus_stops.append({
-                'name': route.stop_name,
-                'latitude': route.stop_latitude,
-                'longitude': route.stop_longitude,
-                'is_fare_stage': route.fare_stage,
-                'sequence': route.order_sequence
-            })
+        bus_stops = route_stops.stop_dicts()
         
         # Create the map with bus stops and route using enhanced map
-        map_html = create_enhanced_map(bus_stops)
+        map_html = create_enhanced_map(bus_stops, schedule.route_no)
         if not map_html:
             return render(request, 'bus_route/bus_route_schedule_form.html', {
                 'error_message': 'Not enough bus stops to create a route. At least two stops are required.'
@@ -585,25 +603,17 @@ def trip_map_view(request, schedule_no, trip_no,route_no):
         trip = Trip.objects.filter(schedule_no=schedule_no, trip_no=trip_no).order_by('-date').first()
         
         # Get route stops
-        routes = Route.objects.filter(route_no=route_no).order_by('order_sequence')
+        route_stops = get_route_stops(route_no)
         
-        if not routes:
+        if route_stops is None:
             messages.error(request, 'No route stops found for this schedule.')
             return redirect('trip_list_view', schedule_no=schedule_no)
         
         # Build bus_stops list
-        bus_stops = []
-        for route in routes:
-            bus_stops.append({
-                'name': route.stop_name,
-                'latitude': route.stop_latitude,
-                'longitude': route.stop_longitude,
-                'is_fare_stage': route.fare_stage,
-                'sequence': route.order_sequence
-            })
+        bus_stops = route_stops.stop_dicts()
         
         # Create map
-        map_html = create_enhanced_map(bus_stops)
+        map_html = create_enhanced_map(bus_stops, route_no)
         if not map_html:
             messages.error(request, 'Not enough bus stops to create a route.')
             return redirect('trip_list_view', schedule_no=schedule_no)
@@ -701,18 +711,39 @@ def schedule_submit_view(request):
     return render(request, 'bus_route/schedule_submit.html')
 
 
-def fetch_trip_revenue_data(schedule_no, trip_no, date=None):
-    """Fetch revenue data for a specific trip (placeholder function)"""
-    # This would normally query BigQuery or another data source
-    # For now, return an empty DataFrame
-    return pd.DataFrame()
+def stop_distance_api(request):
+    """
+    Shortest network distance and scheduled travel time between two stops,
+    from the precomputed stop matrix (manage.py build_stop_matrix).
+
+    Query parameters: from and to (any spelling the stop registry knows).
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Only GET method is allowed.")
 
+    origin = request.GET.get('from', '').strip()
+    destination = request.GET.get('to', '').strip()
+    if not origin or not destination:
+        return HttpResponseBadRequest("Missing required parameters: from and to.")
 
-def calculate_fare_stage_revenue(schedule_no, trip_no, date=None):
-    """Calculate revenue for each fare stage (placeholder function)"""
-    # This would normally perform calculations based on BigQuery data
-    # For now, return an empty DataFrame
-    return pd.DataFrame()
+    try:
+        matrix = get_stop_matrix()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Stop matrix has not been built yet. Run manage.py build_stop_matrix.'}, status=503)
+
+    origin_id, destination_id = resolve_stop_id(origin), resolve_stop_id(destination)
+    origin_row, destination_row = matrix.find(origin_id, origin), matrix.find(destination_id, destination)
+    if origin_row is None or destination_row is None:
+        return JsonResponse({"error": "One of the stops is not on any route."}, status=404)
+    km, minutes = matrix.between(origin_row, destination_row)
+    return JsonResponse({
+        'from': origin,
+        'to': destination,
+        'from_stop_id': origin_id,
+        'to_stop_id': destination_id,
+        'distance_km': round(km, 2) if km is not None else None,
+        'scheduled_minutes': round(minutes) if minutes is not None else None,
+    })
 
 
 def enhanced_schedule_analyzer_view(request):
@@ -744,88 +775,74 @@ def enhanced_schedule_analyzer_view(request):
             })
         
         # Get route data
-        routes = Route.objects.filter(route_no=schedule.route_no.upper()).order_by('order_sequence')
-        if not routes:
+        route_stops = get_route_stops(schedule.route_no)
+        if route_stops is None:
             return render(request, 'bus_route/enhanced_schedule_form.html', {
                 'error_message': 'No route stops found for this schedule.'
             })
         
         # Get trip data (from database if exists)
         trip = None
+        parsed_date = None
         try:
             if date:
                 parsed_date = datetime.strptime(date, '%Y-%m-%d').date()
-                trip = Trip.objects.get(date=parsed_date, schedule_no=schedule, trip_no=trip_no_int)
+                trip = Trip.objects.get(date=parsed_date, schedule_no=schedule.schedule_no, trip_no=trip_no_int)
             else:
                 # Get most recent trip
-                trip = Trip.objects.filter(schedule_no=schedule, trip_no=trip_no_int).order_by('-date').first()
+                trip = Trip.objects.filter(schedule_no=schedule.schedule_no, trip_no=trip_no_int).order_by('-date').first()
         except Trip.DoesNotExist:
             pass
         
-        # Fetch revenue data (dummy function for now)
-        try:
-            revenue_data = fetch_trip_revenue_data(schedule_no, trip_no, date)
-            fare_stage_data = calculate_fare_stage_revenue(schedule_no, trip_no, date)
-        except Exception as e:
-            # If there's an error, use existing data if available
-            revenue_data = pd.DataFrame()
-            fare_stage_data = pd.DataFrame()
-            if trip:
-                print(f"Using existing trip data due to error: {str(e)}")
-            else:
-                print(f"Error fetching data: {str(e)}")
+        # Fare-stage passengers and revenue, allocated in batch by manage.py allocate_fare_stage_revenue
+        stage_rows = FareStageRevenue.objects.filter(schedule_no=schedule.schedule_no, trip_no=trip_no_int)
+        stage_date = parsed_date or stage_rows.order_by('-date').values_list('date', flat=True).first()
+        stage_rows = list(stage_rows.filter(date=stage_date).order_by('stage'))
         
-        # Calculate EPKM
-        if not revenue_data.empty and 'REVENUE' in revenue_data.columns and 'DISTANCE' in revenue_data.columns:
-            total_revenue = revenue_data['REVENUE'].sum()
-            total_distance = revenue_data['DISTANCE'].mean() * len(routes)
-            epkm = total_revenue / total_distance if total_distance > 0 else 0
-        elif trip and trip.revenue is not None and trip.distance_km is not None and trip.distance_km > 0:
+        # Calculate EPKM over the trip's length (manage.py build_stop_matrix fills missing trip_km)
+        trip_km = schedule.trip_km
+        if stage_rows and trip_km:
+            total_revenue = sum(row.revenue for row in stage_rows)
+            total_distance = trip_km
+            epkm = total_revenue / total_distance
+        elif trip and trip.revenue is not None and trip_km:
             # Fall back to trip data if available
             total_revenue = trip.revenue
-            total_distance = trip.distance_km
-            epkm = trip.epkm or 0
+            total_distance = trip_km
+            epkm = total_revenue / total_distance
         else:
             total_revenue = 0
             total_distance = 0
             epkm = 0
         
-        # Build bus_stops list with revenue data
-        bus_stops = []
-        for route in routes:
-            stop_data = {
-                'name': route.stop_name,
-                'latitude': route.stop_latitude,
-                'longitude': route.stop_longitude,
-                'is_fare_stage': route.fare_stage,
-                'sequence': route.order_sequence,
-                'revenue': 0  # Default value
-            }
-            
-            # Add revenue data if available
-            if not revenue_data.empty and 'TO_STOP_NAME' in revenue_data.columns and 'REVENUE' in revenue_data.columns:
-                stop_revenue = revenue_data[revenue_data['TO_STOP_NAME'] == route.stop_name]['REVENUE'].sum()
-                stop_data['revenue'] = stop_revenue
-            
-            bus_stops.append(stop_data)
+        # Each stage's revenue is shown at the stop where the stage starts
+        bus_stops = route_stops.stop_dicts()
+        stage_starts = [i for i, stop in enumerate(bus_stops[:-1]) if i == 0 or stop['is_fare_stage']]
+        for stop in bus_stops:
+            stop['revenue'] = 0
+        for row in stage_rows:
+            if row.stage < len(stage_starts):
+                bus_stops[stage_starts[row.stage]]['revenue'] = row.revenue
         
         # Create map
-        map_html = create_enhanced_map(bus_stops)
+        map_html = create_enhanced_map(bus_stops, schedule.route_no)
         if not map_html:
             return render(request, 'bus_route/enhanced_schedule_form.html', {
                 'error_message': 'Not enough bus stops to create a route.'
             })
         
-        # Process fare stage data for charts
-        fare_stages = []
-        if not fare_stage_data.empty:
-            for index, row in fare_stage_data.iterrows():
-                fare_stages.append({
-                    'from': row.get('FROM_STOP_NAME', ''),
-                    'to': row.get('TO_STOP_NAME', ''),
-                    'revenue': row.get('REVENUE', 0),
-                    'passengers': row.get('PASSENGERS', 0)
-                })
+        # Fare stage data for charts
+        fare_stages = [
+            {
+                'from': row.from_stop_name,
+                'to': row.to_stop_name,
+                'revenue': row.revenue,
+                'passengers': row.passengers,
+                'boardings': row.boardings,
+                'distance_km': row.distance_km,
+            }
+            for row in stage_rows
+        ]
         
         # Prepare data for the template
         context = {
@@ -837,6 +854,8 @@ def enhanced_schedule_analyzer_view(request):
             'total_revenue': total_revenue,
             'total_distance': total_distance,
             'fare_stages': fare_stages,
+            'fare_stage_date': stage_date,
+            'fare_stage_segments': route_stops.fare_stage_segments(),
             'schedule_no': schedule_no,
             'trip_no': trip_no
         }
@@ -867,9 +886,29 @@ from datetime import datetime, timedelta
 from .models import Trip
 from django.db.models import Sum
 
+STREAM_CHUNK_ROWS = 2000
+
+
+def stream_revenue_series(fmt, key_name, rows, start_date, end_date):
+    """
+    Streamed revenue series, one {key_name: ..., 'revenues': [...]} row per
+    key after a {'dates': [...]} head. `rows` must be ordered by key; they
+    are read with a server-side cursor where the database has one.
+    """
+    series = iter_revenue_series(rows.iterator(chunk_size=STREAM_CHUNK_ROWS), start_date, end_date)
+    return streaming_json_response(
+        fmt,
+        {'dates': [day.strftime('%Y-%m-%d') for day in date_range(start_date, end_date)]},
+        'series',
+        ({key_name: key, 'revenues': values} for key, values in series),
+    )
+
+
+@gzip_page
 def revenue_analysis(request):
     """
-    API endpoint to fetch revenue data for selected schedules within a date range
+    API endpoint to fetch revenue data for selected schedules within a date range.
+    ?stream=ndjson or ?stream=json streams one series per schedule instead.
     """
     if request.method != 'GET':
         return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
@@ -889,66 +928,16 @@ def revenue_analysis(request):
     except ValueError:
         return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
     
-    # Build date list for the entire range
-    date_list = []
-    current_date = start_date_obj
-    while current_date <= end_date_obj:
-        date_list.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
-    
-    result_data = []
-    
-    # Handle 'all' schedules case
-    if schedule_no.lower() == 'all':
-        # Get all schedules that have trips in the date range
-        schedules_with_trips = Trip.objects.filter(
-            date__gte=start_date_obj,
-            date__lte=end_date_obj
-        ).values_list('schedule_no', flat=True).distinct()
-        
-        # Process each schedule
-        for schedule in schedules_with_trips:
-            schedule_data = process_schedule_revenue(schedule, start_date_obj, end_date_obj, date_list)
-            if schedule_data:
-                result_data.append(schedule_data)
-    else:
-        # Process single schedule
-        schedule_data = process_schedule_revenue(schedule_no, start_date_obj, end_date_obj, date_list)
-        if schedule_data:
-            result_data.append(schedule_data)
-    
-    return JsonResponse({'data': result_data})
-
-def process_schedule_revenue(schedule_no, start_date, end_date, date_list):
-    """Helper function to process revenue data for a specific schedule"""
-    # Query for daily revenue for this schedule
-    daily_revenues = Trip.objects.filter(
-        schedule_no=schedule_no,
-        date__gte=start_date,
-        date__lte=end_date
-    ).values('date').annotate(total_revenue=Sum('revenue'))
+    if end_date_obj < start_date_obj:
+        return JsonResponse({'error': 'start_date must not be after end_date'}, status=400)
     
-    # If no data, return None
-    if not daily_revenues.exists():
-        return None
-    
-    # Create a lookup dictionary for quick access
-    revenue_lookup = {
-        revenue_data['date'].strftime('%Y-%m-%d'): revenue_data['total_revenue'] 
-        for revenue_data in daily_revenues
-    }
-    
-    # Build the revenue list for all dates in the range
-    revenue_list = []
-    for date_str in date_list:
-        # Use the revenue if available, otherwise null (not 0, to create gaps in the chart)
-        revenue_list.append(float(revenue_lookup.get(date_str, 0)) if date_str in revenue_lookup else None)
-    
-    return {
-        'schedule': schedule_no,
-        'dates': date_list,
-        'revenues': revenue_list
-    }
+    # One grouped (schedule, date) query for one schedule or all of them, pivoted to schedules x dates
+    rows = schedule_revenue_rows(start_date_obj, end_date_obj, None if schedule_no.lower() == 'all' else schedule_no)
+    fmt = stream_format(request)
+    if fmt:
+        return stream_revenue_series(fmt, 'schedule', rows.order_by('schedule_no', 'date'), start_date_obj, end_date_obj)
+    schedules, dates, matrix = revenue_matrix(rows, start_date_obj, end_date_obj)
+    return JsonResponse(columnar('schedules', schedules, dates, matrix))
 
 # Add this function to your views.py file
 
@@ -957,9 +946,11 @@ from datetime import datetime, timedelta
 from .models import Trip
 from django.db.models import Sum
 
+@gzip_page
 def trip_revenue_analysis(request):
     """
-    API endpoint to fetch revenue data for selected trips within a date range
+    API endpoint to fetch revenue data for selected trips within a date range.
+    ?stream=ndjson or ?stream=json streams one series per trip instead.
     """
     if request.method != 'GET':
         return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
@@ -983,69 +974,21 @@ def trip_revenue_analysis(request):
     except ValueError:
         return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
     
-    # Build date list for the entire range
-    date_list = []
-    current_date = start_date_obj
-    while current_date <= end_date_obj:
-        date_list.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
-    
-    result_data = []
+    if end_date_obj < start_date_obj:
+        return JsonResponse({'error': 'start_date must not be after end_date'}, status=400)
     
-    # Handle 'all' trips case
     if trip_no.lower() == 'all':
-        # Get all trips for this schedule in the database
-        trips_with_revenue = Trip.objects.filter(
-            schedule_no=schedule_no,
-            date__gte=start_date_obj,
-            date__lte=end_date_obj
-        ).values_list('trip_no', flat=True).distinct()
-        
-        # Process each trip
-        for trip in trips_with_revenue:
-            trip_data = process_trip_revenue(schedule_no, trip, start_date_obj, end_date_obj, date_list)
-            if trip_data:
-                result_data.append(trip_data)
+        trip_no_int = None
     else:
-        # Process single trip
         try:
             trip_no_int = int(trip_no)
-            trip_data = process_trip_revenue(schedule_no, trip_no_int, start_date_obj, end_date_obj, date_list)
-            if trip_data:
-                result_data.append(trip_data)
         except ValueError:
             return JsonResponse({'error': 'Invalid trip number'}, status=400)
     
-    return JsonResponse({'data': result_data})
-
-def process_trip_revenue(schedule_no, trip_no, start_date, end_date, date_list):
-    """Helper function to process revenue data for a specific trip"""
-    # Query for daily revenue for this trip
-    trip_revenues = Trip.objects.filter(
-        schedule_no=schedule_no,
-        trip_no=trip_no,
-        date__gte=start_date,
-        date__lte=end_date
-    ).values('date', 'revenue')
-    
-    # If no data, return None
-    if not trip_revenues.exists():
-        return None
-    
-    # Create a lookup dictionary for quick access
-    revenue_lookup = {
-        rev_data['date'].strftime('%Y-%m-%d'): rev_data['revenue']
-        for rev_data in trip_revenues
-    }
-    
-    # Build the revenue list for all dates in the range
-    revenue_list = []
-    for date_str in date_list:
-        # Use the revenue if available, otherwise null (not 0, to create gaps in the chart)
-        revenue_list.append(float(revenue_lookup.get(date_str, 0)) if date_str in revenue_lookup else None)
-    
-    return {
-        'trip': trip_no,
-        'dates': date_list,
-        'revenues': revenue_list
-    }
\ No newline at end of file
+    # One query for the schedule's trips, pivoted to trips x dates
+    rows = trip_revenue_rows(schedule_no, start_date_obj, end_date_obj, trip_no_int)
+    fmt = stream_format(request)
+    if fmt:
+        return stream_revenue_series(fmt, 'trip', rows.order_by('trip_no', 'date'), start_date_obj, end_date_obj)
+    trips, dates, matrix = revenue_matrix(rows, start_date_obj, end_date_obj)
+    return JsonResponse(columnar('trips', trips, dates, matrix))
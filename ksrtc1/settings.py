@@ -109,6 +109,34 @@ DATABASES = {
     }
 }
 
+# Cache shared by every gunicorn worker (map job progress lives here).
+# Set REDIS_URL to use Redis, or CACHE_TABLE to use the database cache
+# table (create it with `python manage.py createcachetable`; the Docker
+# image does). Without either, the per-process LocMemCache is used, which
+# is fine for `runserver` but not shared between gunicorn workers.
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_TABLE = os.getenv('CACHE_TABLE')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_TABLE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': CACHE_TABLE,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -175,4 +203,5 @@ GOOGLE_APPLICATION_CREDENTIALS = 'path/to/your/service-account-key.json'
 GCP_PROJECT_ID = "enhanced-cable-447317-h8"
 BQ_DATASET = "ksrtc_dataset"
 BQ_TABLE = "ksrtc_vis_view"
+BQ_TICKET_TABLE = "ksrtc_table_with_amount"  # Ticket rows with fares, as read by airflow/epkm_table_bq_sql.py
 GMAP_API_KEY = os.getenv('GMAP_API_KEY', '')
\ No newline at end of file
@@ -26,7 +26,12 @@ urlpatterns = [
     path('passenger_distribution/', views.select_month_time, name='select_month_time'),
     # Route for the map generation with the selected month and time
     path('generate-map/', views.generate_bus_stop_map, name='generate_bus_stop_map'),
+    path('generate-map/jobs/', views.start_bus_stop_map, name='start_bus_stop_map'),
+    path('generate-map/jobs/<str:job_id>/events/', views.bus_stop_map_events, name='bus_stop_map_events'),
+    path('generate-map/jobs/<str:job_id>/', views.bus_stop_map_result, name='bus_stop_map_result'),
     path('geocoding-progress/', views.get_geocoding_progress, name='geocoding_progress'),
+    path('od-flows/', views.od_flows_api, name='od_flows_api'),
+    path('passenger-comparison/', views.passenger_comparison_api, name='passenger_comparison_api'),
     path('ask_chatbot/', views.ask_gemini, name='ask_chatbot'),
     path('pred/', include('pred.urls')),
     path('tracker/', include('tracker.urls')),
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ksrtc1.settings')
 
 application = get_wsgi_application()
+
+# With gunicorn --preload, build the route stop index once in the master so
+# the forked workers share its arrays copy-on-write (bus_route/route_index.py)
+if os.getenv('ROUTE_INDEX_PRELOAD', '').strip() not in ('', '0'):
+    from bus_route.route_index import preload_route_index
+    preload_route_index()
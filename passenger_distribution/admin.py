@@ -5,13 +5,15 @@ from .models import KsrtcFromData, KsrtcToData
 # Register the KsrtcFromData model
 @admin.register(KsrtcFromData)
 class KsrtcFromDataAdmin(admin.ModelAdmin):
-    list_display = ('date_hour', 'from_stop_name', 'total_passenger')
-    search_fields = ('date_hour', 'from_stop_name')
-    list_filter = ('date_hour',)
+    list_display = ('date', 'hour', 'from_stop_name', 'total_passenger')
+    search_fields = ('from_stop_name',)
+    list_filter = ('date', 'hour')
+    date_hierarchy = 'date'
 
 # Register the KsrtcToData model
 @admin.register(KsrtcToData)
 class KsrtcToDataAdmin(admin.ModelAdmin):
-    list_display = ('date_hour', 'to_stop_name', 'total_passenger')
-    search_fields = ('date_hour', 'to_stop_name')
-    list_filter = ('date_hour',)
+    list_display = ('date', 'hour', 'to_stop_name', 'total_passenger')
+    search_fields = ('to_stop_name',)
+    list_filter = ('date', 'hour')
+    date_hierarchy = 'date'
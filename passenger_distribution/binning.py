@@ -0,0 +1,126 @@
+"""
+Vectorized spatial binning of per-stop passenger counts.
+
+Stops are snapped to a square lat/lon grid whose cell size depends on the map
+zoom level, and passenger counts are summed per cell. The heat map then draws
+one point per occupied cell instead of one marker per stop, so the number of
+features sent to the browser is bounded by the grid, not by the stop count.
+"""
+import numpy as np
+import pandas as pd
+
+# (min_zoom, max_zoom, cell size in degrees). 0.1 deg is roughly 11 km at
+# Kerala's latitude, 0.0005 deg roughly 55 m (stops sharing a junction merge).
+ZOOM_BANDS = [
+    (8, 9, 0.1),
+    (10, 11, 0.025),
+    (12, 13, 0.006),
+    (14, 18, 0.0005),
+]
+
+# Same per-stop thresholds as the map legend, applied to log1p(passengers per stop).
+DENSITY_LOG_THRESHOLDS = [3.1, 5.8, 6.9]
+DENSITY_COLORS = ['blue', 'green', 'orange', 'red']
+
+
+def bin_stops(stops_df, cell_size):
+    """
+    Aggregate stops into grid cells of `cell_size` degrees.
+
+    `stops_df` needs latitude, longitude, passenger_count and stop_name columns.
+    Returns one row per occupied cell with the passenger-weighted centroid,
+    the summed passenger count, the number of stops and the busiest stop name.
+    """
+    columns = ['latitude', 'longitude', 'passenger_count', 'stop_count', 'top_stop']
+    if stops_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    lat = stops_df['latitude'].to_numpy(dtype=np.float64)
+    lon = stops_df['longitude'].to_numpy(dtype=np.float64)
+    weight = stops_df['passenger_count'].to_numpy(dtype=np.float64)
+
+    cells = pd.DataFrame({
+        'cell_x': np.floor(lon / cell_size).astype(np.int64),
+        'cell_y': np.floor(lat / cell_size).astype(np.int64),
+        'lat_weighted': lat * weight,
+        'lon_weighted': lon * weight,
+        'latitude': lat,
+        'longitude': lon,
+        'passenger_count': weight,
+        'stop_name': stops_df['stop_name'].to_numpy(),
+    })
+
+    # Sorting once by count lets `first` pick the busiest stop of each cell.
+    cells = cells.sort_values('passenger_count', ascending=False, kind='mergesort')
+    grouped = cells.groupby(['cell_x', 'cell_y'], sort=False).agg(
+        lat_weighted=('lat_weighted', 'sum'),
+        lon_weighted=('lon_weighted', 'sum'),
+        lat_mean=('latitude', 'mean'),
+        lon_mean=('longitude', 'mean'),
+        passenger_count=('passenger_count', 'sum'),
+        stop_count=('stop_name', 'size'),
+        top_stop=('stop_name', 'first'),
+    )
+
+    total = grouped['passenger_count'].to_numpy()
+    has_weight = total > 0
+    safe_total = np.where(has_weight, total, 1.0)
+    grouped['latitude'] = np.where(has_weight, grouped['lat_weighted'].to_numpy() / safe_total, grouped['lat_mean'].to_numpy())
+    grouped['longitude'] = np.where(has_weight, grouped['lon_weighted'].to_numpy() / safe_total, grouped['lon_mean'].to_numpy())
+
+    return grouped[columns].reset_index(drop=True)
+
+
+def density_colors(passenger_counts, stop_counts=None):
+    """
+    Map passenger counts to the legend colours without a per-row loop.
+
+    The thresholds are per stop, so a cell's summed count is divided by its
+    `stop_counts` first; otherwise a coarse cell holding hundreds of quiet
+    stops would land in the top colour.
+    """
+    counts = np.asarray(passenger_counts, dtype=np.float64)
+    if stop_counts is not None:
+        counts = counts / np.maximum(np.asarray(stop_counts, dtype=np.float64), 1)
+    log_counts = np.log1p(counts)
+    index = np.searchsorted(DENSITY_LOG_THRESHOLDS, log_counts, side='right')
+    return np.asarray(DENSITY_COLORS)[index]
+
+
+def marker_radii(passenger_counts, min_radius=4, max_radius=28):
+    """Scale circle radius with the log of the passenger count"""
+    log_counts = np.log1p(np.asarray(passenger_counts, dtype=np.float64))
+    if log_counts.size == 0:
+        return log_counts
+    peak = log_counts.max() or 1.0
+    return min_radius + (max_radius - min_radius) * log_counts / peak
+
+
+def bins_to_geojson(binned_df):
+    """Build a GeoJSON FeatureCollection of cell centroids from binned data"""
+    counts = binned_df['passenger_count'].to_numpy(dtype=np.float64)
+    stop_counts = binned_df['stop_count'].astype(int).to_numpy()
+    properties = pd.DataFrame({
+        'top_stop': binned_df['top_stop'].astype(str).to_numpy(),
+        'stop_count': stop_counts,
+        'passenger_count': np.round(counts, 2),
+        'color': density_colors(counts, stop_counts),
+        'radius': np.round(marker_radii(counts), 1),
+    }).to_dict(orient='records')
+    coordinates = np.column_stack([
+        binned_df['longitude'].to_numpy(dtype=np.float64),
+        binned_df['latitude'].to_numpy(dtype=np.float64),
+    ]).round(6).tolist()
+
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': point}, 'properties': props}
+            for point, props in zip(coordinates, properties)
+        ],
+    }
+
+
+def build_zoom_layers(stops_df, bands=ZOOM_BANDS):
+    """Bin the stops once per zoom band; returns [(min_zoom, max_zoom, binned_df)]"""
+    return [(min_zoom, max_zoom, bin_stops(stops_df, cell_size)) for min_zoom, max_zoom, cell_size in bands]
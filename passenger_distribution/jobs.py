@@ -0,0 +1,209 @@
+"""
+Background map-generation jobs with progress kept in the shared Django cache.
+
+Each job gets its own id. The worker thread that runs the job is the only
+writer of its state, so a job is a small status record plus numbered event
+keys (`<job>:event:<n>`) that the SSE endpoint reads in order. Because all
+of it lives in the configured cache (Redis or the database cache when deployed, see
+settings.CACHES) any gunicorn worker can stream any job, not just the
+worker that started it.
+
+While a job runs, a heartbeat thread next to it refreshes `updated_at`.
+If the worker process dies (gunicorn recycles it or kills it on a
+timeout) the heartbeat stops, and readers report the job as failed once
+its record is older than JOB_STALE_AFTER instead of waiting on it forever.
+
+An SSE connection occupies a server thread, so each one is closed after
+JOB_STREAM_WINDOW seconds. The browser's EventSource then reconnects on its
+own and sends Last-Event-ID, and the stream resumes after that event.
+"""
+import json
+import threading
+import time
+import traceback
+import uuid
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+JOB_TTL = 6 * 60 * 60  # Finished jobs and their maps are kept for six hours
+JOB_KEY_PREFIX = 'map_job'
+JOB_HEARTBEAT = 10  # Seconds between heartbeats of a running job
+JOB_STALE_AFTER = 60  # An unfinished job without a heartbeat for this long is treated as failed
+JOB_STREAM_WINDOW = 60  # Seconds one SSE connection is held before the client reconnects
+STALE_JOB_ERROR = 'Map generation stopped responding (the server worker was restarted); please try again'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETE = 'complete'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_COMPLETE, STATUS_FAILED)
+
+
+def _key(job_id, *parts):
+    return ':'.join((JOB_KEY_PREFIX, job_id) + tuple(str(part) for part in parts))
+
+
+class MapJob:
+    """Writer side of a job: records progress, partial results and the outcome"""
+
+    def __init__(self, job_id, params):
+        self.job_id = job_id
+        self.state = {
+            'job_id': job_id,
+            'params': params,
+            'status': STATUS_QUEUED,
+            'progress': 0,
+            'message': 'Queued',
+            'last_event': 0,
+            'error': None,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, params):
+        job = cls(uuid.uuid4().hex, params)
+        job._save()
+        return job
+
+    def _save(self):
+        self.state['updated_at'] = time.time()
+        cache.set(_key(self.job_id), self.state, JOB_TTL)
+
+    def _emit(self, event, data):
+        """Append one numbered event and publish the new state"""
+        with self._lock:
+            seq = self.state['last_event'] + 1
+            cache.set(_key(self.job_id, 'event', seq), {'id': seq, 'event': event, 'data': data}, JOB_TTL)
+            self.state['last_event'] = seq
+            self._save()
+
+    def heartbeat(self):
+        with self._lock:
+            self._save()
+
+    def progress(self, percent, message=None):
+        self.state['status'] = STATUS_RUNNING
+        self.state['progress'] = round(float(percent), 2)
+        if message:
+            self.state['message'] = message
+        self._emit('progress', {'progress': self.state['progress'], 'message': self.state['message']})
+
+    def partial(self, data):
+        self._emit('partial', data)
+
+    def complete(self, result, summary=None):
+        cache.set(_key(self.job_id, 'result'), result, JOB_TTL)
+        self.state['status'] = STATUS_COMPLETE
+        self.state['progress'] = 100
+        self.state['message'] = 'Map ready'
+        self._emit('complete', dict(summary or {}, job_id=self.job_id))
+
+    def fail(self, error):
+        self.state['status'] = STATUS_FAILED
+        self.state['error'] = str(error)
+        self.state['message'] = 'Map generation failed'
+        self._emit('failed', {'error': str(error)})
+
+
+def is_stale(state):
+    return state['status'] not in FINISHED_STATUSES and time.time() - state['updated_at'] > JOB_STALE_AFTER
+
+
+def get_job_state(job_id):
+    """The job's status record; an unfinished job whose heartbeat stopped is reported as failed"""
+    state = cache.get(_key(job_id))
+    if state is not None and is_stale(state):
+        state = dict(state, status=STATUS_FAILED, error=STALE_JOB_ERROR, message='Map generation failed', stale=True)
+    return state
+
+
+def get_job_events(job_id, after, until):
+    """Events after..until (inclusive) in order; expired keys are skipped"""
+    keys = [_key(job_id, 'event', seq) for seq in range(after + 1, until + 1)]
+    found = cache.get_many(keys)
+    return [found[key] for key in keys if key in found]
+
+
+def get_job_result(job_id):
+    return cache.get(_key(job_id, 'result'))
+
+
+def start_job(params, target):
+    """
+    Create a job and run `target(job, **params)` in a background thread.
+
+    `target` returns (result, summary); exceptions mark the job failed.
+    """
+    job = MapJob.create(params)
+    done = threading.Event()
+
+    def run():
+        try:
+            result, summary = target(job, **params)
+            job.complete(result, summary)
+        except Exception as e:
+            traceback.print_exc()
+            job.fail(e)
+        finally:
+            done.set()
+            close_old_connections()
+
+    def beat():
+        while not done.wait(JOB_HEARTBEAT):
+            job.heartbeat()
+
+    threading.Thread(target=run, name=f'map-job-{job.job_id}', daemon=True).start()
+    threading.Thread(target=beat, name=f'map-job-{job.job_id}-heartbeat', daemon=True).start()
+    return job
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_job_events(job_id, last_event_id=0, poll_interval=0.5, heartbeat=15, timeout=JOB_STREAM_WINDOW):
+    """
+    Generator of SSE frames for one job.
+
+    Reads the job's status record (one small cache get per tick) and only
+    fetches event keys that are new since the last frame sent. Ends once the
+    job has finished and its last event has been delivered, or after
+    `timeout` seconds; the client then reconnects from the last event id.
+    """
+    sent = last_event_id
+    started = last_frame = time.monotonic()
+    yield 'retry: 3000\n\n'
+    while True:
+        state = get_job_state(job_id)
+        if state is None:
+            yield format_sse('failed', {'error': 'Unknown or expired job'})
+            return
+        if state.get('stale'):
+            yield format_sse('failed', {'error': state['error']})
+            return
+
+        if state['last_event'] > sent:
+            for event in get_job_events(job_id, sent, state['last_event']):
+                yield format_sse(event['event'], event['data'], event['id'])
+            sent = state['last_event']
+            last_frame = time.monotonic()
+
+        if state['status'] in FINISHED_STATUSES:
+            return
+
+        now = time.monotonic()
+        if now - started > timeout:
+            return
+        if now - last_frame > heartbeat:
+            # Comment frame keeps proxies from closing an idle connection
+            yield ': keep-alive\n\n'
+            last_frame = now
+        time.sleep(poll_interval)
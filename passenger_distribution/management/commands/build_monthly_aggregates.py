@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+import glob
+import os
+import time
+
+import pandas as pd
+
+from passenger_distribution.monthly import MonthlyAggregateStore, MONTHLY_STORE_FILE, VISUALIZE_CSV_PATTERN
+
+
+class Command(BaseCommand):
+    help = 'Precompute monthly per-stop passenger aggregates from the visualize extracts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'months',
+            nargs='*',
+            help='Extract names to (re)aggregate, e.g. October September. Default: every extract found.',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=MONTHLY_STORE_FILE,
+            help=f'Aggregate store to update (default: {MONTHLY_STORE_FILE})',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Start from an empty store instead of merging into the existing one',
+        )
+
+    def handle(self, *args, **options):
+        if options['months']:
+            paths = [VISUALIZE_CSV_PATTERN.format(month=month) for month in options['months']]
+        else:
+            paths = sorted(glob.glob(VISUALIZE_CSV_PATTERN.format(month='*')))
+        if not paths:
+            raise CommandError('No visualize extracts found')
+
+        store = MonthlyAggregateStore.empty()
+        if not options['rebuild'] and os.path.exists(options['output']):
+            store = MonthlyAggregateStore.load(options['output'])
+
+        for path in paths:
+            started = time.perf_counter()
+            try:
+                df = pd.read_csv(path, usecols=['DATE_HOUR', 'FROM_STOP_NAME', 'TOTAL_PASSENGER'])
+            except FileNotFoundError:
+                raise CommandError(f'Extract not found: {path}')
+            monthly = MonthlyAggregateStore.aggregate_extract(df)
+            store = store.with_months(monthly)
+            self.stdout.write(
+                f"{path}: {len(df)} rows -> months {', '.join(monthly) or 'none'} "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+
+        store.save(options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored aggregates for {len(store.months)} months and {len(store.stops)} stops in {options['output']}"
+            )
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from passenger_distribution.od_matrix import ODMatrixStore, OD_CSV_FILE, OD_STORE_FILE
+
+
+class Command(BaseCommand):
+    help = 'Build the origin-destination matrix store from the FROM/TO ticket extract'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            type=str,
+            default=OD_CSV_FILE,
+            help=f'OD extract with DATE_HOUR, FROM_STOP_NAME, TO_STOP_NAME, TOTAL_PASSENGER (default: {OD_CSV_FILE})',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=OD_STORE_FILE,
+            help=f'Where to write the compact store (default: {OD_STORE_FILE})',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            store = ODMatrixStore.from_csv(options['csv'])
+        except FileNotFoundError:
+            raise CommandError(f"OD extract not found: {options['csv']}")
+
+        store.save(options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored {len(store.values)} OD entries for {len(store.stops)} stops across "
+                f"{len(store.bucket_keys)} hourly buckets in {options['output']} "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+        )
@@ -0,0 +1,146 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+import pandas as pd
+import time
+
+from bus_route.stop_registry import resolve_stop_ids
+from passenger_distribution.models import KsrtcFromData, KsrtcToData
+
+# Airflow `bigquery_to_csv_dual` DAG output (airflow/from_to.py)
+DEFAULT_FROM_CSV = 'passenger_distribution/data/caches/from_airflow.csv'
+DEFAULT_TO_CSV = 'passenger_distribution/data/caches/to_airflow.csv'
+
+# (model, stop name column in the CSV, stop name field, canonical stop id field on the model)
+EXTRACTS = {
+    'from': (KsrtcFromData, 'FROM_STOP_NAME', 'from_stop_name', 'from_stop'),
+    'to': (KsrtcToData, 'TO_STOP_NAME', 'to_stop_name', 'to_stop'),
+}
+
+
+def parse_extract_chunk(chunk, stop_column):
+    """Split DATE_HOUR ('YYYY-MM-DD HH') into typed date/hour columns"""
+    date_hour = chunk['DATE_HOUR'].astype(str).str.strip()
+    parsed = pd.DataFrame({
+        'date': pd.to_datetime(date_hour.str[:10], format='%Y-%m-%d', errors='coerce').dt.date,
+        'hour': pd.to_numeric(date_hour.str[11:13], errors='coerce'),
+        'stop_name': chunk[stop_column].astype(str).str.strip(),
+        'total_passenger': pd.to_numeric(chunk['TOTAL_PASSENGER'], errors='coerce'),
+    })
+    parsed = parsed.dropna()
+    parsed['hour'] = parsed['hour'].astype(int)
+    parsed['total_passenger'] = parsed['total_passenger'].astype(int)
+    # Inserting in index order keeps the (stop, date, hour) b-tree appends local
+    return parsed.sort_values(['stop_name', 'date', 'hour'], kind='mergesort')
+
+
+def insert_statement(model, stop_field, stop_id_field):
+    """Single-row INSERT run in batches through executemany; skips per-object ORM instantiation"""
+    quote = connection.ops.quote_name
+    fields = ('date', 'hour', stop_field, stop_id_field, 'total_passenger')
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    return f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s, %s)'
+
+
+class Command(BaseCommand):
+    help = 'Bulk load the Airflow from/to passenger extracts into KsrtcFromData/KsrtcToData'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from-csv',
+            type=str,
+            default=DEFAULT_FROM_CSV,
+            help=f'Path to the FROM_STOP_NAME extract (default: {DEFAULT_FROM_CSV})',
+        )
+        parser.add_argument(
+            '--to-csv',
+            type=str,
+            default=DEFAULT_TO_CSV,
+            help=f'Path to the TO_STOP_NAME extract (default: {DEFAULT_TO_CSV})',
+        )
+        parser.add_argument(
+            '--only',
+            choices=sorted(EXTRACTS),
+            help='Load only one of the two extracts',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per executemany batch (default: 5000)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500000,
+            help='CSV rows read into memory at a time (default: 500000)',
+        )
+        parser.add_argument(
+            '--append',
+            action='store_true',
+            help='Keep existing rows for the loaded dates instead of replacing them',
+        )
+
+    def handle(self, *args, **options):
+        paths = {'from': options['from_csv'], 'to': options['to_csv']}
+        kinds = [options['only']] if options['only'] else ['from', 'to']
+
+        for kind in kinds:
+            started = time.perf_counter()
+            loaded = self.load_extract(
+                kind,
+                paths[kind],
+                batch_size=options['batch_size'],
+                chunk_size=options['chunk_size'],
+                replace=not options['append'],
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Loaded {loaded} {kind} rows from {paths[kind]} in {time.perf_counter() - started:.1f}s'
+                )
+            )
+
+    def load_extract(self, kind, path, batch_size, chunk_size, replace):
+        """Load one extract inside a single transaction; returns the row count"""
+        model, stop_column, stop_field, stop_id_field = EXTRACTS[kind]
+        try:
+            reader = pd.read_csv(
+                path,
+                usecols=['DATE_HOUR', stop_column, 'TOTAL_PASSENGER'],
+                dtype={'DATE_HOUR': str, stop_column: str},
+                chunksize=chunk_size,
+            )
+        except FileNotFoundError:
+            raise CommandError(f'Extract not found: {path}')
+
+        sql = insert_statement(model, stop_field, stop_id_field)
+        loaded = 0
+        cleared_dates = set()
+        with transaction.atomic():
+            for chunk in reader:
+                parsed = parse_extract_chunk(chunk, stop_column)
+                if parsed.empty:
+                    continue
+
+                # Re-running the loader for a refreshed extract replaces those days
+                if replace:
+                    new_dates = set(parsed['date'].unique()) - cleared_dates
+                    if new_dates:
+                        model.objects.filter(date__in=new_dates).delete()
+                        cleared_dates |= new_dates
+
+                # Canonical stop ids from the stop registry, one dict lookup per distinct name
+                stop_names = parsed['stop_name'].tolist()
+                rows = list(zip(
+                    parsed['date'].tolist(),
+                    parsed['hour'].tolist(),
+                    stop_names,
+                    resolve_stop_ids(stop_names),
+                    parsed['total_passenger'].tolist(),
+                ))
+                with connection.cursor() as cursor:
+                    for start in range(0, len(rows), batch_size):
+                        cursor.executemany(sql, rows[start:start + batch_size])
+                loaded += len(rows)
+                self.stdout.write(f'  {kind}: {loaded} rows inserted')
+
+        return loaded
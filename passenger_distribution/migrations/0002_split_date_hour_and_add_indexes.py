@@ -0,0 +1,121 @@
+# Generated by Django 5.1.4 on 2026-10-19 04:56
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def parse_date_hour(value):
+    """(date, hour) from 'YYYY-MM-DD HH[:MM:SS]', or None when blank or malformed"""
+    day, _, time_part = (value or '').strip().partition(' ')
+    try:
+        hour = int(time_part[:2] or 0)
+        if not 0 <= hour <= 23:
+            return None
+        return date.fromisoformat(day[:10]), hour
+    except ValueError:
+        return None
+
+
+def split_date_hour(apps, schema_editor):
+    """
+    Parse the old 'YYYY-MM-DD HH[:MM:SS]' strings into date and hour columns.
+
+    Rows whose date_hour cannot be parsed are deleted, since date and hour
+    become NOT NULL below; how many is printed per table.
+    """
+    for model_name in ('KsrtcFromData', 'KsrtcToData'):
+        model = apps.get_model('passenger_distribution', model_name)
+        rows = []
+        skipped = []
+        for row in model.objects.only('id', 'date_hour').iterator(chunk_size=5000):
+            parsed = parse_date_hour(row.date_hour)
+            if parsed is None:
+                skipped.append(row.id)
+                continue
+            row.date, row.hour = parsed
+            rows.append(row)
+            if len(rows) >= 5000:
+                model.objects.bulk_update(rows, ['date', 'hour'])
+                rows = []
+        if rows:
+            model.objects.bulk_update(rows, ['date', 'hour'])
+        for start in range(0, len(skipped), 5000):
+            model.objects.filter(id__in=skipped[start:start + 5000]).delete()
+        if skipped:
+            print(f"\n  {model_name}: deleted {len(skipped)} rows with a blank or malformed date_hour")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passenger_distribution', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ksrtcfromdata',
+            name='date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ksrtcfromdata',
+            name='hour',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ksrtctodata',
+            name='date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ksrtctodata',
+            name='hour',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(split_date_hour, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='ksrtcfromdata',
+            name='date_hour',
+        ),
+        migrations.RemoveField(
+            model_name='ksrtctodata',
+            name='date_hour',
+        ),
+        migrations.AlterField(
+            model_name='ksrtcfromdata',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='ksrtcfromdata',
+            name='hour',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='ksrtctodata',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='ksrtctodata',
+            name='hour',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtcfromdata',
+            index=models.Index(fields=['from_stop_name', 'date', 'hour'], name='passenger_d_from_st_25ac1d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtcfromdata',
+            index=models.Index(fields=['date', 'hour'], name='passenger_d_date_e98748_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtctodata',
+            index=models.Index(fields=['to_stop_name', 'date', 'hour'], name='passenger_d_to_stop_602688_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtctodata',
+            index=models.Index(fields=['date', 'hour'], name='passenger_d_date_0533ce_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bus_route', '0007_stop_registry'),
+        ('passenger_distribution', '0002_split_date_hour_and_add_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ksrtcfromdata',
+            name='from_stop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bus_route.stop'),
+        ),
+        migrations.AddField(
+            model_name='ksrtctodata',
+            name='to_stop',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bus_route.stop'),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtcfromdata',
+            index=models.Index(fields=['from_stop', 'date', 'hour'], name='passenger_d_from_st_827583_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ksrtctodata',
+            index=models.Index(fields=['to_stop', 'date', 'hour'], name='passenger_d_to_stop_443b63_idx'),
+        ),
+    ]
@@ -1,17 +1,35 @@
 from django.db import models
 
 class KsrtcFromData(models.Model):
-    date_hour = models.CharField(max_length=50)
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
     from_stop_name = models.CharField(max_length=100)
+    from_stop = models.ForeignKey('bus_route.Stop', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     total_passenger = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_stop_name', 'date', 'hour']),
+            models.Index(fields=['from_stop', 'date', 'hour']),
+            models.Index(fields=['date', 'hour']),
+        ]
+
     def __str__(self):
-        return f"{self.date_hour} - {self.from_stop_name}: {self.total_passenger}"
+        return f"{self.date} {self.hour:02d} - {self.from_stop_name}: {self.total_passenger}"
 
 class KsrtcToData(models.Model):
-    date_hour = models.CharField(max_length=50)
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
     to_stop_name = models.CharField(max_length=100)
+    to_stop = models.ForeignKey('bus_route.Stop', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     total_passenger = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_stop_name', 'date', 'hour']),
+            models.Index(fields=['to_stop', 'date', 'hour']),
+            models.Index(fields=['date', 'hour']),
+        ]
+
     def __str__(self):
-        return f"{self.date_hour} - {self.to_stop_name}: {self.total_passenger}"
+        return f"{self.date} {self.hour:02d} - {self.to_stop_name}: {self.total_passenger}"
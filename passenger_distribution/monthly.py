@@ -0,0 +1,177 @@
+"""
+Precomputed monthly per-stop passenger aggregates for month comparisons.
+
+Each monthly visualize extract is reduced once to two small arrays:
+`totals[month, stop, hour]` (passengers boarding at the stop in that hour
+summed over the month) and `days[month, day, hour]` (whether the extract has
+any data for that day and hour). Average daily passengers for any hour
+window is then a slice-and-sum over these arrays, so comparing twelve
+months costs about the same as one.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+MONTHLY_STORE_FILE = 'passenger_distribution/data/caches/monthly_stop_aggregates.npz'
+VISUALIZE_CSV_PATTERN = 'passenger_distribution/data/caches/{month}_visualize_airflow.csv'
+
+
+class MonthlyAggregateStore:
+    """Per-month stop x hour passenger totals, keyed by 'YYYY-MM'"""
+
+    def __init__(self, months, stops, totals, days):
+        self.months = [str(month) for month in months]
+        self.stops = np.asarray(stops).astype(str)
+        self.totals = np.asarray(totals, dtype=np.int64)
+        self.days = np.asarray(days, dtype=bool)
+        self.month_index = {month: i for i, month in enumerate(self.months)}
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], np.zeros((0, 0, 24)), np.zeros((0, 31, 24)))
+
+    @staticmethod
+    def aggregate_extract(df):
+        """
+        Reduce one visualize extract (DATE_HOUR, FROM_STOP_NAME, TOTAL_PASSENGER)
+        to {'YYYY-MM': (stop names, totals[stop, hour], days[day, hour])}.
+        """
+        timestamps = pd.to_datetime(df['DATE_HOUR'].astype(str).str[:13], format='%Y-%m-%d %H', errors='coerce')
+        valid = timestamps.notna().to_numpy() & df['FROM_STOP_NAME'].notna().to_numpy()
+        timestamps = timestamps[valid]
+        frame = pd.DataFrame({
+            'month': timestamps.dt.strftime('%Y-%m').to_numpy(),
+            'day': timestamps.dt.day.to_numpy() - 1,
+            'hour': timestamps.dt.hour.to_numpy(),
+            'stop': df['FROM_STOP_NAME'].astype(str).str.strip().to_numpy()[valid],
+            'passengers': pd.to_numeric(df['TOTAL_PASSENGER'], errors='coerce').fillna(0).to_numpy()[valid],
+        })
+
+        months = {}
+        for month, group in frame.groupby('month', sort=True):
+            codes, stops = pd.factorize(group['stop'], sort=True)
+            totals = np.zeros((len(stops), 24), dtype=np.int64)
+            np.add.at(totals, (codes, group['hour'].to_numpy()), group['passengers'].to_numpy().astype(np.int64))
+            days = np.zeros((31, 24), dtype=bool)
+            days[group['day'].to_numpy(), group['hour'].to_numpy()] = True
+            months[month] = (np.asarray(stops), totals, days)
+        return months
+
+    def with_months(self, monthly):
+        """
+        New store with the given months added or replaced.
+
+        `monthly` is the output of aggregate_extract; existing months not in
+        it are kept, so one extract can be refreshed without re-reading the rest.
+        """
+        kept = {month: self._month_arrays(month) for month in self.months if month not in monthly}
+        kept.update(monthly)
+        months = sorted(kept)
+        if not months:
+            return self.empty()
+
+        stops = np.unique(np.concatenate([kept[month][0] for month in months]))
+        totals = np.zeros((len(months), len(stops), 24), dtype=np.int64)
+        days = np.zeros((len(months), 31, 24), dtype=bool)
+        for i, month in enumerate(months):
+            month_stops, month_totals, month_days = kept[month]
+            totals[i, np.searchsorted(stops, month_stops)] = month_totals
+            days[i] = month_days
+        return MonthlyAggregateStore(months, stops, totals, days)
+
+    def _month_arrays(self, month):
+        i = self.month_index[month]
+        present = self.totals[i].any(axis=1)
+        return self.stops[present], self.totals[i][present], self.days[i]
+
+    def save(self, path=MONTHLY_STORE_FILE):
+        """Write to a staging file and swap it in, so get_monthly_store never reads a half-written file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        staging = f'{path}.tmp'
+        with open(staging, 'wb') as f:
+            np.savez(f, months=np.asarray(self.months), stops=self.stops, totals=self.totals, days=self.days)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path=MONTHLY_STORE_FILE):
+        with np.load(path) as data:
+            return cls(data['months'], data['stops'], data['totals'], data['days'])
+
+    def average_daily(self, months, start_hour=0, end_hour=23):
+        """
+        Average daily passengers per stop for each month, shape (months, stops).
+
+        Days are counted per month as days with any data inside the hour
+        window, the same way the single-month map counts them.
+        """
+        indices = [self.month_index[month] for month in months]
+        window = slice(start_hour, end_hour + 1)
+        totals = self.totals[indices, :, window].sum(axis=2)
+        day_counts = self.days[indices, :, window].any(axis=2).sum(axis=1)
+        return totals / np.maximum(day_counts, 1)[:, None], day_counts
+
+    def compare(self, months, start_hour=0, end_hour=23, stops=None, min_average=0, limit=None, sort='change'):
+        """
+        Side-by-side average daily passengers for `months` with the change of
+        every later month against the first (baseline) month.
+
+        Returns (rows, day_counts). `sort` is 'change' (largest absolute change
+        in the last month first), 'passengers' (busiest in the last month
+        first) or 'stop'.
+        """
+        averages, day_counts = self.average_daily(months, start_hour, end_hour)
+        selected = np.ones(len(self.stops), dtype=bool)
+        if stops:
+            selected &= np.isin(self.stops, list(stops))
+        if min_average:
+            selected &= (averages >= min_average).any(axis=0)
+
+        averages = averages[:, selected]
+        names = self.stops[selected]
+        deltas = averages[1:] - averages[0]
+        baseline = averages[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percents = np.where(baseline > 0, deltas / baseline * 100, np.nan)
+
+        if sort == 'stop':
+            order = np.argsort(names, kind='stable')
+        elif sort == 'passengers':
+            order = np.argsort(-averages[-1], kind='stable')
+        else:
+            order = np.argsort(-np.abs(deltas[-1] if len(deltas) else averages[-1]), kind='stable')
+        if limit:
+            order = order[:limit]
+
+        averages = np.round(averages[:, order], 2).T.tolist()
+        deltas = np.round(deltas[:, order], 2).T.tolist()
+        percents = np.round(percents[:, order], 2).T.tolist()
+        rows = []
+        for name, stop_averages, stop_deltas, stop_percents in zip(names[order].tolist(), averages, deltas, percents):
+            rows.append({
+                'stop_name': name,
+                'average_daily': dict(zip(months, stop_averages)),
+                'change': dict(zip(months[1:], stop_deltas)),
+                'percent_change': {
+                    month: (None if np.isnan(value) else value) for month, value in zip(months[1:], stop_percents)
+                },
+            })
+        return rows, dict(zip(months, day_counts.tolist()))
+
+
+_store = None
+_store_mtime = None
+_store_lock = threading.Lock()
+
+
+def get_monthly_store(path=MONTHLY_STORE_FILE):
+    """Process-wide store, reloaded when the build command rewrites the file"""
+    global _store, _store_mtime
+    mtime = os.path.getmtime(path)
+    if _store is None or mtime != _store_mtime:
+        with _store_lock:
+            if _store is None or mtime != _store_mtime:
+                _store = MonthlyAggregateStore.load(path)
+                _store_mtime = mtime
+    return _store
@@ -0,0 +1,228 @@
+"""
+Origin-destination passenger matrices built from the FROM/TO ticket extract.
+
+The extract is stored once as a compact COO table sorted by (date, hour)
+bucket: `rows`/`cols` are stop indices, `values` are passenger counts and
+`bucket_offsets` marks where each bucket starts. Selecting a date/hour range
+is two binary searches and a slice, and the slice is summed into a
+scipy.sparse CSR matrix that answers top flows, per-stop flows and corridor
+totals without touching the raw rows again.
+"""
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+OD_CSV_FILE = 'passenger_distribution/data/caches/od_airflow.csv'
+OD_STORE_FILE = 'passenger_distribution/data/caches/od_matrix.npz'
+
+
+class ODMatrixStore:
+    """Stop x stop passenger counts per (date, hour) bucket in COO form"""
+
+    def __init__(self, stops, bucket_keys, bucket_offsets, rows, cols, values):
+        self.stops = np.asarray(stops)
+        self.bucket_keys = np.asarray(bucket_keys, dtype='datetime64[h]')
+        self.bucket_offsets = np.asarray(bucket_offsets, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.values = np.asarray(values, dtype=np.int32)
+        self.stop_index = {name: i for i, name in enumerate(self.stops.tolist())}
+        self.bucket_hours = (self.bucket_keys.astype(np.int64) % 24).astype(np.int8)
+        self._matrix = lru_cache(maxsize=32)(self._build_matrix)
+
+    @property
+    def shape(self):
+        return (len(self.stops), len(self.stops))
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Build the store from DATE_HOUR, FROM_STOP_NAME, TO_STOP_NAME, TOTAL_PASSENGER columns"""
+        df = df.dropna(subset=['DATE_HOUR', 'FROM_STOP_NAME', 'TO_STOP_NAME'])
+        buckets = pd.to_datetime(df['DATE_HOUR'].astype(str).str[:13], format='%Y-%m-%d %H', errors='coerce')
+        valid = buckets.notna().to_numpy()
+
+        from_names = df['FROM_STOP_NAME'].astype(str).str.strip().to_numpy()[valid]
+        to_names = df['TO_STOP_NAME'].astype(str).str.strip().to_numpy()[valid]
+        passengers = pd.to_numeric(df['TOTAL_PASSENGER'], errors='coerce').fillna(0).to_numpy()[valid]
+        bucket_values = buckets.to_numpy()[valid].astype('datetime64[h]')
+
+        # One shared index for origins and destinations
+        codes, stops = pd.factorize(np.concatenate([from_names, to_names]), sort=True)
+        rows, cols = codes[:len(from_names)], codes[len(from_names):]
+
+        order = np.lexsort((cols, rows, bucket_values))
+        bucket_values = bucket_values[order]
+        bucket_keys, bucket_starts = np.unique(bucket_values, return_index=True)
+        bucket_offsets = np.append(bucket_starts, len(bucket_values))
+
+        return cls(stops, bucket_keys, bucket_offsets, rows[order], cols[order], passengers[order])
+
+    @classmethod
+    def from_csv(cls, path=OD_CSV_FILE):
+        df = pd.read_csv(
+            path,
+            usecols=['DATE_HOUR', 'FROM_STOP_NAME', 'TO_STOP_NAME', 'TOTAL_PASSENGER'],
+            dtype={'DATE_HOUR': str, 'FROM_STOP_NAME': str, 'TO_STOP_NAME': str},
+        )
+        return cls.from_dataframe(df)
+
+    def save(self, path=OD_STORE_FILE):
+        """Write to a staging file and swap it in, so get_od_store never reads a half-written file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        staging = f'{path}.tmp'
+        with open(staging, 'wb') as f:
+            np.savez(
+                f,
+                stops=self.stops.astype(str),
+                bucket_keys=self.bucket_keys.astype(np.int64),
+                bucket_offsets=self.bucket_offsets,
+                rows=self.rows,
+                cols=self.cols,
+                values=self.values,
+            )
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path=OD_STORE_FILE):
+        with np.load(path) as data:
+            return cls(
+                data['stops'],
+                data['bucket_keys'].astype('datetime64[h]'),
+                data['bucket_offsets'],
+                data['rows'],
+                data['cols'],
+                data['values'],
+            )
+
+    def month_range(self, month_number):
+        """(first day, last day) of the latest month in the store with that number (1-12), or None"""
+        months = np.unique(self.bucket_keys.astype('datetime64[M]'))
+        months = months[(months.astype(np.int64) % 12) + 1 == month_number]
+        if not len(months):
+            return None
+        first = months[-1].astype('datetime64[D]')
+        last = (months[-1] + 1).astype('datetime64[D]') - 1
+        return str(first), str(last)
+
+    def _bucket_range(self, start_date=None, end_date=None):
+        """Index range of buckets between two dates (inclusive)"""
+        lo = 0
+        hi = len(self.bucket_keys)
+        if start_date is not None:
+            lo = np.searchsorted(self.bucket_keys, np.datetime64(start_date, 'D').astype('datetime64[h]'), side='left')
+        if end_date is not None:
+            end_exclusive = (np.datetime64(end_date, 'D') + 1).astype('datetime64[h]')
+            hi = np.searchsorted(self.bucket_keys, end_exclusive, side='left')
+        return lo, max(lo, hi)
+
+    def _build_matrix(self, start_date, end_date, start_hour, end_hour):
+        lo, hi = self._bucket_range(start_date, end_date)
+        first, last = self.bucket_offsets[lo], self.bucket_offsets[hi]
+        rows, cols, values = self.rows[first:last], self.cols[first:last], self.values[first:last]
+
+        if start_hour is not None or end_hour is not None:
+            hours = self.bucket_hours[lo:hi]
+            keep = (hours >= (start_hour or 0)) & (hours <= (23 if end_hour is None else end_hour))
+            # Expand the per-bucket mask to the entries of each bucket
+            counts = np.diff(self.bucket_offsets[lo:hi + 1])
+            entry_mask = np.repeat(keep, counts)
+            rows, cols, values = rows[entry_mask], cols[entry_mask], values[entry_mask]
+
+        # COO -> CSR sums duplicate (origin, destination) pairs across buckets
+        matrix = sparse.coo_matrix((values.astype(np.int64), (rows, cols)), shape=self.shape).tocsr()
+        matrix.sum_duplicates()
+        return matrix
+
+    def matrix(self, start_date=None, end_date=None, start_hour=None, end_hour=None):
+        """Summed CSR matrix for a date range and optional hour window"""
+        return self._matrix(
+            None if start_date is None else str(start_date),
+            None if end_date is None else str(end_date),
+            start_hour,
+            end_hour,
+        )
+
+    def _flows_from_coo(self, rows, cols, values):
+        return [
+            {'from_stop': origin, 'to_stop': destination, 'passengers': int(count)}
+            for origin, destination, count in zip(self.stops[rows].tolist(), self.stops[cols].tolist(), values.tolist())
+        ]
+
+    def top_flows(self, k=20, **window):
+        """The k largest origin-destination flows in the window"""
+        matrix = self.matrix(**window).tocoo()
+        if matrix.nnz == 0:
+            return []
+        k = min(k, matrix.nnz)
+        top = np.argpartition(matrix.data, -k)[-k:]
+        top = top[np.argsort(matrix.data[top])[::-1]]
+        return self._flows_from_coo(matrix.row[top], matrix.col[top], matrix.data[top])
+
+    def stop_flows(self, stop_name, direction='both', k=20, **window):
+        """Largest flows starting at (from), ending at (to) or touching (both) a stop"""
+        index = self.stop_index.get(stop_name)
+        if index is None:
+            return []
+        matrix = self.matrix(**window)
+        parts = []
+        if direction in ('from', 'both'):
+            row = matrix.getrow(index).tocoo()
+            parts.append((np.full(row.nnz, index), row.col, row.data))
+        if direction in ('to', 'both'):
+            col = matrix.getcol(index).tocoo()
+            parts.append((col.row, np.full(col.nnz, index), col.data))
+        if not parts:
+            return []
+        rows = np.concatenate([p[0] for p in parts])
+        cols = np.concatenate([p[1] for p in parts])
+        values = np.concatenate([p[2] for p in parts])
+        if direction == 'both':
+            # The self-loop (stop -> same stop) appears in both the row and the column
+            unique = ~((rows == index) & (cols == index) & (np.arange(len(rows)) >= len(parts[0][0])))
+            rows, cols, values = rows[unique], cols[unique], values[unique]
+        order = np.argsort(values)[::-1][:k]
+        return self._flows_from_coo(rows[order], cols[order], values[order])
+
+    def corridor_total(self, stop_names, directional=False, **window):
+        """
+        Passengers travelling between stops of a corridor.
+
+        With `directional`, `stop_names` is taken as an ordered stop sequence
+        and only trips from an earlier to a later stop are counted.
+        """
+        indices = [self.stop_index[name] for name in stop_names if name in self.stop_index]
+        if not indices:
+            return 0
+        sub = self.matrix(**window)[indices][:, indices]
+        if directional:
+            sub = sparse.triu(sub, k=1)
+        return int(sub.sum())
+
+    def stop_totals(self, **window):
+        """Boardings (row sums) and alightings (column sums) per stop"""
+        matrix = self.matrix(**window)
+        return (
+            np.asarray(matrix.sum(axis=1)).ravel(),
+            np.asarray(matrix.sum(axis=0)).ravel(),
+        )
+
+
+_store = None
+_store_mtime = None
+_store_lock = threading.Lock()
+
+
+def get_od_store(path=OD_STORE_FILE):
+    """Process-wide store, reloaded when the build command rewrites the file"""
+    global _store, _store_mtime
+    mtime = os.path.getmtime(path)
+    if _store is None or mtime != _store_mtime:
+        with _store_lock:
+            if _store is None or mtime != _store_mtime:
+                _store = ODMatrixStore.load(path)
+                _store_mtime = mtime
+    return _store
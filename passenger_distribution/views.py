@@ -1,24 +1,28 @@
 import json
 import pandas as pd
 import numpy as np
-import folium
-from folium.plugins import HeatMap, MarkerCluster
-from folium import Icon
 from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 import sys,os
 import dotenv
 import requests
-from django.core.cache import cache
+from datetime import datetime
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 import google.generativeai as genai
+from .binning import build_zoom_layers, bins_to_geojson
+from .od_matrix import get_od_store
+from .monthly import get_monthly_store
+from .jobs import STATUS_COMPLETE, get_job_result, get_job_state, start_job, stream_job_events
 
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GMAP_API_KEY = os.getenv('GMAP_API_KEY')
 # Constants
-LIMIT_OF_TOP_BUS_STOPS = 1000
+CHAT_CONTEXT_STOP_LIMIT = 1000  # Busiest stops passed to the chatbot prompt
 MIN_AVG_THRESHOLD = 1  # At least 31 passengers in 31 days
 SOUTH_INDIA_LAT_MIN = 8.0
 SOUTH_INDIA_LAT_MAX = 14.0
@@ -26,6 +30,12 @@ SOUTH_INDIA_LON_MIN = 76.0
 SOUTH_INDIA_LON_MAX = 80.0
 GEO_CACHE_FILE = 'passenger_distribution/geocoded_stops.json'  # Update path as needed
 FAILURE_CACHE_FILE = 'passenger_distribution/geocoding_failures.json'  # Update path as needed
+GEOCODING_PROGRESS_SHARE = 90  # Geocoding is reported as 0-90%, map rendering as the rest
+PARTIAL_RESULT_BATCH_SIZE = 25  # Newly geocoded stops per partial-result event
+# Stops sent to the external geocoders per map build; the rest stay pending for later builds
+MAX_GEOCODE_PER_RUN = int(os.getenv('MAP_GEOCODE_PER_RUN', '50'))
+NOMINATIM_MIN_DELAY = 1.0  # Nominatim usage policy: at most one request per second
+
 
 def call_gemini_api(prompt, api_key):
     """Sends a prompt to the Gemini API and returns the response."""
@@ -103,23 +113,45 @@ def geocode_using_gmaps(stop_name, timeout=15):
         return None
 
 
-def generate_bus_stop_map(request):
-    print("Generating Bus Stop Map...")
-    percent = 0
-    month = request.GET.get('month', 'October')  # Default to October
-    start_time = int(request.GET.get('start_time', 11))  # Default start time is 11
-    end_time = int(request.GET.get('end_time', 18)) 
-    file_path = f"passenger_distribution/data/caches/{month}_visualize_airflow.csv"
-    
+def parse_map_params(request):
+    """Month, hour window and optional day range from the map form"""
     start_day = request.GET.get('start_day', None)
     end_day = request.GET.get('end_day', None)
-    
+
     # Convert to integers if they exist and are valid
     if start_day:
         start_day = int(start_day) if 1 <= int(start_day) <= 31 else None
     if end_day:
         end_day = int(end_day) if 1 <= int(end_day) <= 31 else None
 
+    return {
+        'month': request.GET.get('month', 'October'),  # Default to October
+        'start_time': int(request.GET.get('start_time', 11)),  # Default start time is 11
+        'end_time': int(request.GET.get('end_time', 18)),
+        'start_day': start_day or None,
+        'end_day': end_day or None,
+    }
+
+
+def build_bus_stop_map(job=None, month='October', start_time=11, end_time=18, start_day=None, end_day=None):
+    """
+    Geocode the busiest stops and render the heat map.
+
+    Stops missing from the geocode cache are taken from the stop registry
+    first. At most MAX_GEOCODE_PER_RUN of the remaining ones, busiest first,
+    go to Nominatim (rate limited) and Google per build. The others are
+    reported as pending and located by later builds, so a new month does not
+    block on thousands of external requests.
+
+    When `job` (a jobs.MapJob) is given, geocoding progress and each batch of
+    newly located stops are published to it. Returns ({'geojson', 'month',
+    'start_time', 'end_time', 'data'}, summary dict); the browser draws the
+    map from the GeoJSON (bus_route/geojson_map.html).
+    """
+    print("Generating Bus Stop Map...")
+    percent = 0
+    file_path = f"passenger_distribution/data/caches/{month}_visualize_airflow.csv"
+
     # Read the data from the CSV file
     print(f"Reading data from: {file_path}")
     data = pd.read_csv(file_path)
@@ -133,33 +165,21 @@ def generate_bus_stop_map(request):
     data = data[(data["TIME"] >= start_time) & (data["TIME"] <= end_time)]
     total_days = len(data["DATE"].unique())
 
-    top_bus_stops = (
+    stop_averages = (
         data.groupby("FROM_STOP_NAME")["TOTAL_PASSENGER"]
         .sum()
         .reset_index()
         .assign(AVERAGE_PASSENGER=lambda x: x["TOTAL_PASSENGER"] / total_days)
         .query("AVERAGE_PASSENGER >= @MIN_AVG_THRESHOLD")
         .sort_values("TOTAL_PASSENGER", ascending=False)
-        .head(LIMIT_OF_TOP_BUS_STOPS)
-        .to_dict(orient="records")  # Convert to a list of dictionaries
     )
 
-    
+
 
     def is_in_south_india(latitude, longitude):
         return (SOUTH_INDIA_LAT_MIN <= latitude <= SOUTH_INDIA_LAT_MAX) and \
                (SOUTH_INDIA_LON_MIN <= longitude <= SOUTH_INDIA_LON_MAX)
 
-    def set_stop_coordinates(stop, latitude, longitude, cached_data, stop_name):
-        stop["latitude"] = latitude
-        stop["longitude"] = longitude
-        cached_data[stop_name] = {"latitude": latitude, "longitude": longitude}
-
-    def handle_failure(stop, stop_name, failures):
-        stop["latitude"] = None
-        stop["longitude"] = None
-        failures.append(stop_name)
-
     # Load cached data
     def load_geocoded_data():
         try:
@@ -198,62 +218,104 @@ def generate_bus_stop_map(request):
 
     # Load cached data
     cached_data = load_geocoded_data()
-    cached_failure_data = load_geocoded_failures()
+    cached_failure_data = set(load_geocoded_failures())
     # Initialize geolocator
     geolocator = Nominatim(user_agent="bus_stop_locator")
+    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=NOMINATIM_MIN_DELAY, max_retries=0, swallow_exceptions=False)
 
-    # Prepare data for geocoding (replace with your actual data)
-    bus_stops_data = [{"stop_name": row["FROM_STOP_NAME"], "passenger_count": row["AVERAGE_PASSENGER"]} for row in top_bus_stops]
+    bus_stops_df = pd.DataFrame({
+        "stop_name": stop_averages["FROM_STOP_NAME"].to_numpy(),
+        "passenger_count": stop_averages["AVERAGE_PASSENGER"].to_numpy(dtype=float),
+    })
 
-    # Load cached data
-    cached_data = load_geocoded_data()
-    cached_failure_data = load_geocoded_failures()
+    # Resolve every cached stop in one vectorized lookup; only cache misses
+    # that have not failed before go to the geocoders below.
+    cached_latitudes = {name: coords["latitude"] for name, coords in cached_data.items()}
+    cached_longitudes = {name: coords["longitude"] for name, coords in cached_data.items()}
+    bus_stops_df["latitude"] = bus_stops_df["stop_name"].map(cached_latitudes)
+    bus_stops_df["longitude"] = bus_stops_df["stop_name"].map(cached_longitudes)
+
+    # Stops the registry already places (build_stop_registry) need no external request
+    registry_stops = bus_stops_df["latitude"].isna()
+    if registry_stops.any():
+        from bus_route.models import Stop
+        from bus_route.stop_registry import resolve_stop_ids
+
+        names = bus_stops_df.loc[registry_stops, "stop_name"]
+        stop_ids = pd.Series(resolve_stop_ids(names.tolist()), index=names.index).dropna().astype(int)
+        located = {
+            stop_id: (latitude, longitude)
+            for stop_id, latitude, longitude in Stop.objects.filter(
+                id__in=set(stop_ids.tolist()), latitude__isnull=False, longitude__isnull=False
+            ).values_list('id', 'latitude', 'longitude')
+        }
+        stop_ids = stop_ids[stop_ids.isin(located.keys())]
+        bus_stops_df.loc[stop_ids.index, "latitude"] = stop_ids.map(lambda stop_id: located[stop_id][0])
+        bus_stops_df.loc[stop_ids.index, "longitude"] = stop_ids.map(lambda stop_id: located[stop_id][1])
+
+    uncached = bus_stops_df["latitude"].isna()
+    known_failures = uncached & bus_stops_df["stop_name"].isin(cached_failure_data)
+    # Busiest first (stop_averages is sorted by passengers); the rest wait for a later build
+    uncached_stop_names = bus_stops_df.loc[uncached & ~known_failures, "stop_name"].tolist()
+    pending_stop_names = uncached_stop_names[:MAX_GEOCODE_PER_RUN]
+    deferred_count = len(uncached_stop_names) - len(pending_stop_names)
 
     # Initialize counters
-    success_count = 0
-    failure_count = 0
+    success_count = int((~uncached).sum())
+    failure_count = int(known_failures.sum())
     failures = []
-    total_bus_stops = len(bus_stops_data)
-    cache.set('geocoding_progress', 0)
-    # Geocode each bus stop
-    for i, stop in enumerate(bus_stops_data):
-        stop_name = stop["stop_name"]
-        percent = (i + 1) / total_bus_stops * 100
-        # Skip if already processed
-        if stop_name in cached_data:
-            stop["latitude"] = cached_data[stop_name]["latitude"]
-            stop["longitude"] = cached_data[stop_name]["longitude"]
-            success_count += 1
-            print_progress_bar(i + 1, len(bus_stops_data))
-            continue
-        elif stop_name in cached_failure_data:
-            failure_count += 1
-            print_progress_bar(i + 1, len(bus_stops_data))
-            continue
-
+    new_coordinates = {}
+    total_pending = len(pending_stop_names)
+    partial_batch = []
+    if job:
+        job.partial({
+            'cached_stops': success_count,
+            'known_failures': failure_count,
+            'pending_stops': total_pending,
+            'deferred_stops': deferred_count,
+        })
+        job.progress(0 if total_pending else GEOCODING_PROGRESS_SHARE, f"Geocoding {total_pending} new stops")
+    # Geocode each stop that is not in either cache
+    for i, stop_name in enumerate(pending_stop_names):
+        coordinates = None
         try:
             # First geocoding attempt
-            location = geolocator.geocode(stop_name, timeout=20)
+            location = geocode(stop_name, timeout=20)
             if location and is_in_south_india(location.latitude, location.longitude):
-                set_stop_coordinates(stop, location.latitude, location.longitude, cached_data, stop_name)
-                success_count += 1
+                coordinates = (location.latitude, location.longitude)
             else:
                 # Retry with gmaps API
                 location = geocode_using_gmaps(stop_name+",South India",20)
-                if location and is_in_south_india(location.latitude, location.longitude):
-                    set_stop_coordinates(stop, location.latitude, location.longitude, cached_data, stop_name)
-                    success_count += 1
-                else:
-                    
-                    handle_failure(stop, stop_name, failures)
-                    failure_count += 1
+                if location and is_in_south_india(*location):
+                    coordinates = location
         except Exception as e:
-            handle_failure(stop, stop_name, failures)
+            coordinates = None
+
+        if coordinates:
+            new_coordinates[stop_name] = coordinates
+            cached_data[stop_name] = {"latitude": coordinates[0], "longitude": coordinates[1]}
+            success_count += 1
+            partial_batch.append({"stop_name": stop_name, "latitude": coordinates[0], "longitude": coordinates[1]})
+        else:
+            failures.append(stop_name)
             failure_count += 1
-        percent = (i + 1) / total_bus_stops * 100
-        cache.set('geocoding_progress', percent)
+        previous_percent = percent
+        percent = (i + 1) / total_pending * GEOCODING_PROGRESS_SHARE
+        if job:
+            # Publish whole-percent steps and batches of located stops, not every stop
+            if len(partial_batch) >= PARTIAL_RESULT_BATCH_SIZE or i + 1 == total_pending:
+                if partial_batch:
+                    job.partial({'geocoded_stops': partial_batch})
+                partial_batch = []
+            if int(percent) != int(previous_percent) or i + 1 == total_pending:
+                job.progress(percent, f"Geocoded {i + 1} of {total_pending} new stops")
         # Update progress bar
-        print_progress_bar(i + 1, len(bus_stops_data))
+        print_progress_bar(i + 1, total_pending)
+
+    if new_coordinates:
+        geocoded = bus_stops_df["stop_name"].isin(new_coordinates.keys())
+        bus_stops_df.loc[geocoded, "latitude"] = bus_stops_df.loc[geocoded, "stop_name"].map(lambda name: new_coordinates[name][0])
+        bus_stops_df.loc[geocoded, "longitude"] = bus_stops_df.loc[geocoded, "stop_name"].map(lambda name: new_coordinates[name][1])
 
     # Save results
     save_geocoded_data(cached_data)
@@ -262,101 +324,107 @@ def generate_bus_stop_map(request):
     # Print summary
     print(f"\nGeocoding Successes: {success_count}")
     print(f"Geocoding Failures: {failure_count}")
+    if deferred_count:
+        print(f"Geocoding deferred to later builds: {deferred_count} stops (MAP_GEOCODE_PER_RUN={MAX_GEOCODE_PER_RUN})")
     if failures:
         print("Failed to geocode the following bus stops:")
         print(failures)
-  
-
-    stops_with_coords = [stop for stop in bus_stops_data if 'latitude' in stop and 'longitude' in stop and stop["latitude"] is not None and stop["longitude"] is not None]
-
-    # Convert to Pandas DataFrame for easier handling with Folium
-    stops_df = pd.DataFrame(stops_with_coords)
-
-    # Initialize a Folium map centered around an average location
-    map_center = [8.4869, 76.9529]
-    m = folium.Map(location=map_center, tiles="OpenStreetMap", zoom_start=13, min_zoom=8, max_zoom=18)
-
-    # Logarithmic transformation of passenger counts for better contrast in markers
-    stops_df['log_passenger_count'] = np.log1p(stops_df['passenger_count'])
-    # print(stops_df)
-    # Prepare data for HeatMap using actual passenger counts for intensity
-    heat_data = []
-    for _, row in stops_df.iterrows():
-        heat_data.append([row["latitude"], row["longitude"],  row["passenger_count"]])  # Using actual count for heatmap
-
-    # Create the HeatMap layer with adjusted visual settings
-    HeatMap(
-        heat_data,
-        min_opacity=0.3,  # Set minimum opacity for better visibility (not too faint)
-        max_opacity=0.7,  # Set maximum opacity for a more subtle heatmap
-        radius=22,        # Adjust radius size to balance between clarity and overlap
-        blur=18,          # Moderate blur to avoid excessive smoothing
-        gradient={        # Reduced 5-color gradient scale for better distinction
-            0.2: 'blue',   # Low density -> blue
-            0.4: 'green',  # Medium-low density -> green
-            0.6: 'yellow', # Medium-high density -> yellow
-            0.8: 'orange', # High density -> orange
-            1.0: 'red',    # Very high density -> red
-        }
-    ).add_to(m)
-
-    # Create a MarkerCluster for the stops (useful for closely spaced stops)
-    marker_cluster = MarkerCluster().add_to(m)
-
-    # Define color mapping for passenger counts (using log-transformed values for marker colors)
-    def get_marker_color(log_count):
-        if log_count < 3.1:   # 0 to 20 passengers
-            return 'blue'      # Low density -> blue
-        elif log_count < 5.8:  # 21 to 500 passengers
-            return 'green'     # Medium density -> green
-        elif log_count < 6.9:  # 501 to 1000 passengers
-            return 'orange'    # High density -> orange
-        else:                  # 1000+ passengers
-            return 'red'       # Very high density -> red
-
-
-    # Add popups and clustered markers for bus stops with their name and transformed passenger count
-    for _, row in stops_df.iterrows():
-        # Get the color based on the transformed passenger count
-        color = get_marker_color(row['log_passenger_count'])
-
-        marker = folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=f"<b>{row['stop_name']}</b><br>Average Passenger count: {row['passenger_count']:.2f}",
-            tooltip=row["stop_name"],
-            icon=Icon(color=color, icon="fa-users", prefix="fa"),  # Apply color dynamically
-        )
-        marker.add_to(marker_cluster)  # Add to MarkerCluster for better organization
-
-    # Create a legend HTML for color decoding (simplified and smaller)
-    legend_html = f'''
-        <div style="position: fixed;
-                    bottom: 50px; left: 30px; width: 250px; height: 160px;
-                    background-color: white; border: 2px solid grey; padding: 10px;
-                    z-index: 9999; font-size: 10px; border-radius: 8px;">
-
-            <b>Passenger Density Heat Map </b><br>
-            <b>Time Range: {start_time}:00 HRS - {end_time}:00 HRS </b> <br>
-            <b>Month:{month}</b> <br>
-            <i style="background: blue; width: 20px; height: 20px; display: inline-block;"></i> Low Density (0 - 20 passengers)<br>
-            <i style="background: green; width: 20px; height: 20px; display: inline-block;"></i> Medium Density (21 - 500 passengers)<br>
-            <i style="background: orange; width: 20px; height: 20px; display: inline-block;"></i> High Density (501 - 1000 passengers)<br>
-            <i style="background: red; width: 20px; height: 20px; display: inline-block;"></i> Very High Density (1000+ passengers)<br>
-        </div>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-    # Generate HTML for the map
-    map_html = m._repr_html_()
-
-    data = stops_df.to_dict(orient='records')  # Data is a list of dictionaries
-    #remove all latitude and longitude and log_passenger_count
-    j = {}
-    for d in data:
-        j[d['stop_name']] = int(d['passenger_count'])
-
-    print(j)
+
+
+    stops_df = bus_stops_df.dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+    if job:
+        job.progress(GEOCODING_PROGRESS_SHARE, f"Rendering map for {len(stops_df)} stops")
+
+    # Aggregate passenger counts into grid cells once per zoom band, so the
+    # browser only receives one feature per occupied cell.
+    zoom_layers = build_zoom_layers(stops_df)
+    print(f"Binned {len(stops_df)} stops into " + ", ".join(
+        f"{len(binned)} cells (zoom {min_zoom}-{max_zoom})" for min_zoom, max_zoom, binned in zoom_layers
+    ))
+
+    # One FeatureCollection for all bands; each cell says which zooms show it.
+    # Colour and radius are precomputed per cell in bins_to_geojson.
+    features = []
+    for min_zoom, max_zoom, binned in zoom_layers:
+        for feature in bins_to_geojson(binned)['features']:
+            feature['properties']['min_zoom'] = min_zoom
+            feature['properties']['max_zoom'] = max_zoom
+            features.append(feature)
+
+    # Heat layer from the finest cells, using actual counts for intensity
+    finest_cells = zoom_layers[-1][2]
+    heat_data = finest_cells[["latitude", "longitude", "passenger_count"]].to_numpy(dtype=float).round(5).tolist()
+    geojson = {'type': 'FeatureCollection', 'features': features, 'heat': heat_data}
+
+    # The chatbot prompt only needs the busiest stops, not the whole network
+    top_stops = stops_df.head(CHAT_CONTEXT_STOP_LIMIT)
+    j = dict(zip(top_stops["stop_name"], top_stops["passenger_count"].astype(int).tolist()))
+
+    print(f"Sending {len(j)} stops to the chat context")
+    summary = {
+        'mapped_stops': len(stops_df),
+        'geocoding_successes': success_count,
+        'geocoding_failures': failure_count,
+        'pending_stops': deferred_count,
+    }
+    result = {
+        'geojson': geojson,
+        'month': month,
+        'start_time': start_time,
+        'end_time': end_time,
+        'data': json.dumps(j),
+    }
+    return result, summary
+
+
+@gzip_page
+def generate_bus_stop_map(request):
+    result, _ = build_bus_stop_map(**parse_map_params(request))
     # Return the map within a Django template or directly in response
-    return render(request, 'passenger_distribution/map_template.html', {'map_html': map_html,'data':json.dumps(j)})
+    return render(request, 'passenger_distribution/map_template.html', result)
+
+
+def start_bus_stop_map(request):
+    """Start a map build in the background and return the job id and its URLs"""
+    try:
+        params = parse_map_params(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters. Days and hours are integers.'}, status=400)
+
+    job = start_job(params, build_bus_stop_map)
+    return JsonResponse({
+        'job_id': job.job_id,
+        'events_url': reverse('bus_stop_map_events', args=[job.job_id]),
+        'result_url': reverse('bus_stop_map_result', args=[job.job_id]),
+    }, status=202)
+
+
+def bus_stop_map_events(request, job_id):
+    """Server-Sent Events stream of one job's progress, partial results and completion"""
+    if get_job_state(job_id) is None:
+        return JsonResponse({'error': 'Unknown or expired job'}, status=404)
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+
+    response = StreamingHttpResponse(stream_job_events(job_id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+
+@gzip_page
+def bus_stop_map_result(request, job_id):
+    state = get_job_state(job_id)
+    if state is None:
+        return JsonResponse({'error': 'Unknown or expired job'}, status=404)
+    if state['status'] != STATUS_COMPLETE:
+        return JsonResponse({'status': state['status'], 'progress': state['progress'], 'error': state['error']}, status=409)
+    result = get_job_result(job_id)
+    if result is None:
+        return JsonResponse({'error': 'Map has expired, please generate it again'}, status=404)
+    return render(request, 'passenger_distribution/map_template.html', result)
 
 
 def print_progress_bar(iteration, total, length=50):
@@ -369,5 +437,140 @@ def print_progress_bar(iteration, total, length=50):
     sys.stdout.flush()
 
 def get_geocoding_progress(request):
-    progress = round(cache.get('geocoding_progress', 0), 2)
-    return JsonResponse({"progress": progress})
\ No newline at end of file
+    """Polling fallback for clients without EventSource: progress of ?job=<id>"""
+    state = get_job_state(request.GET.get('job', ''))
+    if state is None:
+        return JsonResponse({'error': 'Unknown or expired job'}, status=404)
+    return JsonResponse({'progress': state['progress'], 'status': state['status'], 'message': state['message']})
+
+def od_flows_api(request):
+    """
+    Origin-destination flows from the precomputed OD matrix store.
+
+    Query parameters: start_date/end_date (YYYY-MM-DD) or `month` (a month
+    name, for its latest occurrence in the store), start_hour/end_hour,
+    limit, and optionally `stop` (+ `direction` from|to|both) for flows
+    touching one stop, or `corridor` (comma-separated stop names, + `directional=1`
+    to count only forward trips along the given order) for a corridor total.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
+
+    try:
+        window = {
+            'start_date': request.GET.get('start_date') or None,
+            'end_date': request.GET.get('end_date') or None,
+            'start_hour': int(request.GET['start_hour']) if request.GET.get('start_hour') else None,
+            'end_hour': int(request.GET['end_hour']) if request.GET.get('end_hour') else None,
+        }
+        for key in ('start_date', 'end_date'):
+            if window[key]:
+                datetime.strptime(window[key], '%Y-%m-%d')
+        limit = min(int(request.GET.get('limit', 20)), 500)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters. Dates use YYYY-MM-DD, hours and limit are integers.'}, status=400)
+
+    try:
+        store = get_od_store()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'OD matrix has not been built yet. Run manage.py build_od_matrix.'}, status=503)
+
+    month = request.GET.get('month', '').strip()
+    if month and not (window['start_date'] or window['end_date']):
+        try:
+            month_number = datetime.strptime(month, '%B').month
+        except ValueError:
+            return JsonResponse({'error': f'Unknown month: {month}'}, status=400)
+        dates = store.month_range(month_number)
+        if dates is None:
+            return JsonResponse({'error': f'No OD data for {month}'}, status=404)
+        window['start_date'], window['end_date'] = dates
+
+    stop = request.GET.get('stop', '').strip()
+    corridor = [name.strip() for name in request.GET.get('corridor', '').split(',') if name.strip()]
+    response = {'window': window}
+
+    if stop:
+        direction = request.GET.get('direction', 'both')
+        if direction not in ('from', 'to', 'both'):
+            return JsonResponse({'error': 'direction must be one of from, to, both'}, status=400)
+        if stop not in store.stop_index:
+            return JsonResponse({'error': f'Unknown stop: {stop}'}, status=404)
+        response['stop'] = stop
+        response['direction'] = direction
+        response['flows'] = store.stop_flows(stop, direction=direction, k=limit, **window)
+    elif corridor:
+        directional = request.GET.get('directional') in ('1', 'true')
+        response['corridor'] = corridor
+        response['unknown_stops'] = [name for name in corridor if name not in store.stop_index]
+        response['directional'] = directional
+        response['total_passengers'] = store.corridor_total(corridor, directional=directional, **window)
+    else:
+        response['flows'] = store.top_flows(k=limit, **window)
+
+    return JsonResponse(response)
+
+
+def passenger_comparison_api(request):
+    """
+    Per-stop average daily passengers for several months side by side.
+
+    Query parameters: `months` (comma-separated YYYY-MM, first one is the
+    baseline) or `month` (1-12) with `years` for a year-over-year view,
+    start_time/end_time (hours, default whole day), optional `stops`
+    (comma-separated names), `sort` (change|passengers|stop) and `limit`.
+    Served from the store written by manage.py build_monthly_aggregates.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
+
+    try:
+        if request.GET.get('month') and request.GET.get('years'):
+            month_number = int(request.GET['month'])
+            years = [int(year) for year in request.GET['years'].split(',') if year.strip()]
+            months = [f"{year:04d}-{month_number:02d}" for year in years]
+        else:
+            months = [month.strip() for month in request.GET.get('months', '').split(',') if month.strip()]
+        for month in months:
+            datetime.strptime(month, '%Y-%m')
+        start_time = int(request.GET.get('start_time', 0))
+        end_time = int(request.GET.get('end_time', 23))
+        limit = min(int(request.GET.get('limit', 100)), 5000)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters. Months use YYYY-MM, hours and limit are integers.'}, status=400)
+
+    sort = request.GET.get('sort', 'change')
+    if len(months) < 2:
+        return JsonResponse({'error': 'Select at least two months to compare'}, status=400)
+    if not 0 <= start_time <= end_time <= 23:
+        return JsonResponse({'error': 'Hours must satisfy 0 <= start_time <= end_time <= 23'}, status=400)
+    if sort not in ('change', 'passengers', 'stop'):
+        return JsonResponse({'error': 'sort must be one of change, passengers, stop'}, status=400)
+
+    try:
+        store = get_monthly_store()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Monthly aggregates have not been built yet. Run manage.py build_monthly_aggregates.'}, status=503)
+
+    missing = [month for month in months if month not in store.month_index]
+    if missing:
+        return JsonResponse({'error': f"No aggregates for: {', '.join(missing)}", 'available_months': store.months}, status=404)
+
+    stops = [name.strip() for name in request.GET.get('stops', '').split(',') if name.strip()]
+    rows, day_counts = store.compare(
+        months,
+        start_hour=start_time,
+        end_hour=end_time,
+        stops=stops or None,
+        min_average=MIN_AVG_THRESHOLD,
+        limit=limit,
+        sort=sort,
+    )
+    return JsonResponse({
+        'months': months,
+        'baseline': months[0],
+        'start_time': start_time,
+        'end_time': end_time,
+        'days': day_counts,
+        'stops': rows,
+    })
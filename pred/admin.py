@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import StopForecast
+
+
+@admin.register(StopForecast)
+class StopForecastAdmin(admin.ModelAdmin):
+    list_display = ('stop_name', 'forecast_date', 'model_version', 'backend', 'total_demand', 'created_at')
+    list_filter = ('forecast_date', 'model_version', 'backend')
+    search_fields = ('stop_name',)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PredConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pred'
+
+    def ready(self):
+        # Opt-in (FORECAST_WARMUP) so management commands and tests do not load models on startup
+        from .registry import warm_up_from_env
+        warm_up_from_env()
@@ -0,0 +1,197 @@
+"""
+Pluggable forecasting backends.
+
+Every backend loads an engine with the same interface as
+inference.ForecastEngine: `window`, `horizon` and
+`forecast_normalized(windows) -> (stops, horizon)`. That way the view,
+precompute_forecasts and backtesting do not care which one is active.
+
+    numpy           the trained LSTM evaluated with NumPy from weights exported
+                    by manage.py export_numpy_model (<version>.npz). Default.
+    keras           the original .keras model run by TensorFlow (optional
+                    dependency; import cost and memory are only paid here)
+    seasonal_naive  no model: tomorrow repeats the last 24 hours
+
+Pick one with the FORECAST_BACKEND environment variable.
+"""
+import json
+import os
+
+import numpy as np
+
+from .inference import FORECAST_HOURS, INPUT_HOURS
+
+DEFAULT_BACKEND = os.getenv('FORECAST_BACKEND', 'numpy')
+
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)  # Overflow-free form of 1 / (1 + exp(-x))
+
+
+ACTIVATIONS = {
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'relu': lambda x: np.maximum(x, 0),
+    'linear': lambda x: x,
+}
+
+
+def lstm(inputs, kernel, recurrent_kernel, bias, activation='tanh', recurrent_activation='sigmoid',
+         return_sequences=False, go_backwards=False):
+    """
+    Keras-compatible LSTM over (batch, time, features) inputs.
+
+    Gates are packed i, f, c, o like Keras. The input projection for all
+    timesteps is one matmul; only the recurrent part runs per timestep.
+    """
+    activation = ACTIVATIONS[activation]
+    recurrent_activation = ACTIVATIONS[recurrent_activation]
+    if go_backwards:
+        inputs = inputs[:, ::-1]
+    batch, steps, _ = inputs.shape
+    units = recurrent_kernel.shape[0]
+
+    # As one 2-D matmul; NumPy runs stacked 3-D matmuls one batch row at a time
+    projected = (inputs.reshape(batch * steps, -1) @ kernel + bias).reshape(batch, steps, -1)
+    h = np.zeros((batch, units), dtype=inputs.dtype)
+    c = np.zeros((batch, units), dtype=inputs.dtype)
+    outputs = np.empty((batch, steps, units), dtype=inputs.dtype) if return_sequences else None
+    for t in range(steps):
+        z = projected[:, t] + h @ recurrent_kernel
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        h = recurrent_activation(z[:, 3 * units:]) * activation(c)
+        if return_sequences:
+            outputs[:, t] = h
+    return outputs if return_sequences else h
+
+
+class NumpyModel:
+    """Sequential stack of LSTM, Bidirectional(LSTM) and Dense layers from an exported .npz"""
+
+    def __init__(self, layers, weights):
+        self.layers = layers
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            layers = json.loads(str(data['config']))
+            weights = {key: data[key].astype(np.float32) for key in data.files if key != 'config'}
+        return cls(layers, weights)
+
+    def _lstm(self, x, prefix, config, go_backwards=False):
+        return lstm(
+            x,
+            self.weights[f'{prefix}/kernel'],
+            self.weights[f'{prefix}/recurrent_kernel'],
+            self.weights[f'{prefix}/bias'],
+            activation=config['activation'],
+            recurrent_activation=config['recurrent_activation'],
+            return_sequences=config['return_sequences'],
+            go_backwards=go_backwards,
+        )
+
+    def __call__(self, x):
+        for index, layer in enumerate(self.layers):
+            prefix = f'layer{index}'
+            if layer['type'] == 'lstm':
+                x = self._lstm(x, prefix, layer)
+            elif layer['type'] == 'bidirectional_lstm':
+                forward = self._lstm(x, f'{prefix}/forward', layer)
+                backward = self._lstm(x, f'{prefix}/backward', layer, go_backwards=True)
+                if layer['return_sequences']:
+                    backward = backward[:, ::-1]  # Keras re-aligns the backward sequence in time
+                x = np.concatenate([forward, backward], axis=-1)
+            elif layer['type'] == 'dense':
+                x = ACTIVATIONS[layer['activation']](x @ self.weights[f'{prefix}/kernel'] + self.weights[f'{prefix}/bias'])
+            else:
+                raise ValueError(f"Unsupported layer type {layer['type']!r}")
+        return x
+
+
+class NumpyEngine:
+    """Autoregressive 24-hour rollout of a NumpyModel over a batch of stops"""
+
+    def __init__(self, model, horizon=FORECAST_HOURS, window=INPUT_HOURS):
+        self.model = model
+        self.horizon = horizon
+        self.window = window
+
+    def forecast_normalized(self, windows):
+        windows = np.asarray(windows, dtype=np.float32).reshape(-1, self.window, 1).copy()
+        predictions = np.empty((len(windows), self.horizon), dtype=np.float32)
+        for step in range(self.horizon):
+            next_hour = self.model(windows)[:, 0]
+            predictions[:, step] = next_hour
+            # Slide the window in place: drop the oldest hour, append the prediction
+            windows[:, :-1] = windows[:, 1:]
+            windows[:, -1, 0] = next_hour
+        return predictions
+
+    def warm_up(self):
+        self.forecast_normalized(np.zeros((1, self.window), dtype=np.float32))
+
+
+class SeasonalNaiveEngine:
+    """Each forecast hour repeats the same hour of the input window (period 24)"""
+
+    def __init__(self, horizon=FORECAST_HOURS, window=INPUT_HOURS):
+        self.horizon = horizon
+        self.window = window
+
+    def forecast_normalized(self, windows):
+        windows = np.asarray(windows, dtype=np.float32).reshape(-1, self.window)
+        repeats = -(-self.horizon // self.window)
+        return np.tile(windows, repeats)[:, :self.horizon]
+
+    def warm_up(self):
+        pass
+
+
+class ForecastBackend:
+    """Loads engines of one kind; `extension` is the model file suffix (None if model-free)"""
+    name = None
+    extension = None
+
+    def load(self, path):
+        raise NotImplementedError
+
+
+class NumpyBackend(ForecastBackend):
+    name = 'numpy'
+    extension = '.npz'
+
+    def load(self, path):
+        return NumpyEngine(NumpyModel.load(path))
+
+
+class KerasBackend(ForecastBackend):
+    name = 'keras'
+    extension = '.keras'
+
+    def load(self, path):
+        # TensorFlow is only imported when this backend is selected
+        from tensorflow.keras.models import load_model
+        from .inference import ForecastEngine
+
+        return ForecastEngine(load_model(path))
+
+
+class SeasonalNaiveBackend(ForecastBackend):
+    name = 'seasonal_naive'
+
+    def load(self, path):
+        return SeasonalNaiveEngine()
+
+
+BACKENDS = {backend.name: backend for backend in (NumpyBackend(), KerasBackend(), SeasonalNaiveBackend())}
+
+
+def get_backend(name=None):
+    name = name or DEFAULT_BACKEND
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown forecast backend {name!r}; choose from {', '.join(BACKENDS)}")
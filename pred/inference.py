@@ -0,0 +1,104 @@
+"""
+Batched autoregressive rollout for the hourly demand models.
+
+The models predict the next hour from the previous 24 normalized hours. A
+24-hour forecast feeds each prediction back into the window. The helpers
+here scale many stops' histories at once and hand them to an engine from
+backends.py in a single batch. `ForecastEngine` is the engine of the
+optional keras backend: it compiles the whole rollout into one
+`tf.function` (a graph-level loop over a fixed-size window) instead of 24
+`model.predict` calls per stop.
+"""
+import numpy as np
+
+INPUT_HOURS = 24  # Models take the previous 24 hourly (normalized) counts
+FORECAST_HOURS = 24
+MAX_BATCH_SIZE = 2048  # Stops per compiled call; bounds LSTM activation memory
+
+
+class ForecastEngine:
+    def __init__(self, model, horizon=FORECAST_HOURS, window=INPUT_HOURS):
+        import tensorflow as tf
+
+        self.model = model
+        self.horizon = horizon
+        self.window = window
+
+        @tf.function(input_signature=[tf.TensorSpec([None, window, 1], tf.float32)])
+        def rollout(windows):
+            outputs = tf.TensorArray(tf.float32, size=horizon)
+            for step in tf.range(horizon):
+                prediction = tf.cast(model(windows, training=False), tf.float32)  # (batch, 1)
+                outputs = outputs.write(step, prediction[:, 0])
+                # Slide the window: drop the oldest hour, append the prediction
+                windows = tf.concat([windows[:, 1:, :], prediction[:, None, :]], axis=1)
+            return tf.transpose(outputs.stack())  # (batch, horizon)
+
+        self._rollout = rollout
+
+    def forecast_normalized(self, windows):
+        """(stops, window) normalized inputs -> (stops, horizon) normalized predictions"""
+        windows = np.asarray(windows, dtype=np.float32).reshape(-1, self.window, 1)
+        if len(windows) == 0:
+            return np.zeros((0, self.horizon), dtype=np.float32)
+        chunks = [
+            self._rollout(windows[start:start + MAX_BATCH_SIZE]).numpy()
+            for start in range(0, len(windows), MAX_BATCH_SIZE)
+        ]
+        return np.concatenate(chunks)
+
+    def warm_up(self):
+        """Trace the compiled rollout once"""
+        self.forecast_normalized(np.zeros((1, self.window), dtype=np.float32))
+
+
+def scale_windows(histories, window=INPUT_HOURS):
+    """
+    Min-max scale each stop's history on its own range, like a per-stop
+    MinMaxScaler, and left-pad short histories with zeros.
+
+    `histories` is a list of 1-D arrays of hourly counts (oldest first); only
+    the last `window` values of each are used. Returns (windows, minimums,
+    ranges) so predictions can be mapped back with `unscale`.
+    """
+    values = np.zeros((len(histories), window), dtype=np.float64)
+    valid = np.zeros((len(histories), window), dtype=bool)
+    for i, history in enumerate(histories):
+        history = np.asarray(history, dtype=np.float64)[-window:]
+        if history.size:
+            values[i, window - history.size:] = history
+            valid[i, window - history.size:] = True
+    return scale_window_matrix(values, valid)
+
+
+def scale_window_matrix(values, valid):
+    """
+    Vectorized form of scale_windows for (windows, hours) matrices, where
+    `valid` marks observed hours; unobserved hours become 0 after scaling.
+    """
+    low = np.where(valid, values, np.inf).min(axis=1)
+    high = np.where(valid, values, -np.inf).max(axis=1)
+    empty = ~valid.any(axis=1)
+    low[empty] = 0.0
+    high[empty] = 0.0
+    # MinMaxScaler keeps a scale of 1 for constant inputs
+    ranges = np.where(high > low, high - low, 1.0)
+    windows = np.where(valid, (values - low[:, None]) / ranges[:, None], 0.0).astype(np.float32)
+    return windows, low, ranges
+
+
+def unscale(predictions, minimums, ranges):
+    return predictions * ranges[:, None] + minimums[:, None]
+
+
+def forecast_histories(engine, histories):
+    """
+    Forecast the next `engine.horizon` hours for many stops in one batch.
+
+    `histories` maps stop name -> hourly counts before the forecast start.
+    Returns stop name -> array of predicted passenger counts.
+    """
+    names = list(histories)
+    windows, minimums, ranges = scale_windows([histories[name] for name in names], engine.window)
+    predictions = unscale(engine.forecast_normalized(windows), minimums, ranges)
+    return dict(zip(names, predictions))
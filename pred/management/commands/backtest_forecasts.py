@@ -0,0 +1,195 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from pred.backends import BACKENDS
+from pred.inference import INPUT_HOURS, FORECAST_HOURS, scale_window_matrix, unscale
+from pred.registry import ModelRegistry, ModelNotFound
+from pred.series import get_series_store, SERIES_DIR
+
+REPORT_FILE = 'pred/data/backtest_report.csv'
+BATCH_SIZE = 4096  # Windows per engine call
+
+
+def build_windows(series, origins, stop_names=None):
+    """
+    Rolling-origin backtest windows for every stop, without a per-window loop.
+
+    For each stop and origin hour the input is the last INPUT_HOURS rows
+    before the origin (as in production) and the target is the observed count
+    of each of the FORECAST_HOURS hours from the origin, 0 for hours without
+    data. Windows with no history or no observed target hour are dropped.
+    Returns (stop codes, origins, input values, input mask, targets).
+    """
+    stop_codes, window_origins, inputs, masks, targets = [], [], [], [], []
+    input_offsets = np.arange(-INPUT_HOURS, 0)
+    target_offsets = np.arange(FORECAST_HOURS)
+    names = series.stops.tolist() if stop_names is None else stop_names
+
+    for name in names:
+        code = series.stop_index.get(name)
+        if code is None:
+            continue
+        start, end = int(series.offsets[code]), int(series.offsets[code + 1])
+        hours = np.asarray(series.hours[start:end])
+        passengers = np.asarray(series.passengers[start:end], dtype=np.float64)
+        if len(hours) == 0:
+            continue
+
+        # Inputs: rows idx - 24 .. idx - 1 before each origin
+        positions = np.searchsorted(hours, origins, side='left')
+        input_index = positions[:, None] + input_offsets
+        input_mask = input_index >= 0
+        input_values = passengers[np.clip(input_index, 0, len(hours) - 1)] * input_mask
+
+        # Targets: exact hours origin .. origin + 23, missing hours count as 0
+        target_hours = origins[:, None] + target_offsets
+        target_index = np.clip(np.searchsorted(hours, target_hours, side='left'), 0, len(hours) - 1)
+        observed = hours[target_index] == target_hours
+        target_values = np.where(observed, passengers[target_index], 0.0)
+
+        keep = input_mask.any(axis=1) & observed.any(axis=1)
+        if not keep.any():
+            continue
+        stop_codes.append(np.full(keep.sum(), code))
+        window_origins.append(origins[keep])
+        inputs.append(input_values[keep])
+        masks.append(input_mask[keep])
+        targets.append(target_values[keep])
+
+    if not stop_codes:
+        return None
+    return (
+        np.concatenate(stop_codes),
+        np.concatenate(window_origins),
+        np.concatenate(inputs),
+        np.concatenate(masks),
+        np.concatenate(targets),
+    )
+
+
+def time_forecasts(engine, windows):
+    """Run all windows in batches; returns (predictions, seconds)"""
+    started = time.perf_counter()
+    predictions = np.concatenate([
+        engine.forecast_normalized(windows[start:start + BATCH_SIZE])
+        for start in range(0, len(windows), BATCH_SIZE)
+    ])
+    return predictions, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Rolling-origin backtest of the forecasting backends over every stop (MAE, MAPE and latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends',
+            type=str,
+            default='numpy,seasonal_naive',
+            help=f"Comma-separated backends to compare ({', '.join(BACKENDS)}; default: numpy,seasonal_naive)",
+        )
+        parser.add_argument('--model-version', type=str, default=None, help='Model version for model-based backends')
+        parser.add_argument('--start', type=str, help='First forecast origin date (YYYY-MM-DD). Default: --days before the end')
+        parser.add_argument('--end', type=str, help='Last forecast origin date (YYYY-MM-DD). Default: last day with data')
+        parser.add_argument('--days', type=int, default=14, help='Number of daily origins when --start is not given (default: 14)')
+        parser.add_argument('--origin-step', type=int, default=24, help='Hours between forecast origins (default: 24, midnight to midnight)')
+        parser.add_argument('--stops', type=str, help='Comma-separated stop names (default: every stop in the series store)')
+        parser.add_argument('--output', type=str, default=REPORT_FILE, help=f'Per-stop report CSV (default: {REPORT_FILE})')
+
+    def handle(self, *args, **options):
+        try:
+            series = get_series_store()
+        except FileNotFoundError:
+            raise CommandError(f'Series store not found in {SERIES_DIR}. Run manage.py build_stop_series first.')
+
+        try:
+            if options['end']:
+                end = np.datetime64(datetime.strptime(options['end'], '%Y-%m-%d'), 'h')
+            else:
+                # The last origin still needs a full day of targets after it
+                end = np.asarray(series.hours).max().astype('datetime64[h]').astype('datetime64[D]').astype('datetime64[h]') - FORECAST_HOURS
+            if options['start']:
+                start = np.datetime64(datetime.strptime(options['start'], '%Y-%m-%d'), 'h')
+            else:
+                start = end - (options['days'] - 1) * 24
+        except ValueError:
+            raise CommandError('--start and --end must use YYYY-MM-DD')
+        origins = np.arange(start, end + 1, options['origin_step']).astype(np.int64)
+        if len(origins) == 0:
+            raise CommandError('No forecast origins in the selected range')
+
+        stop_names = [name.strip() for name in options['stops'].split(',')] if options['stops'] else None
+        started = time.perf_counter()
+        windows = build_windows(series, origins, stop_names)
+        if windows is None:
+            raise CommandError('No stop has both history and observed targets in the selected range')
+        stop_codes, _, values, valid, targets = windows
+        scaled, minimums, ranges = scale_window_matrix(values, valid)
+        self.stdout.write(
+            f"Built {len(scaled)} windows for {len(np.unique(stop_codes))} stops and {len(origins)} origins "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        # Per-stop error sums via bincount on the stop code of each window
+        codes, stop_position = np.unique(stop_codes, return_inverse=True)
+        window_counts = np.bincount(stop_position)
+        positive = targets > 0
+        rows = []
+        for backend_name in [name.strip() for name in options['backends'].split(',') if name.strip()]:
+            try:
+                registry = ModelRegistry(backend=backend_name)
+                loaded = registry.get_loaded(options['model_version'] if registry.backend.extension else None)
+                engine = loaded.engine
+                engine.warm_up()
+            except (ValueError, ModelNotFound, ImportError) as e:
+                self.stdout.write(self.style.WARNING(f'Skipping {backend_name}: {e}'))
+                continue
+
+            predictions, seconds = time_forecasts(engine, scaled)
+            predictions = unscale(predictions, minimums, ranges)
+
+            # Latency of a single on-demand forecast (one window), best of a few runs
+            single_runs = []
+            for i in range(min(5, len(scaled))):
+                single_started = time.perf_counter()
+                engine.forecast_normalized(scaled[i:i + 1])
+                single_runs.append(time.perf_counter() - single_started)
+            single_ms = min(single_runs) * 1000
+
+            errors = np.abs(predictions - targets)
+            mae = np.bincount(stop_position, weights=errors.mean(axis=1)) / window_counts
+            percentage = np.where(positive, errors / np.where(positive, targets, 1), 0.0)
+            positive_hours = np.bincount(stop_position, weights=positive.sum(axis=1))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mape = np.bincount(stop_position, weights=percentage.sum(axis=1)) / positive_hours * 100
+
+            window_ms = seconds / len(scaled) * 1000
+            for code, stop_mae, stop_mape, count in zip(codes, mae, mape, window_counts):
+                rows.append({
+                    'stop_name': series.stops[code],
+                    'backend': backend_name,
+                    'model_version': loaded.version,
+                    'windows': int(count),
+                    'mae': round(float(stop_mae), 3),
+                    'mape': None if np.isnan(stop_mape) else round(float(stop_mape), 2),
+                    'batched_ms_per_window': round(window_ms, 3),
+                    'single_forecast_ms': round(single_ms, 3),
+                })
+
+            overall_mape = percentage.sum() / max(positive.sum(), 1) * 100
+            self.stdout.write(
+                f"{backend_name:>15}: MAE {errors.mean():.2f}  MAPE {overall_mape:.1f}%  "
+                f"{seconds:.1f}s for {len(scaled)} windows ({window_ms:.2f} ms/window batched, "
+                f"{single_ms:.1f} ms single)"
+            )
+
+        if not rows:
+            raise CommandError('No backend could be evaluated')
+
+        os.makedirs(os.path.dirname(options['output']) or '.', exist_ok=True)
+        pd.DataFrame(rows).to_csv(options['output'], index=False)
+        self.stdout.write(self.style.SUCCESS(f"Wrote per-stop accuracy and latency report to {options['output']}"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from pred.series import StopSeriesStore, PRED_CSV_FILE, SERIES_DIR
+
+
+class Command(BaseCommand):
+    help = 'Convert the pred_to extract into the per-stop hourly series store used by the forecast'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            type=str,
+            default=PRED_CSV_FILE,
+            help=f'Extract with DATE_HOUR, TO_STOP_NAME, TOTAL_PASSENGER (default: {PRED_CSV_FILE})',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=SERIES_DIR,
+            help=f'Directory for the .npy arrays (default: {SERIES_DIR})',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            store = StopSeriesStore.from_csv(options['csv'])
+        except FileNotFoundError:
+            raise CommandError(f"Extract not found: {options['csv']}")
+
+        store.save(options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored {len(store.hours)} hourly rows for {len(store.stops)} stops in {options['output']} "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+        )
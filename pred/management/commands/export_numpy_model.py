@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from pred.backends import ACTIVATIONS
+from pred.registry import MODEL_DIR
+
+
+def lstm_config(config):
+    for key in ('activation', 'recurrent_activation'):
+        if config[key] not in ACTIVATIONS:
+            raise CommandError(f"Unsupported LSTM {key} {config[key]!r}")
+    if not config.get('use_bias', True) or config.get('go_backwards'):
+        raise CommandError(f"Unsupported LSTM options in layer {config['name']!r}")
+    return {
+        'activation': config['activation'],
+        'recurrent_activation': config['recurrent_activation'],
+        'return_sequences': config['return_sequences'],
+        'units': config['units'],
+    }
+
+
+def cell_weights(weights, path):
+    variables = weights[f'{path}/cell/vars']
+    return {
+        'kernel': variables['0'][()],
+        'recurrent_kernel': variables['1'][()],
+        'bias': variables['2'][()],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Export a .keras LSTM model to the .npz format used by the NumPy forecasting backend (no TensorFlow needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', default='joined', help='Model file stem under pred/models (default: joined)')
+        parser.add_argument('--model-dir', type=str, default=MODEL_DIR)
+
+    def handle(self, *args, **options):
+        try:
+            import h5py
+        except ImportError:
+            raise CommandError('h5py is required to read .keras weight files (pip install h5py)')
+
+        source = os.path.join(options['model_dir'], f"{options['version']}.keras")
+        target = os.path.join(options['model_dir'], f"{options['version']}.npz")
+        try:
+            archive = zipfile.ZipFile(source)
+        except FileNotFoundError:
+            raise CommandError(f'Model not found: {source}')
+
+        with archive:
+            config = json.loads(archive.read('config.json'))
+            weights_file = h5py.File(io.BytesIO(archive.read('model.weights.h5')), 'r')
+
+        if config['class_name'] != 'Sequential':
+            raise CommandError(f"Only Sequential models can be exported, got {config['class_name']}")
+
+        layers = []
+        arrays = {}
+        with weights_file:
+            for layer in config['config']['layers']:
+                class_name, layer_config = layer['class_name'], layer['config']
+                name = layer_config['name']
+                prefix = f'layer{len(layers)}'
+                if class_name == 'InputLayer':
+                    continue
+                elif class_name == 'Bidirectional':
+                    if layer_config['layer']['class_name'] != 'LSTM' or layer_config.get('merge_mode') != 'concat':
+                        raise CommandError(f'Only Bidirectional(LSTM) with concat merge is supported ({name})')
+                    layers.append(dict(lstm_config(layer_config['layer']['config']), type='bidirectional_lstm'))
+                    for direction in ('forward', 'backward'):
+                        for key, value in cell_weights(weights_file, f'layers/{name}/{direction}_layer').items():
+                            arrays[f'{prefix}/{direction}/{key}'] = value
+                elif class_name == 'LSTM':
+                    layers.append(dict(lstm_config(layer_config), type='lstm'))
+                    for key, value in cell_weights(weights_file, f'layers/{name}').items():
+                        arrays[f'{prefix}/{key}'] = value
+                elif class_name == 'Dense':
+                    if layer_config['activation'] not in ACTIVATIONS:
+                        raise CommandError(f"Unsupported Dense activation {layer_config['activation']!r}")
+                    layers.append({'type': 'dense', 'activation': layer_config['activation'], 'units': layer_config['units']})
+                    variables = weights_file[f'layers/{name}/vars']
+                    arrays[f'{prefix}/kernel'] = variables['0'][()]
+                    arrays[f'{prefix}/bias'] = variables['1'][()]
+                else:
+                    raise CommandError(f'Unsupported layer {class_name} ({name})')
+
+        np.savez(target, config=np.array(json.dumps(layers)), **{key: value.astype(np.float32) for key, value in arrays.items()})
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {len(layers)} layers ({sum(value.size for value in arrays.values())} weights) to {target}"
+            )
+        )
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from pred.inference import forecast_histories, INPUT_HOURS
+from pred.models import StopForecast
+from pred.registry import registry, ModelNotFound
+from pred.series import get_series_store, SERIES_DIR
+
+STOPS_FILE = 'pred/stops.json'
+
+
+class Command(BaseCommand):
+    help = 'Forecast the next day for every stop in pred/stops.json and store the results'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='First day to forecast (YYYY-MM-DD). Default: the day after the last hour in the series store',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            help='Number of consecutive days to forecast (default: 1)',
+        )
+        parser.add_argument(
+            '--model-version',
+            type=str,
+            default=None,
+            help=f'Model version to use (default: {registry.default_version})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            series = get_series_store()
+        except FileNotFoundError:
+            raise CommandError(f'Series store not found in {SERIES_DIR}. Run manage.py build_stop_series first.')
+
+        if options['date']:
+            try:
+                first_day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must use YYYY-MM-DD')
+        else:
+            last_hour = np.asarray(series.hours).max().astype('datetime64[h]')
+            first_day = pd.Timestamp(last_hour).date() + timedelta(days=1)
+
+        model_version = options['model_version'] or registry.default_version
+        try:
+            engine = registry.get_engine(model_version)
+        except ModelNotFound as e:
+            raise CommandError(str(e))
+
+        with open(STOPS_FILE, 'r') as f:
+            stops = json.load(f)
+
+        previous_day = {}
+        for offset in range(options['days']):
+            forecast_date = first_day + timedelta(days=offset)
+            started = time.perf_counter()
+            start_time = pd.Timestamp(forecast_date)
+
+            # Same input as demand_forecast: the last 24 rows before midnight
+            histories = {}
+            history_ends = {}
+            for stop in stops:
+                hours, passengers = series.window_before(stop, start_time, INPUT_HOURS)
+                if len(passengers):
+                    history_ends[stop] = timezone.make_aware(pd.Timestamp(hours[-1]).to_pydatetime())
+                # Days past the observed data continue from the previous day's forecast
+                observed_until = hours[-1] if len(hours) else None
+                if stop in previous_day and (observed_until is None or observed_until < np.datetime64(start_time - timedelta(days=1), 'h')):
+                    passengers = np.concatenate([passengers, previous_day[stop]])[-INPUT_HOURS:]
+                if len(passengers):
+                    histories[stop] = passengers
+
+            predictions = forecast_histories(engine, histories)
+            previous_day = predictions
+            forecasts = [
+                StopForecast(
+                    stop_name=stop,
+                    forecast_date=forecast_date,
+                    model_version=model_version,
+                    backend=registry.backend.name,
+                    hourly_demand=[round(float(value), 3) for value in values],
+                    total_demand=float(values.sum()),
+                    history_end=history_ends[stop],
+                )
+                for stop, values in predictions.items()
+            ]
+
+            with transaction.atomic():
+                StopForecast.objects.filter(
+                    forecast_date=forecast_date, model_version=model_version, backend=registry.backend.name,
+                ).delete()
+                StopForecast.objects.bulk_create(forecasts, batch_size=1000)
+
+            self.stdout.write(
+                f"{forecast_date}: forecast {len(forecasts)} of {len(stops)} stops "
+                f"({len(stops) - len(forecasts)} without history) in {time.perf_counter() - started:.1f}s"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Stored forecasts from {first_day} for {options['days']} day(s) with model {model_version} ({registry.backend.name})"))
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StopForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stop_name', models.CharField(max_length=100)),
+                ('forecast_date', models.DateField()),
+                ('model_version', models.CharField(max_length=100)),
+                ('hourly_demand', models.JSONField()),
+                ('total_demand', models.FloatField()),
+                ('history_end', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['forecast_date', 'model_version'], name='pred_stopfo_forecas_589799_idx')],
+                'unique_together': {('stop_name', 'forecast_date', 'model_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pred', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stopforecast',
+            name='pred_stopfo_forecas_589799_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='stopforecast',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='stopforecast',
+            name='backend',
+            field=models.CharField(default='', max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stopforecast',
+            unique_together={('stop_name', 'forecast_date', 'model_version', 'backend')},
+        ),
+        migrations.AddIndex(
+            model_name='stopforecast',
+            index=models.Index(fields=['forecast_date', 'model_version', 'backend'], name='pred_stopfo_forecas_f4d411_idx'),
+        ),
+    ]
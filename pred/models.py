@@ -1,3 +1,22 @@
 from django.db import models
 
-# Create your models here.
+
+class StopForecast(models.Model):
+    """Precomputed 24-hour demand forecast for one stop and day (manage.py precompute_forecasts)"""
+    stop_name = models.CharField(max_length=100)
+    forecast_date = models.DateField()
+    model_version = models.CharField(max_length=100)
+    backend = models.CharField(max_length=50, default='')  # FORECAST_BACKEND that ran it; '' for rows from before it was recorded
+    hourly_demand = models.JSONField()  # 24 predicted counts, hour 0 first
+    total_demand = models.FloatField()
+    history_end = models.DateTimeField(null=True)  # Last observed hour the forecast was based on
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('stop_name', 'forecast_date', 'model_version', 'backend'),)
+        indexes = [
+            models.Index(fields=['forecast_date', 'model_version', 'backend']),
+        ]
+
+    def __str__(self):
+        return f"{self.stop_name} {self.forecast_date} ({self.model_version}, {self.backend}): {self.total_demand:.0f}"
@@ -0,0 +1,130 @@
+"""
+Process-wide registry of forecast models.
+
+Models are loaded once per process and kept by version name (the file stem
+under pred/models, e.g. 'joined' for joined.npz), so several versions can be
+served side by side. Which file type is loaded, and what runs it, is decided
+by the forecasting backend (see backends.py, FORECAST_BACKEND). Loading is
+lazy and thread-safe; `warm_up` loads models up front and runs one dummy
+forecast. With FORECAST_WARMUP=1 the app config warms the registry on
+startup; combined with `gunicorn --preload` that happens once before the
+workers fork.
+"""
+import glob
+import os
+import threading
+import time
+
+from .backends import get_backend
+
+MODEL_DIR = 'pred/models'
+DEFAULT_MODEL_VERSION = os.getenv('FORECAST_MODEL_VERSION', 'joined')
+
+
+class ModelNotFound(Exception):
+    pass
+
+
+class LoadedModel:
+    """A backend engine together with where and when it was loaded from"""
+
+    def __init__(self, version, path, engine):
+        self.version = version
+        self.path = path
+        self.engine = engine
+        self.file_mtime = os.path.getmtime(path) if path else None
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {'version': self.version, 'path': self.path, 'file_mtime': self.file_mtime, 'loaded_at': self.loaded_at}
+
+
+class ModelRegistry:
+    def __init__(self, model_dir=MODEL_DIR, default_version=DEFAULT_MODEL_VERSION, backend=None):
+        self.model_dir = model_dir
+        self.backend = get_backend(backend)
+        # Model-free backends have a single version named after themselves
+        self.default_version = default_version if self.backend.extension else self.backend.name
+        self._models = {}
+        self._lock = threading.Lock()
+        self._version_locks = {}
+
+    def path_for(self, version):
+        if not self.backend.extension:
+            return None
+        return os.path.join(self.model_dir, f'{version}{self.backend.extension}')
+
+    def available_versions(self):
+        """Versions the active backend can serve, default first"""
+        if not self.backend.extension:
+            return [self.backend.name]
+        extension = self.backend.extension
+        versions = sorted(
+            os.path.basename(path)[:-len(extension)]
+            for path in glob.glob(os.path.join(self.model_dir, f'*{extension}'))
+        )
+        if self.default_version in versions:
+            versions.remove(self.default_version)
+            versions.insert(0, self.default_version)
+        return versions
+
+    def loaded_versions(self):
+        return {version: loaded.describe() for version, loaded in self._models.items()}
+
+    def _version_lock(self, version):
+        with self._lock:
+            return self._version_locks.setdefault(version, threading.Lock())
+
+    def _is_current(self, loaded, path):
+        return loaded is not None and (path is None or loaded.file_mtime == os.path.getmtime(path))
+
+    def get_loaded(self, version=None):
+        """LoadedModel for `version`, loading it on first use or after the file changed"""
+        version = version or self.default_version
+        path = self.path_for(version)
+        # Versions come from form input; only plain file stems are accepted
+        if os.path.basename(version) != version or version not in self.available_versions():
+            raise ModelNotFound(f'No model version {version!r} for the {self.backend.name} backend in {self.model_dir}')
+
+        loaded = self._models.get(version)
+        if self._is_current(loaded, path):
+            return loaded
+
+        # One loader per version; other versions stay available meanwhile
+        with self._version_lock(version):
+            loaded = self._models.get(version)
+            if not self._is_current(loaded, path):
+                started = time.perf_counter()
+                loaded = LoadedModel(version, path, self.backend.load(path))
+                self._models[version] = loaded
+                print(f"Loaded forecast model {version} ({self.backend.name}) in {time.perf_counter() - started:.2f}s")
+        return loaded
+
+    def get_engine(self, version=None):
+        """Batched forecaster for `version` (see backends.py for the interface)"""
+        return self.get_loaded(version).engine
+
+    def warm_up(self, versions=None):
+        """Load `versions` (default: the default version) and run one dummy forecast each"""
+        for version in versions or [self.default_version]:
+            try:
+                self.get_engine(version).warm_up()
+            except ModelNotFound as e:
+                print(f"Skipping warm-up: {e}")
+
+
+registry = ModelRegistry()
+
+
+def warm_up_from_env():
+    """FORECAST_WARMUP=1 warms the default model, a comma list warms those versions, 'all' every version"""
+    setting = os.getenv('FORECAST_WARMUP', '').strip()
+    if not setting or setting == '0':
+        return
+    if setting == 'all':
+        versions = registry.available_versions()
+    elif setting == '1':
+        versions = None
+    else:
+        versions = [version.strip() for version in setting.split(',') if version.strip()]
+    registry.warm_up(versions)
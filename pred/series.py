@@ -0,0 +1,172 @@
+"""
+Per-stop hourly passenger series for the forecast input window.
+
+The pred_to extract (DATE_HOUR, TO_STOP_NAME, TOTAL_PASSENGER) is converted
+once into flat .npy arrays sorted by (stop, hour). Each build writes a new
+version subdirectory and then points the `CURRENT` file at it, so the live
+version is always complete:
+
+    CURRENT         name of the live version subdirectory
+    <version>/
+
+      stops.npy       stop names, sorted
+      offsets.npy     offsets[i]:offsets[i + 1] is stop i's slice
+      hours.npy       hour timestamps as int64 hours since the epoch
+      passengers.npy  passenger count for that hour
+      meta.json
+
+The arrays are memory-mapped, so a worker only pages in the slices it reads,
+and the window before a timestamp is a dict lookup, one binary search inside
+the stop's slice and a slice copy, whatever the size of the extract.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+PRED_CSV_FILE = 'pred/data/airflow.csv'
+SERIES_DIR = 'pred/data/series'
+POINTER_FILE = 'CURRENT'
+
+
+def current_version(directory=SERIES_DIR):
+    """Live version subdirectory of a store ('' for a store written before versioning)"""
+    try:
+        with open(os.path.join(directory, POINTER_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        if os.path.exists(os.path.join(directory, 'meta.json')):
+            return ''
+        raise
+
+
+class StopSeriesStore:
+    def __init__(self, stops, offsets, hours, passengers):
+        self.stops = np.asarray(stops).astype(str)
+        self.offsets = offsets
+        self.hours = hours
+        self.passengers = passengers
+        self.stop_index = {name: i for i, name in enumerate(self.stops.tolist())}
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Build from DATE_HOUR ('YYYY-MM-DD HH'), TO_STOP_NAME, TOTAL_PASSENGER columns"""
+        hours = pd.to_datetime(df['DATE_HOUR'].astype(str).str[:13], format='%Y-%m-%d %H', errors='coerce')
+        frame = pd.DataFrame({
+            'stop': df['TO_STOP_NAME'],
+            'hour': hours.to_numpy().astype('datetime64[h]').astype(np.int64),
+            'passengers': pd.to_numeric(df['TOTAL_PASSENGER'], errors='coerce').fillna(0),
+        })[hours.notna().to_numpy() & df['TO_STOP_NAME'].notna().to_numpy()]
+
+        # One value per (stop, hour); duplicated hours in the extract are summed
+        frame = frame.groupby(['stop', 'hour'], sort=True)['passengers'].sum().reset_index()
+        codes, stops = pd.factorize(frame['stop'], sort=True)
+        offsets = np.searchsorted(codes, np.arange(len(stops) + 1)).astype(np.int64)
+        return cls(
+            np.asarray(stops),
+            offsets,
+            frame['hour'].to_numpy(dtype=np.int64),
+            frame['passengers'].to_numpy().astype(np.int32),
+        )
+
+    @classmethod
+    def from_csv(cls, path=PRED_CSV_FILE):
+        df = pd.read_csv(path, usecols=['DATE_HOUR', 'TO_STOP_NAME', 'TOTAL_PASSENGER'], dtype={'DATE_HOUR': str, 'TO_STOP_NAME': str})
+        return cls.from_dataframe(df)
+
+    def save(self, directory=SERIES_DIR):
+        """
+        Write a new version subdirectory, then swap the CURRENT pointer to it.
+
+        The pointer is replaced in one os.replace, so a reader opens either
+        the previous version or this one, never a missing or partial store.
+        The previous version is kept for readers that read the old pointer
+        just before the swap; older ones are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        try:
+            previous = current_version(directory)
+        except FileNotFoundError:
+            previous = None
+        version = f'v{time.time_ns()}'
+        target = os.path.join(directory, version)
+        os.makedirs(target)
+        np.save(os.path.join(target, 'stops.npy'), self.stops)
+        np.save(os.path.join(target, 'offsets.npy'), np.asarray(self.offsets))
+        np.save(os.path.join(target, 'hours.npy'), np.asarray(self.hours))
+        np.save(os.path.join(target, 'passengers.npy'), np.asarray(self.passengers))
+        with open(os.path.join(target, 'meta.json'), 'w') as f:
+            json.dump({'stops': len(self.stops), 'rows': int(len(self.hours))}, f)
+
+        staging = os.path.join(directory, f'{POINTER_FILE}.tmp')
+        with open(staging, 'w') as f:
+            f.write(version)
+        os.replace(staging, os.path.join(directory, POINTER_FILE))
+
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in (version, previous) and name.startswith('v') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory=SERIES_DIR, version=None):
+        if version is None:
+            version = current_version(directory)
+        directory = os.path.join(directory, version)
+        return cls(
+            np.load(os.path.join(directory, 'stops.npy')),
+            np.load(os.path.join(directory, 'offsets.npy')),
+            np.load(os.path.join(directory, 'hours.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'passengers.npy'), mmap_mode='r'),
+        )
+
+    def _stop_slice(self, stop_name):
+        i = self.stop_index.get(stop_name)
+        if i is None:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def window_before(self, stop_name, timestamp, length=24):
+        """
+        The last `length` hourly rows of a stop strictly before `timestamp`.
+
+        Returns (hours as datetime64[h], passengers) arrays, oldest first;
+        both are empty for unknown stops. Like the CSV filter it replaces,
+        this takes rows, so hours with no data are skipped rather than zeroed.
+        """
+        bounds = self._stop_slice(stop_name)
+        if bounds is None:
+            return np.array([], dtype='datetime64[h]'), np.array([], dtype=np.int32)
+        start, end = bounds
+        cutoff = np.datetime64(pd.Timestamp(timestamp).ceil('h').to_datetime64(), 'h').astype(np.int64)
+        stop_end = start + int(np.searchsorted(self.hours[start:end], cutoff, side='left'))
+        stop_start = max(start, stop_end - length)
+        return (
+            np.asarray(self.hours[stop_start:stop_end]).astype('datetime64[h]'),
+            np.asarray(self.passengers[stop_start:stop_end]),
+        )
+
+    def windows_before(self, stop_names, timestamp, length=24):
+        """Passenger windows for many stops at once: stop name -> passengers array"""
+        return {name: self.window_before(name, timestamp, length)[1] for name in stop_names}
+
+
+_store = None
+_store_version = None
+_store_lock = threading.Lock()
+
+
+def get_series_store(directory=SERIES_DIR):
+    """Process-wide store, reopened when the build command swaps in a new version"""
+    global _store, _store_version
+    version = current_version(directory)
+    if _store is None or version != _store_version:
+        with _store_lock:
+            if _store is None or version != _store_version:
+                _store = StopSeriesStore.load(directory, version)
+                _store_version = version
+    return _store
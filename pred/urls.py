@@ -3,4 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.demand_forecast, name='demand_forecast'),
+    path('api/forecast/', views.forecast_api, name='forecast_api'),
+    path('api/forecast/image/', views.forecast_image, name='forecast_image'),
+    path('api/stops/search/', views.stop_search_api, name='forecast_stop_search'),
 ]
@@ -1,127 +1,217 @@
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import load_model
-import glob
+import hashlib
+import io
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponse
-import io
-from django.core.files.base import ContentFile
-import base64
-import json
+from django.core.cache import cache
+from matplotlib.figure import Figure
+from .registry import registry, ModelNotFound
+from .series import get_series_store
+from bus_route.stop_search import StopSearchIndex, MAX_RESULTS as MAX_SEARCH_RESULTS
+from .models import StopForecast
+from .inference import forecast_histories, FORECAST_HOURS
+
+FORECAST_IMAGE_TTL = 6 * 60 * 60  # Rendered PNGs are cached per (stop, date, model version)
+
+
+class ForecastError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+    def as_dict(self):
+        return dict({"error": str(self)}, **self.extra)
+
+
 def demand_forecast(request):
     if request.method == "GET":
-        with open('pred/stops.json','r') as f:
-            stops = json.load(f)
-        return render(request, "forecast_form.html", {'stops': stops})
+        # Stop names are searched as the user types (stop_search_api)
+        return render(request, "forecast_form.html", {
+            'model_versions': registry.available_versions(),
+        })
     
     elif request.method == "POST":
         # user_from_stop = request.POST.get("from_stop_name")
         user_to_stop = request.POST.get("to_stop_name")
         user_date = request.POST.get("date")
+        model_version = request.POST.get("model_version") or None
 
-        csv_directory_path = 'pred/data/airflow.csv'
-
-        data_grouped_pandas = pd.read_csv(csv_directory_path)
-
-        # Filter data for the selected from and to stop
-        data_grouped_pandas = data_grouped_pandas[
-            # (data_grouped_pandas['FROM_STOP_NAME'] == user_from_stop) & 
-            (data_grouped_pandas['TO_STOP_NAME'] == user_to_stop)
-        ]
-        print(data_grouped_pandas.head())
-        # Ensure DATE_HOUR is parsed as a datetime column
-        data_grouped_pandas["DATE_HOUR"] = pd.to_datetime(
-            data_grouped_pandas["DATE_HOUR"], format="%Y-%m-%d %H", errors="coerce"
-        )
-
-        # Drop invalid rows
-        data_grouped_pandas = data_grouped_pandas.dropna(subset=["DATE_HOUR"]).sort_values(by="DATE_HOUR")
-        
         try:
-            prediction_start_time = pd.to_datetime(f"{user_date} 00:00")
-            prediction_end_time = pd.to_datetime(f"{user_date} 23:59")
-        except ValueError:
-            return JsonResponse({"error": "Invalid date format. Please use YYYY-MM-DD."})
+            forecast = get_forecast(user_to_stop, user_date, model_version)
+        except ForecastError as e:
+            return JsonResponse(e.as_dict())
 
-        # Filter data for the last 24 and 48 hours before prediction start time
-        data_filtered = data_grouped_pandas[data_grouped_pandas["DATE_HOUR"] < prediction_start_time].tail(24)
-        data_filtered_2days = data_grouped_pandas[data_grouped_pandas["DATE_HOUR"] < prediction_end_time].tail(48)
-
-        if data_filtered.empty:
-            return JsonResponse({"error": f"Not enough historical data available for {user_date}. Please select another date.","data_grouped_pandas":data_grouped_pandas.to_dict()})
-
-        # Check if there is at least one sample before applying MinMaxScaler
-        if len(data_filtered) == 0:
-            return JsonResponse({"error": "Insufficient data to make predictions.","data_grouped_pandas":data_grouped_pandas.to_dict()})
+        # The chart is drawn in the browser from the series; the PNG is only rendered on demand
+        return render(request, "forecast_results.html", {
+            "forecast": forecast,
+            "total_demand": forecast["total_demand"],
+            "hourly_demand": forecast["predicted"]["values"],
+            "model_version": forecast["model_version"],
+            "precomputed": forecast["precomputed"],
+        })
 
-        scaler = MinMaxScaler()
 
+def forecast_api(request):
+    """GET ?stop=&date=YYYY-MM-DD[&model_version=]: actual and predicted series as JSON"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
+    try:
+        forecast = get_forecast(request.GET.get('stop'), request.GET.get('date'), request.GET.get('model_version') or None)
+    except ForecastError as e:
+        return JsonResponse(e.as_dict(), status=e.status)
+    return JsonResponse(forecast)
+
+
+def stop_search_api(request):
+    """GET ?q=[&limit=]: stops with a forecastable series whose name matches q, typos allowed"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    try:
+        index = get_stop_search_index()
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Forecast series have not been built yet. Run manage.py build_stop_series.'}, status=503)
+    query = request.GET.get('q', '').strip()
+    return JsonResponse({'q': query, 'stops': index.search(query, limit=limit)})
+
+
+_stop_search = (None, None)  # (series store, index over its stop names)
+
+
+def get_stop_search_index():
+    """Search index over the series store's stops, rebuilt when the store is reopened"""
+    global _stop_search
+    series = get_series_store()
+    store, index = _stop_search
+    if store is not series:
+        index = StopSearchIndex(series.stops.tolist())
+        _stop_search = (series, index)
+    return index
+
+
+def forecast_image(request):
+    """Server-rendered PNG of the same forecast, for clients that cannot chart; cached per stop, date and version"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method is allowed'}, status=405)
+    stop = request.GET.get('stop')
+    date = request.GET.get('date')
+    model_version = request.GET.get('model_version') or registry.default_version
+
+    key = 'forecast_image:' + hashlib.md5(f"{stop}|{date}|{model_version}|{registry.backend.name}".encode()).hexdigest()
+    image = cache.get(key)
+    if image is None:
         try:
-            scaler.fit(data_filtered["TOTAL_PASSENGER"].values.reshape(-1, 1))
-        except ValueError:
-            return JsonResponse({"error": "Not enough data points to scale. Please try a different date."})
-
-        # Normalize data
-        data_filtered["TOTAL_PASSENGERS_NORMALIZED"] = scaler.transform(
-            data_filtered["TOTAL_PASSENGER"].values.reshape(-1, 1)
-        )
-
-        # Prepare input for the model
-        previous_24 = data_filtered["TOTAL_PASSENGERS_NORMALIZED"].values
-        if len(previous_24) < 24:
-            previous_24 = np.pad(previous_24, (24 - len(previous_24), 0), constant_values=0)
-
-        previous_24 = previous_24.reshape((1, 24, 1))
-
-        # Load the model
-        model_path = f'pred/models/joined.keras'
+            forecast = get_forecast(stop, date, model_version)
+        except ForecastError as e:
+            return JsonResponse(e.as_dict(), status=e.status)
+        image = render_forecast_png(forecast)
+        cache.set(key, image, FORECAST_IMAGE_TTL)
+
+    response = HttpResponse(image, content_type='image/png')
+    response['Cache-Control'] = f'max-age={FORECAST_IMAGE_TTL}'
+    return response
+
+
+def get_forecast(stop_name, date, model_version=None):
+    """
+    Actual demand of the 24 hours before `date` and the forecast for `date`.
+
+    Uses the nightly forecast (manage.py precompute_forecasts) when there is
+    one and runs the model otherwise. Raises ForecastError with a message
+    for the user.
+    """
+    if not stop_name or not date:
+        raise ForecastError("Both stop and date are required.")
+
+    # The window is read from the per-stop series store (manage.py build_stop_series)
+    try:
+        series = get_series_store()
+    except FileNotFoundError:
+        raise ForecastError("Forecast series have not been built yet. Run manage.py build_stop_series.", status=503)
+
+    try:
+        prediction_start_time = pd.to_datetime(f"{date} 00:00", format="%Y-%m-%d %H:%M")
+    except ValueError:
+        raise ForecastError("Invalid date format. Please use YYYY-MM-DD.")
+
+    # Last 24 hourly rows before prediction start time
+    actual_hours, actual_demand = series.window_before(stop_name, prediction_start_time, 24)
+
+    if len(actual_demand) == 0:
+        raise ForecastError(f"Not enough historical data available for {date}. Please select another date.", status=404)
+
+    model_version = model_version or registry.default_version
+    stored = StopForecast.objects.filter(
+        stop_name=stop_name,
+        forecast_date=prediction_start_time.date(),
+        model_version=model_version,
+        backend=registry.backend.name,  # The same version name under another backend is a different model
+    ).first()
+
+    if stored is not None:
+        predictions_actual = np.array(stored.hourly_demand)
+    else:
+        # Outside the precomputed horizon: run the model now
         try:
-            model = load_model(model_path)
+            predictions_actual = live_forecast(actual_demand, model_version)
+        except ModelNotFound as e:
+            raise ForecastError(str(e), status=404, available_versions=registry.available_versions())
+        except ValueError:
+            raise ForecastError("Not enough data points to scale. Please try a different date.")
         except Exception as e:
-            return JsonResponse({"error": f"Failed to load the model. Error: {str(e)}"})
-
-        # Predict demand
-        predictions = []
-        current_input = previous_24
-
-        for _ in range(24):
-            pred = model.predict(current_input, verbose=0)
-            predictions.append(pred[0][0])
-            current_input = np.append(current_input[:, 1:, :], pred.reshape(1, 1, 1), axis=1)
-
-        # Inverse normalization
-        predictions_actual = scaler.inverse_transform(np.array(predictions).reshape(-1, 1)).flatten()
-
-        # Create plot
-        plt.figure(figsize=(10, 6))
-        actual_demand = data_filtered["TOTAL_PASSENGER"].values
-        actual_2day_demand = data_filtered["TOTAL_PASSENGER"].values if not data_filtered.empty else []
-
-        if len(actual_2day_demand) < 24:
-            actual_2day_demand = [0] * (24 - len(actual_demand)) + list(actual_demand)
-
-        plt.plot(range(-24, 0), actual_demand, label="Actual Demand (Last 24 Hours)", marker='o', color='blue')
-        plt.plot(range(24), predictions_actual, label="Predicted Demand (Next 24 Hours)", marker='o', color='red')
-        plt.axvline(x=0, linestyle="--", color="gray", label="Prediction Start")
-        plt.xlabel("Hour")
-        plt.ylabel("Passenger Count")
-        plt.title(f"Demand Forecast for {user_date} and the Next 24 Hours")
-        plt.legend()
-        plt.grid()
-
-        # Save plot to a BytesIO object
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        buf.close()
-
-        return render(request, "forecast_results.html", {
-            "total_demand": sum(predictions_actual),
-            "hourly_demand": list(predictions_actual),
-            "image_base64": image_base64,
-        })
+            raise ForecastError(f"Failed to load the model. Error: {str(e)}", status=500)
+
+    predicted_hours = np.datetime64(prediction_start_time, 'h') + np.arange(FORECAST_HOURS)
+    return {
+        "stop": stop_name,
+        "date": prediction_start_time.date().isoformat(),
+        "model_version": model_version,
+        "precomputed": stored is not None,
+        "total_demand": float(np.sum(predictions_actual)),
+        "actual": {
+            "hours": [str(hour) for hour in actual_hours.astype('datetime64[h]')],
+            "values": [float(value) for value in actual_demand],
+        },
+        "predicted": {
+            "hours": [str(hour) for hour in predicted_hours],
+            "values": [float(value) for value in predictions_actual],
+        },
+    }
+
+
+def render_forecast_png(forecast):
+    """
+    PNG bytes of the forecast plot.
+
+    Uses a standalone Figure rather than pyplot, so nothing is registered in
+    pyplot's global figure list (which leaked one figure per request) and
+    concurrent requests in threaded workers do not share state.
+    """
+    actual = forecast["actual"]["values"]
+    predicted = forecast["predicted"]["values"]
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(range(-len(actual), 0), actual, label="Actual Demand (Last 24 Hours)", marker='o', color='blue')
+    ax.plot(range(len(predicted)), predicted, label="Predicted Demand (Next 24 Hours)", marker='o', color='red')
+    ax.axvline(x=0, linestyle="--", color="gray", label="Prediction Start")
+    ax.set_xlabel("Hour")
+    ax.set_ylabel("Passenger Count")
+    ax.set_title(f"Demand Forecast for {forecast['date']} and the Next 24 Hours")
+    ax.legend()
+    ax.grid()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def live_forecast(actual_demand, model_version):
+    """Scale the last 24 hours per stop, run the 24-hour rollout and unscale the result"""
+    # Models are loaded once per process by the registry, with the configured backend
+    engine = registry.get_engine(model_version)
+    return forecast_histories(engine, {'stop': actual_demand})['stop']
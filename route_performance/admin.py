@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import RoutePerformanceMetrics, RouteComparison, RoutePerformanceTrend
+from .models import RoutePerformanceMetrics, RouteComparison, RoutePerformanceTrend, RouteForecast
 
 @admin.register(RoutePerformanceMetrics)
 class RoutePerformanceMetricsAdmin(admin.ModelAdmin):
@@ -33,3 +33,12 @@ class RoutePerformanceTrendAdmin(admin.ModelAdmin):
     search_fields = ('route_no',)
     ordering = ('-date', '-epkm')
     readonly_fields = ('created_at',)
+
+
+@admin.register(RouteForecast)
+class RouteForecastAdmin(admin.ModelAdmin):
+    list_display = ('route_no', 'forecast_date', 'revenue', 'total_km', 'epkm', 'history_end')
+    list_filter = ('forecast_date', 'history_end')
+    search_fields = ('route_no',)
+    ordering = ('forecast_date', '-epkm')
+    readonly_fields = ('created_at',)
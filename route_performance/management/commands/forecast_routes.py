@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+import time
+
+import numpy as np
+
+from bus_route.models import Trip
+from route_performance.forecasting import forecast_routes, HISTORY_DAYS, FORECAST_HORIZON
+from route_performance.models import RouteForecast
+
+
+def money(value):
+    return None if not np.isfinite(value) else round(float(value), 2)
+
+
+class Command(BaseCommand):
+    help = 'Project daily revenue and EPKM of every route for the coming week in one vectorized pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--end-date',
+            type=str,
+            help='Last day of history in YYYY-MM-DD format (default: latest trip date)',
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=HISTORY_DAYS,
+            help=f'Days of history to fit on (default: {HISTORY_DAYS})',
+        )
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=FORECAST_HORIZON,
+            help=f'Days to project after the end date (default: {FORECAST_HORIZON})',
+        )
+
+    def handle(self, *args, **options):
+        if options['end_date']:
+            try:
+                end_date = timezone.datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--end-date must use YYYY-MM-DD')
+        else:
+            latest_trip = Trip.objects.filter(revenue__isnull=False).order_by('-date').first()
+            if latest_trip is None:
+                raise CommandError('No trips with revenue to forecast from')
+            end_date = latest_trip.date
+
+        started = time.perf_counter()
+        result = forecast_routes(end_date, options['history_days'], options['horizon'])
+        fitted = time.perf_counter() - started
+        if not result['routes']:
+            raise CommandError(f"No route has service in the {options['history_days']} days up to {end_date}")
+
+        dates = result['dates'].astype(object)  # datetime.date values
+        forecasts = [
+            RouteForecast(
+                route_no=route_no,
+                forecast_date=forecast_date,
+                revenue=money(result['revenue'][i, j]) or 0,
+                total_km=money(result['km'][i, j]) or 0,
+                epkm=money(result['epkm'][i, j]),
+                history_end=end_date,
+                history_days=int(result['history_days'][i]),
+            )
+            for i, route_no in enumerate(result['routes'])
+            for j, forecast_date in enumerate(dates)
+        ]
+
+        # Replace the projections for these days in one go
+        with transaction.atomic():
+            RouteForecast.objects.filter(forecast_date__range=[dates[0], dates[-1]]).delete()
+            RouteForecast.objects.bulk_create(forecasts, batch_size=2000)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Projected {len(result['routes'])} routes for {dates[0]} to {dates[-1]} "
+                f"(fitted in {fitted:.2f}s, {len(forecasts)} rows stored)"
+            )
+        )
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-19 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_performance', '0002_optimize_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route_no', models.CharField(max_length=20)),
+                ('forecast_date', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_km', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('epkm', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('history_end', models.DateField()),
+                ('history_days', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['forecast_date'], name='route_perfo_forecas_935f82_idx')],
+                'unique_together': {('route_no', 'forecast_date')},
+            },
+        ),
+    ]
@@ -194,3 +194,25 @@ class RoutePerformanceTrend(models.Model):
     
     def __str__(self):
         return f"Route {self.route_no} - {self.date}: EPKM {self.epkm}"
+
+class RouteForecast(models.Model):
+    """Projected daily revenue and EPKM of a route (manage.py forecast_routes)"""
+    
+    route_no = models.CharField(max_length=20)
+    forecast_date = models.DateField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    total_km = models.DecimalField(max_digits=10, decimal_places=2)
+    epkm = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    history_end = models.DateField()  # Last day of the history the projection was fitted on
+    history_days = models.IntegerField(default=0)  # Days with service in that history
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = (('route_no', 'forecast_date'),)
+        indexes = [
+            models.Index(fields=['forecast_date']),
+        ]
+    
+    def __str__(self):
+        return f"Route {self.route_no} - {self.forecast_date}: projected EPKM {self.epkm}"
@@ -14,6 +14,7 @@ urlpatterns = [
     path('api/underperformers/', views.UnderperformersAPIView.as_view(), name='api_underperformers'),
     path('api/comparison/', views.RouteComparisonAPIView.as_view(), name='api_comparison'),
     path('api/trends/', views.RouteTrendsAPIView.as_view(), name='api_trends'),
+    path('api/forecast/', views.RouteForecastAPIView.as_view(), name='api_forecast'),
     path('api/bulk-calculate/', views.BulkCalculateView.as_view(), name='api_bulk_calculate'),
     
     # Route detail
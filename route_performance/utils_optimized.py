@@ -139,4 +139,62 @@ class OptimizedRoutePerformanceCalculator:
                 'revenue_per_trip': round(float(row['total_revenue']) / int(row['trip_count']), 2) if int(row['trip_count']) > 0 else 0
             })
         
-        return route_performance
\ No newline at end of file
+        return route_performance
+
+    @staticmethod
+    def iter_route_epkm_data(route_no=None, start_date=None, end_date=None, chunk_size=500):
+        """
+        Per-route EPKM rows like RoutePerformanceCalculator.get_route_epkm_data,
+        from one grouped query read through a server-side cursor where the
+        database has one. Trips whose schedule has no trip_km still count
+        towards revenue and trip_count; avg_epkm averages the trips that have
+        one. Unlike get_route_epkm_data, `route_no` keeps only trips whose own
+        (schedule_no, trip_no) schedule row runs that route, not every trip of
+        a schedule that has the route somewhere in its day. The performance
+        API uses this for both its streamed and its buffered response.
+        """
+        from django.db import connection
+
+        if start_date is None:
+            start_date = date.today() - timedelta(days=30)
+        if end_date is None:
+            end_date = date.today()
+
+        sql = """
+        SELECT
+            s.route_no,
+            COUNT(t.id) as trip_count,
+            SUM(t.revenue) as total_revenue,
+            SUM(COALESCE(s.trip_km, 0)) as total_km,
+            COALESCE(AVG(CASE WHEN s.trip_km <> 0 THEN t.revenue / s.trip_km END), 0) as avg_epkm
+        FROM bus_route_trip t
+        JOIN bus_route_schedule s ON t.schedule_no = s.schedule_no AND t.trip_no = s.trip_no
+        WHERE t.date >= %s AND t.date <= %s AND t.revenue IS NOT NULL
+        """
+
+        params = [start_date, end_date]
+
+        if route_no:
+            sql += " AND s.route_no = %s"
+            params.append(route_no)
+
+        sql += """
+        GROUP BY s.route_no
+        ORDER BY avg_epkm DESC
+        """
+
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for route, trip_count, total_revenue, total_km, avg_epkm in rows:
+                    yield {
+                        'route_no': route,
+                        'avg_epkm': round(float(avg_epkm), 2),
+                        'total_revenue': float(total_revenue),
+                        'total_km': float(total_km),
+                        'trip_count': int(trip_count),
+                        'revenue_per_trip': round(float(total_revenue) / int(trip_count), 2) if int(trip_count) > 0 else 0
+                    }
@@ -3,20 +3,60 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.gzip import gzip_page
 from django.db.models import Avg, Sum, Count, Q
 from datetime import date, timedelta, datetime
+import itertools
 import json
 
-from .models import RoutePerformanceMetrics, RouteComparison, RoutePerformanceTrend
+from .models import RoutePerformanceMetrics, RouteComparison, RoutePerformanceTrend, RouteForecast
 from .utils import RoutePerformanceCalculator, RouteAnalyzer
 from .utils_optimized import OptimizedRoutePerformanceCalculator
 from bus_route.models import Trip, Schedule
+from bus_route.streaming import stream_format, streaming_json_response
 
+class EPKMBenchmarks:
+    """Benchmarks accumulated while route rows are streamed"""
+
+    def __init__(self):
+        self.total_routes = 0
+        self.total_revenue = 0
+        self.epkm_count = 0
+        self.epkm_sum = 0
+        self.max_epkm = None
+        self.min_epkm = None
+
+    def add(self, route):
+        self.total_routes += 1
+        self.total_revenue += route['total_revenue']
+        if route['avg_epkm']:
+            self.epkm_count += 1
+            self.epkm_sum += route['avg_epkm']
+            self.max_epkm = route['avg_epkm'] if self.max_epkm is None else max(self.max_epkm, route['avg_epkm'])
+            self.min_epkm = route['avg_epkm'] if self.min_epkm is None else min(self.min_epkm, route['avg_epkm'])
+        return route
+
+    def as_dict(self):
+        if not self.epkm_count:
+            return None
+        return {
+            'avg_epkm': round(self.epkm_sum / self.epkm_count, 2),
+            'max_epkm': self.max_epkm,
+            'min_epkm': self.min_epkm,
+            'total_routes': self.total_routes,
+            'total_revenue': self.total_revenue
+        }
+
+
+@method_decorator(gzip_page, name='dispatch')
 class RoutePerformanceAPIView(View):
     """API endpoints for route performance data"""
     
     def get(self, request):
-        """Get route performance overview"""
+        """
+        Get route performance overview. ?stream=ndjson or ?stream=json streams
+        the routes as they are read, with the benchmarks after them.
+        """
         try:
             # Get date range from request
             start_date = request.GET.get('start_date')
@@ -33,35 +73,40 @@ class RoutePerformanceAPIView(View):
             else:
                 end_date = date.today()
             
-            # Get performance data
-            performance_data = RoutePerformanceCalculator.get_route_epkm_data(
+            # One grouped query for both modes, so streamed and buffered results match
+            benchmarks = EPKMBenchmarks()
+            routes = (benchmarks.add(route) for route in OptimizedRoutePerformanceCalculator.iter_route_epkm_data(
                 route_no=route_no,
                 start_date=start_date,
                 end_date=end_date
-            )
-            
-            # Get benchmarks (simplified to avoid timeout)
-            benchmarks = None
-            if performance_data:
-                epkm_values = [route['avg_epkm'] for route in performance_data if route['avg_epkm']]
-                if epkm_values:
-                    benchmarks = {
-                        'avg_epkm': round(sum(epkm_values) / len(epkm_values), 2),
-                        'max_epkm': max(epkm_values),
-                        'min_epkm': min(epkm_values),
-                        'total_routes': len(performance_data),
-                        'total_revenue': sum(route['total_revenue'] for route in performance_data)
-                    }
-            
+            ))
+            date_range = {
+                'start': start_date.isoformat(),
+                'end': end_date.isoformat()
+            }
+
+            fmt = stream_format(request)
+            if fmt:
+                # Reading the first row runs the query here, so a database error
+                # still gets the JSON error response below. An error after the
+                # first chunk can only end the stream early.
+                first = next(routes, None)
+                return streaming_json_response(
+                    fmt,
+                    {'date_range': date_range},
+                    'routes',
+                    routes if first is None else itertools.chain([first], routes),
+                    tail=lambda: {'benchmarks': benchmarks.as_dict()},
+                    envelope=({'success': True}, 'data')
+                )
+
+            performance_data = list(routes)
             return JsonResponse({
                 'success': True,
                 'data': {
                     'routes': performance_data,
-                    'benchmarks': benchmarks,
-                    'date_range': {
-                        'start': start_date.isoformat(),
-                        'end': end_date.isoformat()
-                    }
+                    'benchmarks': benchmarks.as_dict(),
+                    'date_range': date_range
                 }
             })
             
@@ -235,6 +280,74 @@ class RouteTrendsAPIView(View):
                 'error': str(e)
             }, status=500)
 
+class RouteForecastAPIView(View):
+    """API for the stored next-week revenue and EPKM projections (manage.py forecast_routes)"""
+    
+    def get(self, request):
+        try:
+            route_no = request.GET.get('route_no')
+            limit = int(request.GET.get('limit', 20))
+            sort = request.GET.get('sort', 'epkm')
+            if sort not in ('epkm', 'revenue'):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'sort must be epkm or revenue'
+                }, status=400)
+            
+            latest = RouteForecast.objects.order_by('-history_end').values_list('history_end', flat=True).first()
+            if latest is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'No route forecasts yet. Run manage.py forecast_routes.'
+                }, status=404)
+            
+            forecasts = RouteForecast.objects.filter(history_end=latest).order_by('route_no', 'forecast_date')
+            if route_no:
+                forecasts = forecasts.filter(route_no=route_no)
+            
+            routes = {}
+            for row in forecasts.values_list('route_no', 'forecast_date', 'revenue', 'total_km', 'epkm'):
+                route, forecast_date, revenue, total_km, epkm = row
+                route_data = routes.setdefault(route, {
+                    'route_no': route,
+                    'total_revenue': 0.0,
+                    'total_km': 0.0,
+                    'daily': []
+                })
+                route_data['total_revenue'] += float(revenue)
+                route_data['total_km'] += float(total_km)
+                route_data['daily'].append({
+                    'date': forecast_date.isoformat(),
+                    'revenue': float(revenue),
+                    'epkm': float(epkm) if epkm is not None else None
+                })
+            
+            for route_data in routes.values():
+                route_data['avg_epkm'] = (
+                    round(route_data['total_revenue'] / route_data['total_km'], 2) if route_data['total_km'] else None
+                )
+                route_data['total_revenue'] = round(route_data['total_revenue'], 2)
+                route_data['total_km'] = round(route_data['total_km'], 2)
+            
+            key = 'avg_epkm' if sort == 'epkm' else 'total_revenue'
+            ranked = sorted(routes.values(), key=lambda r: r[key] or 0, reverse=True)
+            
+            return JsonResponse({
+                'success': True,
+                'data': {
+                    'history_end': latest.isoformat(),
+                    'routes': ranked[:limit],
+                    'total_routes': len(ranked),
+                    'projected_revenue': round(sum(r['total_revenue'] for r in ranked), 2)
+                }
+            })
+            
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
 class DashboardView(View):
     """Main dashboard view"""
     
@@ -111,6 +111,7 @@ function getUserLocation() {
             }
 
             var currentUserMarker = L.marker(userLatLng).addTo(map);
+            showNearbyStops(userLatLng);
 
             
            
@@ -134,5 +135,21 @@ function getUserLocation() {
         alert("Geolocation is not supported by this browser.");
     }
 }
+// Bus stops around the user, with the routes serving each
+let nearbyStopsLayer = L.layerGroup().addTo(map);
+function showNearbyStops(latLng) {
+    fetch(`/route/api/stops/nearby/?lat=${latLng.lat}&lon=${latLng.lng}&k=5&radius=1500`)
+        .then(response => response.json())
+        .then(data => {
+            nearbyStopsLayer.clearLayers();
+            (data.stops || []).forEach(stop => {
+                L.circleMarker([stop.latitude, stop.longitude], { radius: 6, color: '#1f77b4', fillOpacity: 0.8 })
+                    .bindPopup(`${stop.name} (${Math.round(stop.distance_m)} m)<br>Routes: ${stop.routes.join(', ')}`)
+                    .addTo(nearbyStopsLayer);
+            });
+        })
+        .catch(error => console.error('Error fetching nearby stops:', error));
+}
+
 getUserLocation();
 setInterval(() =>getUserLocation(), 90000);
\ No newline at end of file